@@ -20,6 +20,9 @@ Power: The power cost to play a face-up card is in the top-right corner of the c
 Shake hands at the end. Good luck!
 """
 
+# Sent as the system message of every call, unchanged, so it is a prefix the provider can cache across all calls
+SYSTEM_PROMPT = f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nEach request gives you the game as you see it and one task. Answer in the requested format.\n"
+
 class ProblemDescription(BaseModel):
     problem_description: str
 
@@ -36,24 +39,60 @@ class Thinker:
         self.llm = llm
         self.graph = graph
 
-    def describe_problem(self, gamestate_text, actions_text):
-        prompt = f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is the current game state:\n{gamestate_text}\n\nHere are your available actions:\n{actions_text}\nBased on the current game state and available actions, make a description of the problem you are facing. Don't focus on solutions, just describe the issue at hand.\n"
-        response = self.llm.invoke(prompt, response_format=ProblemDescription)
-        response = json.loads(response)
-        return response['problem_description']
+    # Each call has a prompt builder and a parser shared by the blocking and the async (a-prefixed) versions.
+    # Prompts are the fixed SYSTEM_PROMPT plus user content ordered from most to least shared, with the task last. Providers
+    # cache the longest prefix they have seen recently: recommend_action reuses the state and actions describe_problem
+    # just sent, and compare_expectation_vs_reality starts with the state describe_problem sent on the player's last turn.
+    def _describe_problem_prompt(self, gamestate_text, actions_text):
+        return f"Here is the game state:\n{gamestate_text}\n\nHere are the possible actions you can take, with their corresponding IDs:\n{actions_text}\n\nBased on the current game state and available actions, make a description of the problem you are facing. Don't focus on solutions, just describe the issue at hand.\n"
 
-    def recommend_action(self, gamestate_text, actions_text, similar_steps=None):
-        prompt = f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is the current game state:\n{gamestate_text}\n\nHere are the possible actions you can take, with their corresponding IDs:\n{actions_text}\n\nBased on the current game state and the possible actions, make a recommendation for the next action and explain your reasoning for such action. Finally, explain what you think will happen as a result of taking that action.\n\n"
+    def _recommend_action_prompt(self, gamestate_text, actions_text, similar_steps=None):
+        prompt = f"Here is the game state:\n{gamestate_text}\n\nHere are the possible actions you can take, with their corresponding IDs:\n{actions_text}\n\n"
         if similar_steps:
             prompt += "Here are some similar past situations you have encountered along with their solutions that might help inform your decision:\n"
             for i, step in enumerate(similar_steps):
                 prompt += f"\nMemory [{i+1}] - What happened: {step['problem_description']} | Solution: {step['reasoning_for_action']}\n"
-        response = self.llm.invoke(prompt, response_format=Recommendation)
+            prompt += "\n"
+        prompt += "Based on the current game state and the possible actions, make a recommendation for the next action and explain your reasoning for such action. Finally, explain what you think will happen as a result of taking that action.\n"
+        return prompt
+
+    def _compare_expectation_vs_reality_prompt(self, current_state, previous_state, expected_results):
+        return f"Here is the game state:\n{previous_state}\n\nThat was the game state before your last action. Here were your expectations for the results of that action:\n{expected_results}\n\nHere are the actual results that occurred after taking that action:\n{current_state}\n\nBased on this, analyze whether your expectations matched reality. This information will be used to improve your future decision-making. Respond with whether the action was verified (true/false).\n"
+
+    @staticmethod
+    def _parse_problem_description(response):
+        return json.loads(response)['problem_description']
+
+    @staticmethod
+    def _parse_recommendation(response):
         response = json.loads(response)
         return response['recommended_action_id'], response['reasoning_for_action'], response['expected_results']
 
+    @staticmethod
+    def _parse_actual_results(response):
+        return json.loads(response)['action_verified']
+
+    def describe_problem(self, gamestate_text, actions_text):
+        response = self.llm.invoke(self._describe_problem_prompt(gamestate_text, actions_text), response_format=ProblemDescription, system_prompt=SYSTEM_PROMPT)
+        return self._parse_problem_description(response)
+
+    def recommend_action(self, gamestate_text, actions_text, similar_steps=None):
+        response = self.llm.invoke(self._recommend_action_prompt(gamestate_text, actions_text, similar_steps), response_format=Recommendation, system_prompt=SYSTEM_PROMPT)
+        return self._parse_recommendation(response)
+
     def compare_expectation_vs_reality(self, current_state, previous_state, expected_results):
-        prompt = f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is was the previous game state:\n{previous_state}\nHere were your expectations for the results of your last action:\n{expected_results}\n\nHere are the actual results that occurred after taking that action:\n{current_state}\n\nBased on this, analyze whether your expectations matched reality. This information will be used to improve your future decision-making. Respond with whether the action was verified (true/false).\n"
-        response = self.llm.invoke(prompt, response_format=ActualResults)
-        response = json.loads(response)
-        return response['action_verified']
\ No newline at end of file
+        response = self.llm.invoke(self._compare_expectation_vs_reality_prompt(current_state, previous_state, expected_results), response_format=ActualResults, system_prompt=SYSTEM_PROMPT)
+        return self._parse_actual_results(response)
+
+    # Async versions: independent calls can be awaited together (asyncio.gather) so they overlap.
+    async def adescribe_problem(self, gamestate_text, actions_text):
+        response = await self.llm.ainvoke(self._describe_problem_prompt(gamestate_text, actions_text), response_format=ProblemDescription, system_prompt=SYSTEM_PROMPT)
+        return self._parse_problem_description(response)
+
+    async def arecommend_action(self, gamestate_text, actions_text, similar_steps=None):
+        response = await self.llm.ainvoke(self._recommend_action_prompt(gamestate_text, actions_text, similar_steps), response_format=Recommendation, system_prompt=SYSTEM_PROMPT)
+        return self._parse_recommendation(response)
+
+    async def acompare_expectation_vs_reality(self, current_state, previous_state, expected_results):
+        response = await self.llm.ainvoke(self._compare_expectation_vs_reality_prompt(current_state, previous_state, expected_results), response_format=ActualResults, system_prompt=SYSTEM_PROMPT)
+        return self._parse_actual_results(response)
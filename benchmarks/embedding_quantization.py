@@ -0,0 +1,101 @@
+"""
+Measures what float16 / int8 embedding storage costs in recall and saves in bytes and search time.
+
+For each format, vectors are stored the way KnowledgeGraph stores them (encode_embedding -> decode_embedding),
+held in a VectorIndex of the same dtype, and searched. Recall@k is measured against an exact float32 search.
+Embeddings are synthetic clusters by default, or read from a graph.db:
+
+    python benchmarks/embedding_quantization.py
+    python benchmarks/embedding_quantization.py --db graph.db --agent hero
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+
+from graph import encode_embedding, decode_embedding
+from indexClass import VectorIndex, VECTOR_DTYPES, normalize, top_k
+
+
+def synthetic_embeddings(count, dim, rng, clusters=256):
+    """Clustered, anisotropic vectors: closer to sentence embeddings than isotropic noise is."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    scale = np.linspace(2.0, 0.2, dim, dtype=np.float32)  # A few dominant directions, like real embedding spaces
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors * scale
+
+
+def database_embeddings(db_path, agent_id):
+    conn = sqlite3.connect(db_path)
+    query = "SELECT description_embedding, embedding_format, embedding_scale FROM steps WHERE description_embedding IS NOT NULL"
+    params = ()
+    if agent_id is not None:
+        query += " AND src_agent_id = ?"
+        params = (agent_id,)
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    return np.vstack([decode_embedding(*row) for row in rows])
+
+
+def evaluate(vectors, queries, embedding_format, k, nprobe, nlist):
+    """Returns (bytes per stored embedding, index bytes, recall@k flat, recall@k IVF, ms per query IVF)."""
+    stored = [encode_embedding(vector, embedding_format) for vector in vectors]
+    decoded = np.vstack([decode_embedding(*row) for row in stored])
+    ids = np.arange(len(vectors))
+
+    exact = normalize(queries) @ normalize(vectors).T
+    truth = [set(top_k(row, k).tolist()) for row in exact]
+
+    index = VectorIndex(vectors.shape[1], nprobe=nprobe, dtype=embedding_format)
+    index.add(ids, decoded)
+    flat = [set(index.search(query, k)[0].tolist()) for query in queries]
+    index.train(nlist)
+    start = time.perf_counter()
+    ivf = [set(index.search(query, k)[0].tolist()) for query in queries]
+    ms_per_query = (time.perf_counter() - start) / len(queries) * 1e3
+
+    def recall(results):
+        return np.mean([len(found & expected) / len(expected) for found, expected in zip(results, truth)])
+
+    blob_bytes = np.mean([len(blob) + (8 if scale is not None else 0) for blob, _, scale in stored])
+    return blob_bytes, index.nbytes, recall(flat), recall(ivf), ms_per_query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=None, help="Evaluate on the embeddings stored in this graph database.")
+    parser.add_argument("--agent", default=None, help="With --db, only this src_agent_id's embeddings.")
+    parser.add_argument("--count", type=int, default=50_000, help="Number of synthetic embeddings.")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic embedding size (bge-small is 384).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.db:
+        vectors = database_embeddings(args.db, args.agent)
+    else:
+        vectors = synthetic_embeddings(args.count, args.dim, rng)
+    # Queries are perturbed copies of stored vectors, like a new position that resembles an old one
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + 0.3 * vectors.std() * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32)
+
+    print(f"{len(vectors)} embeddings of dim {vectors.shape[1]}, {len(queries)} queries, recall@{args.k}, nprobe={args.nprobe}")
+    print(f"{'format':>8} {'bytes/row':>10} {'index MB':>9} {'recall flat':>12} {'recall IVF':>11} {'ms/query':>9}")
+    for embedding_format in VECTOR_DTYPES:
+        blob_bytes, index_bytes, recall_flat, recall_ivf, ms_per_query = evaluate(vectors, queries, embedding_format, args.k, args.nprobe, args.nlist)
+        print(f"{embedding_format:>8} {blob_bytes:>10.0f} {index_bytes / 1e6:>9.1f} {recall_flat:>12.4f} {recall_ivf:>11.4f} {ms_per_query:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
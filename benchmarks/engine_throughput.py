@@ -0,0 +1,174 @@
+"""
+Throughput benchmarks for the game engine and the graph, with a stored baseline to catch regressions.
+
+Every case is reported in operations per second (higher is better) and uses a fixed set of seeds, so two runs on
+the same machine play the same games over the same states:
+  - games / moves: random full games, start to finish
+  - legal_mask: legal_action_mask on positions from those games
+  - display: display_gamestate + display_actions on the same positions
+  - clone: GameState.clone
+  - zobrist: GameState.zobrist_hash
+  - finalize@N: finalize_sequence of one 50-step game with N steps already in the database
+  - similar@N: find_similar_problems against N stored embeddings
+
+    python benchmarks/engine_throughput.py --out results.json
+    python benchmarks/engine_throughput.py --save-baseline benchmarks/baseline.json
+    python benchmarks/engine_throughput.py --baseline benchmarks/baseline.json   # exits 1 on a regression
+
+Baselines are machine-specific: save one on the machine you compare on.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+
+from graph import KnowledgeGraph, StepInfo
+from graph_scaling import fill, STEPS_PER_GAME, NUM_STATES
+from poker_monster.engine import GameEngine, legal_action_mask, display_gamestate, display_actions
+
+SEEDS = range(20)  # Games played by the games case; their positions are the inputs of the per-state cases
+EMBEDDING_DIM = 384
+
+
+def best_rate(fn, count, repeat):
+    """Runs fn (which does count operations) repeat times and returns the best operations per second."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def play_random_games(seeds, states=None):
+    """Plays one random game per seed. Returns the number of moves; appends a clone of every position to states."""
+    engine = GameEngine()
+    moves = 0
+    for seed in seeds:
+        rng = random.Random(seed)
+        engine.reset(seed=seed)
+        while engine.get_results() is None:
+            if states is not None:
+                states.append(engine.gs.clone())
+            engine.iterate(rng.choice(engine.get_legal_actions()))
+            moves += 1
+    return moves
+
+
+def engine_cases(repeat):
+    results = {}
+    states = []
+    moves = play_random_games(SEEDS, states)
+    games_per_sec = best_rate(lambda: play_random_games(SEEDS), len(SEEDS), repeat)
+    results["games"] = games_per_sec
+    results["moves"] = games_per_sec * moves / len(SEEDS)
+
+    def each_state(fn):
+        def run():
+            for gs in states:
+                fn(gs)
+        return run
+    results["legal_mask"] = best_rate(each_state(legal_action_mask), len(states), repeat)
+    results["display"] = best_rate(each_state(lambda gs: (display_gamestate(gs), display_actions(gs))), len(states), repeat)
+    results["clone"] = best_rate(each_state(lambda gs: gs.clone()), len(states), repeat)
+    results["zobrist"] = best_rate(each_state(lambda gs: gs.zobrist_hash()), len(states), repeat)
+    return results
+
+
+def graph_cases(sizes, repeat, seed):
+    results = {}
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = KnowledgeGraph(db_path=Path(tmp) / "bench.db", buffered=True, durability="normal")
+        for size in sorted(sizes):
+            fill(graph, size, rng)
+
+            def finalize():
+                graph.start_new_sequence()
+                states = rng.integers(0, NUM_STATES, STEPS_PER_GAME + 1)
+                for step_num in range(STEPS_PER_GAME):
+                    agent = "hero" if step_num % 2 == 0 else "monster"
+                    graph.record_step(StepInfo(agent, agent, f"state-{states[step_num]}", f"state-{states[step_num + 1]}", f"[{step_num % 42}] Action", "desc"))
+                graph.flush()
+                graph.finalize_sequence({"hero": 1.0, "monster": -1.0})
+            results[f"finalize@{size}"] = best_rate(finalize, 1, repeat * 5)
+
+            # The index gets the same number of vectors as the database has steps
+            agent = f"bench-{size}"
+            vectors = rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+            graph._index_add(agent, list(range(size)), vectors, [{"problem_description": "desc", "reasoning_for_action": "reason"}] * size)
+            queries = [StepInfo(src_agent_id=agent, description_embedding=vector) for vector in rng.standard_normal((500, EMBEDDING_DIM)).astype(np.float32)]
+            results[f"similar@{size}"] = best_rate(lambda: [graph.find_similar_problems(query, 5) for query in queries], len(queries), repeat)
+        graph.close()
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline, tolerance):
+    """Prints each case against the baseline. Returns the names of the cases slower than baseline by more than tolerance."""
+    regressions = []
+    print(f"{'case':>18} {'ops/sec':>12} {'baseline':>12} {'change':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:>18} {value:>12.1f} {'-':>12} {'new':>8}")
+            continue
+        change = value / base - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:>18} {value:>12.1f} {base:>12.1f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-sizes", type=int, nargs="*", default=[10_000, 100_000], help="Database sizes (steps) for the graph cases.")
+    parser.add_argument("--repeat", type=int, default=5, help="Each case is run this many times and the best run is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", default=None, help="Compare against this results file and exit 1 on a regression.")
+    parser.add_argument("--save-baseline", default=None, help="Write the results to this file as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before a case counts as a regression.")
+    args = parser.parse_args()
+
+    results = engine_cases(args.repeat)
+    results.update(graph_cases(args.db_sizes, args.repeat, args.seed))
+    report = {"meta": metadata(), "results": results}
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"FAIL: {len(regressions)} case(s) slower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("OK: no regressions")
+    else:
+        compare(results, {}, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
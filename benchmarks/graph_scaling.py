@@ -0,0 +1,112 @@
+"""
+Measures how finalize_sequence and the steps-table lookups scale as graph.db grows.
+
+Fills a scratch database with synthetic games (50 steps each), then at each checkpoint times:
+  - finalize: recording + finalizing one fresh game through KnowledgeGraph
+  - by_sequence: fetching one game's steps by sequence_id
+  - verified_since: the vector-index catch-up query (verified steps of one agent after an id)
+With the secondary indexes these stay flat as the table grows; --no-indexes drops them for comparison.
+
+    python benchmarks/graph_scaling.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+
+from graph import KnowledgeGraph, StepInfo, state_id
+
+STEPS_PER_GAME = 50
+NUM_STATES = 200_000  # Size of the synthetic state space, so nodes repeat across games like real positions do
+REPEATS = 20
+
+
+def fill(graph, num_steps, rng):
+    """Bulk-inserts synthetic games straight into SQLite until steps holds num_steps rows."""
+    have = graph.conn.execute("SELECT COUNT(*) FROM steps").fetchone()[0]
+    batch_sequences, batch_states, batch_nodes, batch_edges, batch_steps = [], [], [], [], []
+    while have < num_steps:
+        sequence_id = str(uuid.uuid4())
+        batch_sequences.append((sequence_id,))
+        states = rng.integers(0, NUM_STATES, STEPS_PER_GAME + 1)
+        for step_num in range(STEPS_PER_GAME):
+            agent = "hero" if step_num % 2 == 0 else "monster"
+            src_text, dst_text = f"state-{states[step_num]}", f"state-{states[step_num + 1]}"
+            src, dst = state_id(src_text), state_id(dst_text)
+            action = f"[{step_num % 42}] Action"
+            batch_states.extend(((src, src_text), (dst, dst_text)))
+            batch_nodes.append((src, agent))
+            batch_edges.append((src, dst, action, agent))
+            batch_steps.append((sequence_id, step_num, src, dst, action, agent, "desc", "reason", None, bool(step_num % 3 == 0)))
+        have += STEPS_PER_GAME
+        if len(batch_steps) >= 100_000 or have >= num_steps:
+            with graph.conn:
+                graph.conn.executemany("INSERT INTO sequences (sequence_id) VALUES (?)", batch_sequences)
+                graph.conn.executemany("INSERT OR IGNORE INTO states (id, text) VALUES (?, ?)", batch_states)
+                graph.conn.executemany("INSERT OR IGNORE INTO nodes (id, agent_id) VALUES (?, ?)", batch_nodes)
+                graph.conn.executemany("INSERT OR IGNORE INTO edges (src_id, dst_id, action_str, agent_id) VALUES (?, ?, ?, ?)", batch_edges)
+                graph.conn.executemany("""
+                    INSERT INTO steps (sequence_id, step_num, src_id, dst_id, action_str, src_agent_id, problem_description, reasoning_for_action, expected_results, action_verified)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, batch_steps)
+            batch_sequences, batch_states, batch_nodes, batch_edges, batch_steps = [], [], [], [], []
+
+
+def time_finalize(graph, rng):
+    graph.start_new_sequence()
+    states = rng.integers(0, NUM_STATES, STEPS_PER_GAME + 1)
+    for step_num in range(STEPS_PER_GAME):
+        agent = "hero" if step_num % 2 == 0 else "monster"
+        graph.record_step(StepInfo(agent, agent, f"state-{states[step_num]}", f"state-{states[step_num + 1]}", f"[{step_num % 42}] Action", "desc"))
+    graph.flush()
+    start = time.perf_counter()
+    graph.finalize_sequence({"hero": 1.0, "monster": -1.0})
+    return time.perf_counter() - start
+
+
+def time_query(graph, sql, params):
+    start = time.perf_counter()
+    graph.conn.execute(sql, params).fetchall()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--no-indexes", action="store_true", help="Drop the secondary indexes to see the unindexed cost.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = KnowledgeGraph(db_path=Path(tmp) / "bench.db", buffered=True, durability="normal")
+        if args.no_indexes:
+            for name in ("idx_steps_sequence", "idx_steps_agent_verified", "idx_edges_triple_agent"):
+                graph.conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+        print(f"{'steps':>10} {'finalize ms':>12} {'by_sequence ms':>15} {'verified_since ms':>18}")
+        for size in sorted(args.sizes):
+            fill(graph, size, rng)
+            graph.conn.execute("ANALYZE")
+            sequence_ids = [row[0] for row in graph.conn.execute("SELECT sequence_id FROM sequences ORDER BY RANDOM() LIMIT ?", (REPEATS,))]
+            max_id = graph.conn.execute("SELECT MAX(id) FROM steps").fetchone()[0]
+
+            finalize = np.median([time_finalize(graph, rng) for _ in range(REPEATS)])
+            by_sequence = np.median([time_query(graph, "SELECT src_id, dst_id, action_str FROM steps WHERE sequence_id = ?", (sequence_id,)) for sequence_id in sequence_ids])
+            verified_since = np.median([time_query(graph, """
+                SELECT id FROM steps WHERE action_verified = 1 AND src_agent_id = ? AND id > ?
+            """, ("monster", max_id - 1000)) for _ in range(REPEATS)])
+            print(f"{size:>10} {finalize * 1e3:>12.3f} {by_sequence * 1e3:>15.3f} {verified_since * 1e3:>18.3f}")
+        graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Many games sharing one LLM through LLMDispatcher, against the local stub server (llm_stub_server.py).
+
+Each game runs in its own thread with its own event loop and plays main.py's loop (gameloop.play_game) without a graph
+or embedder: describe_problem and compare_expectation_vs_reality together, then recommend_action, whose action is
+played. With --direct every game gets its own OpenAILLM instead, for comparison. Prints steps per second, the dispatcher's metrics (queue depth, per-priority
+queue wait and latency) and how many requests the stub saw at once.
+
+    python benchmarks/llm_dispatch.py --games 32 --concurrency 8 --latency 0.2
+    python benchmarks/llm_dispatch.py --games 32 --direct
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from llmClass import OpenAILLM
+from dispatcherClass import LLMDispatcher
+from Thinker import Thinker
+from gameloop import play_game
+from poker_monster.engine import GameEngine
+from llm_stub_server import start_stub_server
+
+
+def play(llm, seed, max_steps, step_times):
+    """Plays one game (up to max_steps steps) of main.py's loop with the Thinker choosing every move, on its own event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)  # play_game's gather() is called outside the loop
+    last = [time.perf_counter()]
+    def on_step(stepinfo):
+        now = time.perf_counter()
+        step_times.append(now - last[0])
+        last[0] = now
+    steps = play_game(GameEngine(), Thinker(llm, graph=None), loop, thinker_agents=("hero", "monster"), seed=seed, max_steps=max_steps, on_step=on_step)
+    loop.close()
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=32, help="Games played at once, one thread each.")
+    parser.add_argument("--steps", type=int, default=10, help="Steps played per game.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Dispatcher workers (and HTTP connections).")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests per minute budget.")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens per minute budget.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub server latency, seconds.")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--direct", action="store_true", help="No dispatcher: one OpenAILLM per game.")
+    parser.add_argument("--json", action="store_true", help="Print the dispatcher metrics as JSON.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = start_stub_server(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate)
+    if args.direct:
+        llms = [OpenAILLM("stub", api_key="stub", base_url=server.base_url) for _ in range(args.games)]
+        for llm in llms:
+            llm.load()
+        dispatcher = None
+    else:
+        dispatcher = LLMDispatcher(OpenAILLM("stub", api_key="stub", base_url=server.base_url, max_connections=args.concurrency),
+                                   max_concurrency=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+        dispatcher.load()
+        llms = [dispatcher] * args.games
+
+    step_times = []
+    threads = [threading.Thread(target=play, args=(llm, seed, args.steps, step_times)) for seed, llm in enumerate(llms)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    step_times.sort()
+    print(f"{'direct' if args.direct else 'dispatcher'}: {args.games} games, {len(step_times)} steps, {server.requests} requests in {elapsed:.2f}s")
+    print(f"  {len(step_times) / elapsed:.1f} steps/s, {server.requests / elapsed:.1f} requests/s, step p50 {step_times[len(step_times) // 2]:.3f}s, "
+          f"p95 {step_times[int(len(step_times) * 0.95)]:.3f}s, most requests at the server at once: {server.max_in_flight}")
+    if dispatcher is not None:
+        metrics = dispatcher.metrics()
+        if args.json:
+            print(json.dumps(metrics, indent=2))
+        else:
+            print(f"  max queue depth {metrics['max_queue_depth']}, estimated tokens {metrics['estimated_tokens']}")
+            for name, stats in metrics["priorities"].items():
+                wait, latency = stats["queue_wait"], stats["latency"]
+                print(f"  {name:>6}: {stats['completed']} ok, {stats['errors']} errors, queue wait mean {wait['mean']:.3f}s p95 <= {wait['p95']:.3f}s, "
+                      f"call mean {latency['mean']:.3f}s p95 <= {latency['p95']:.3f}s")
+        dispatcher.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+A local stand-in for an OpenAI-compatible chat completions server, for load tests of the LLM layer without a real model.
+
+POST /v1/chat/completions answers after a configurable latency with JSON that fits the request's json_schema
+response_format (MockLLM's generator): strings are filler text, booleans are random, and integers are a legal action id picked from the
+"[id] ..." lines in the prompt (lines marked "(Invalid)" are skipped), so a game driven by it always moves forward.
+Responses carry a usage block like the real API's, including prompt caching: the longest prefix of the prompt (all
+messages in order) that an earlier request already sent counts as cached_tokens, in blocks of --cache-block tokens
+once it is at least --cache-min tokens long (OpenAI's rule: 1024 and 128). With --prefill-rate, uncached prompt tokens
+add processing time on top of the latency. Requests are served concurrently, one thread each.
+
+    python benchmarks/llm_stub_server.py --port 8765 --latency 0.2 --jitter 0.05
+    OpenAILLM("stub", api_key="stub", base_url="http://127.0.0.1:8765/v1")
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(os.path.dirname(os.path.abspath(__file__))).parent))
+
+from llmClass import fill_schema
+
+CHARS_PER_TOKEN = 4
+MAX_CACHED_PREFIXES = 1_000_000  # The prefix cache is dropped when it grows past this
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled clients reuse connections
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        prompt = "\n".join(part["text"] if isinstance(part, dict) else part
+                           for message in request.get("messages", [])
+                           for part in (message["content"] if isinstance(message["content"], list) else [message["content"]])
+                           if isinstance(part, str) or part.get("type") == "text")
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            latency = max(0.0, server.rng.gauss(server.latency, server.jitter)) if server.jitter else server.latency
+            failed = server.rng.random() < server.failure_rate
+            cached_tokens = server.cache_prompt(prompt)
+        if server.prefill_rate:
+            latency += (prompt_tokens - cached_tokens) / server.prefill_rate
+        try:
+            time.sleep(latency)
+            if failed:
+                self._send(500, {"error": {"message": "Stub failure", "type": "server_error"}})
+                return
+            response_format = request.get("response_format") or {}
+            with server.lock:
+                if response_format.get("type") == "json_schema":
+                    content = json.dumps(fill_schema(response_format["json_schema"]["schema"], prompt, server.rng))
+                else:
+                    content = fill_schema({"type": "string"}, prompt, server.rng)
+            completion_tokens = len(content) // CHARS_PER_TOKEN
+            self._send(200, {
+                "id": f"chatcmpl-stub-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Quiet; the server's counters say what happened
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def cache_prompt(self, prompt):
+        """Returns how many of prompt's tokens a provider prefix cache would serve, then caches prompt's prefixes. Call under lock."""
+        block = self.cache_block * CHARS_PER_TOKEN
+        boundaries = range(self.cache_min * CHARS_PER_TOKEN, len(prompt) + 1, block)
+        cached = 0
+        for end in boundaries:
+            if hash(prompt[:end]) not in self.prefixes:
+                break
+            cached = end // CHARS_PER_TOKEN
+        if len(self.prefixes) > MAX_CACHED_PREFIXES:
+            self.prefixes.clear()
+        self.prefixes.update(hash(prompt[:end]) for end in boundaries)
+        return cached
+
+
+def start_stub_server(port=0, latency=0.2, jitter=0.0, failure_rate=0.0, seed=0, cache_min=1024, cache_block=128, prefill_rate=0.0):
+    """Starts the stub in a daemon thread and returns the server; its url is server.base_url. Call server.shutdown() to stop."""
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    server.latency = latency
+    server.jitter = jitter
+    server.failure_rate = failure_rate
+    server.rng = random.Random(seed)
+    server.cache_min = cache_min
+    server.cache_block = cache_block
+    server.prefill_rate = prefill_rate  # Uncached prompt tokens processed per second; 0 = free
+    server.prefixes = set()
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, name="LLMStubServer", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the latency, seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-min", type=int, default=1024, help="Shortest prompt prefix (tokens) that can be served from the prefix cache.")
+    parser.add_argument("--cache-block", type=int, default=128, help="Cached prefixes grow in blocks of this many tokens.")
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="Uncached prompt tokens processed per second (0 = no cost).")
+    args = parser.parse_args()
+    server = start_stub_server(args.port, args.latency, args.jitter, args.failure_rate, args.seed, args.cache_min, args.cache_block, args.prefill_rate)
+    print(f"Stub server listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+End-to-end throughput of main.py's decision loop with no network: MockLLM answers every Thinker call, so what is
+measured is the engine, the embedder, the graph and the loop itself, plus whatever model latency is simulated.
+
+Each game is main.py's loop (gameloop.play_game), with the Thinker choosing for both players (or only the monster, as
+in main.py, with --hero random). Prints steps per second and where the time went per stage:
+  - llm: describe_problem + compare_expectation_vs_reality (together), recommend_action
+  - embed: encoding the problem description
+  - graph: record_step, find_similar_problems, finalize_sequence
+  - engine: display text, legal actions, iterate
+
+    python benchmarks/offline_decision_loop.py --games 10
+    python benchmarks/offline_decision_loop.py --latency 0.3 --latency-distribution lognormal --latency-spread 0.5 --failure-rate 0.02
+    python benchmarks/offline_decision_loop.py --embedder random   # No embedding model installed
+
+--embedder random replaces the sentence-transformer with random unit vectors, which skips the embedding cost; use the
+default to include it (the model has to be downloaded or bundled already).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+
+from gameloop import play_game
+from graph import KnowledgeGraph
+from llmClass import MockLLM
+from Thinker import Thinker
+from poker_monster.engine import GameEngine
+
+EMBEDDING_DIM = 384
+
+
+class RandomEmbedder:
+    """Random unit vectors in place of a real embedding model."""
+    def __init__(self, dim=EMBEDDING_DIM, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.dim = dim
+
+    def load(self):
+        return True
+
+    def encode(self, inputs):
+        vectors = self.rng.standard_normal((len(inputs), self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Timer:
+    """Adds the time spent in each `with timer(stage):` block to that stage's total."""
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def __call__(self, stage):
+        self.stage = stage
+        return self
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.totals[self.stage] += time.perf_counter() - self.start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--max-steps", type=int, default=400, help="Steps after which a game is cut off.")
+    parser.add_argument("--hero", choices=("llm", "random"), default="llm", help="Who chooses the hero's moves (main.py: random).")
+    parser.add_argument("--latency", type=float, default=0.0, help="MockLLM latency, seconds (mean, or median for lognormal).")
+    parser.add_argument("--latency-distribution", choices=MockLLM.LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-spread", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, nargs="+", default=[120], help="Characters per text field, or a low high range.")
+    parser.add_argument("--embedder", choices=("sentence-transformer", "random"), default="sentence-transformer")
+    parser.add_argument("--durability", choices=("full", "normal", "off"), default="full", help="KnowledgeGraph durability (main.py: full).")
+    parser.add_argument("--db", default=None, help="Graph database to write to (default: a temporary one).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    response_chars = args.response_chars[0] if len(args.response_chars) == 1 else tuple(args.response_chars[:2])
+    llm = MockLLM(latency=args.latency, latency_distribution=args.latency_distribution, latency_spread=args.latency_spread,
+                  failure_rate=args.failure_rate, response_chars=response_chars, seed=args.seed)
+    llm.load()
+    if args.embedder == "random":
+        embedder = RandomEmbedder(seed=args.seed)
+    else:
+        from embedClass import SentenceTransformerEmbedder
+        embedder = SentenceTransformerEmbedder("BAAI/bge-small-en-v1.5")
+    embedder.load()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = KnowledgeGraph(db_path=args.db or Path(tmp) / "offline.db", durability=args.durability)
+        engine = GameEngine()
+        thinker = Thinker(llm, graph)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        timer = Timer()
+
+        start = time.perf_counter()
+        thinker_agents = ("hero", "monster") if args.hero == "llm" else ("monster",)
+        steps = sum(play_game(engine, thinker, loop, embedder=embedder, graph=graph, thinker_agents=thinker_agents, seed=args.seed + game,
+                              max_steps=args.max_steps, timer=timer) for game in range(args.games))
+        elapsed = time.perf_counter() - start
+        loop.close()
+        graph.close()
+
+    usage = llm.usage.report()
+    print(f"{args.games} games, {steps} steps in {elapsed:.2f}s: {steps / elapsed:.1f} steps/s, {args.games / elapsed:.2f} games/s")
+    print(f"LLM: {llm.calls} calls, {llm.failures} failures, ~{usage['prompt_tokens'] / max(1, usage['calls']):.0f} prompt tokens per call")
+    other = elapsed - sum(timer.totals.values())
+    for stage, seconds in sorted(timer.totals.items(), key=lambda item: -item[1]) + [("other", other)]:
+        print(f"  {stage:>7}: {seconds:8.3f}s {seconds / elapsed:6.1%}  {seconds / steps * 1e3:8.3f} ms/step")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+How much of the Thinker's input is served from a provider's prompt cache, with the prompt layout Thinker uses now
+(a fixed system message, then the game state and actions, then the task) against the earlier layout (one user message
+with the rules inlined and the task before the game state).
+
+Games are played against the local stub server (llm_stub_server.py), which reports cached_tokens the way OpenAI does
+and, with --prefill-rate, charges time for uncached prompt tokens. Each step is main.py's loop (gameloop.play_game),
+without a graph or embedder, for the player to move. Per game, prints prompt tokens, the cached share, and the input
+cost and prompt-processing time the cache saved (TokenUsage.report; prices are --price and --cached-factor).
+--cache-min 0 models servers that reuse any shared prefix, such as llama.cpp / LM Studio keeping the previous
+request's KV cache.
+
+    python benchmarks/prompt_caching.py --games 5 --steps 20
+    python benchmarks/prompt_caching.py --cache-min 256 --prefill-rate 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "benchmarks"))
+
+from llmClass import OpenAILLM, TokenUsage
+from Thinker import Thinker, GAME_RULES
+from gameloop import play_game
+from poker_monster.engine import GameEngine
+from llm_stub_server import start_stub_server
+
+
+class InlineThinker(Thinker):
+    """The earlier prompt layout, kept here for comparison: everything in one user message, rules first, task before state."""
+    def _describe_problem_prompt(self, gamestate_text, actions_text):
+        return f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is the current game state:\n{gamestate_text}\n\nHere are your available actions:\n{actions_text}\nBased on the current game state and available actions, make a description of the problem you are facing. Don't focus on solutions, just describe the issue at hand.\n"
+
+    def _recommend_action_prompt(self, gamestate_text, actions_text, similar_steps=None):
+        return f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is the current game state:\n{gamestate_text}\n\nHere are the possible actions you can take, with their corresponding IDs:\n{actions_text}\n\nBased on the current game state and the possible actions, make a recommendation for the next action and explain your reasoning for such action. Finally, explain what you think will happen as a result of taking that action.\n\n"
+
+    def _compare_expectation_vs_reality_prompt(self, current_state, previous_state, expected_results):
+        return f"You are playing a game called Poker Monster. Here are the rules:\n{GAME_RULES}\n\nHere is was the previous game state:\n{previous_state}\nHere were your expectations for the results of your last action:\n{expected_results}\n\nHere are the actual results that occurred after taking that action:\n{current_state}\n\nBased on this, analyze whether your expectations matched reality. This information will be used to improve your future decision-making. Respond with whether the action was verified (true/false).\n"
+
+
+class NoSystemPrompt:
+    """Passes calls through to llm without the system prompt, which InlineThinker's prompts already contain."""
+    def __init__(self, llm):
+        self.llm = llm
+
+    async def ainvoke(self, prompt, system_prompt=None, **kwargs):
+        return await self.llm.ainvoke(prompt, **kwargs)
+
+
+def run(layout, args):
+    # A fresh server per layout, so neither starts with the other's prefixes cached
+    server = start_stub_server(latency=args.latency, cache_min=args.cache_min, cache_block=args.cache_block, prefill_rate=args.prefill_rate)
+    llm = OpenAILLM("stub", api_key="stub", base_url=server.base_url)
+    llm.load()
+    thinker = Thinker(llm, graph=None) if layout == "system" else InlineThinker(NoSystemPrompt(llm), graph=None)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reports, seconds = [], []
+    for seed in range(args.games):
+        before = llm.usage.copy()
+        start = time.perf_counter()
+        play_game(GameEngine(), thinker, loop, thinker_agents=("hero", "monster"), seed=seed, max_steps=args.steps)
+        seconds.append(time.perf_counter() - start)
+        reports.append(llm.usage.since(before).report(args.price, args.cached_factor, args.prefill_rate or None))
+    loop.close()
+    server.shutdown()
+    return reports, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=20, help="Steps played per game.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub latency per request, seconds.")
+    parser.add_argument("--cache-min", type=int, default=1024, help="Shortest cacheable prefix, tokens (OpenAI: 1024).")
+    parser.add_argument("--cache-block", type=int, default=128, help="Cache granularity, tokens (OpenAI: 128).")
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="Uncached prompt tokens the stub processes per second (0 = free).")
+    parser.add_argument("--price", type=float, default=TokenUsage.input_price_per_million, help="Input price per million tokens.")
+    parser.add_argument("--cached-factor", type=float, default=TokenUsage.cached_price_factor, help="Price of a cached token relative to an uncached one.")
+    args = parser.parse_args()
+
+    print(f"{'layout':>8} {'game':>5} {'calls':>6} {'prompt tok':>11} {'cached':>8} {'share':>7} {'cost $':>10} {'saved $':>10} {'prefill s saved':>16} {'wall s':>8}")
+    totals = {}
+    for layout in ("inline", "system"):
+        reports, seconds = run(layout, args)
+        for game, (report, wall) in enumerate(zip(reports, seconds)):
+            print(f"{layout:>8} {game:>5} {report['calls']:>6} {report['prompt_tokens']:>11} {report['cached_tokens']:>8} {report['cached_share']:>7.1%} "
+                  f"{report['input_cost']:>10.5f} {report['cost_saved']:>10.5f} {report['prefill_seconds_saved']:>16.2f} {wall:>8.2f}")
+        totals[layout] = {key: sum(report[key] for report in reports) / len(reports) for key in ("prompt_tokens", "cached_tokens", "input_cost", "cost_saved", "prefill_seconds_saved")}
+        totals[layout]["wall"] = sum(seconds) / len(seconds)
+
+    print("\nPer game, on average:")
+    for layout, total in totals.items():
+        print(f"  {layout:>6}: {total['prompt_tokens']:.0f} prompt tokens, {total['cached_tokens']:.0f} cached, input cost ${total['input_cost']:.5f} "
+              f"(${total['cost_saved']:.5f} saved), {total['prefill_seconds_saved']:.2f}s prompt processing saved, {total['wall']:.2f}s wall")
+    inline, system = totals["inline"], totals["system"]
+    print(f"  system layout vs inline: ${inline['input_cost'] - system['input_cost']:.5f} less input cost, "
+          f"{system['prefill_seconds_saved'] - inline['prefill_seconds_saved']:.2f}s less prompt processing per game")
+
+
+if __name__ == "__main__":
+    main()
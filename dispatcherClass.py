@@ -0,0 +1,283 @@
+import asyncio
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from llmClass import BaseLLM
+
+logger = logging.getLogger("LLMDispatcher")
+
+# Lower runs first. By default a request's priority comes from its response_format: the recommendation is what a game
+# is waiting on, describing the problem comes next, and checking expectations against results can wait.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+DEFAULT_PRIORITIES = {"Recommendation": PRIORITY_HIGH, "ProblemDescription": PRIORITY_NORMAL, "ActualResults": PRIORITY_LOW}
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)  # Upper bounds, seconds
+CHARS_PER_TOKEN = 4  # Rough estimate for budgeting; the budgets only need to be right on average
+
+
+class LatencyHistogram:
+    """Counts of observed latencies per LATENCY_BUCKETS bucket, plus count, mean and max."""
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (0 < q <= 1); the true value is at most this."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0, "p50": self.percentile(0.5), "p95": self.percentile(0.95),
+                "p99": self.percentile(0.99), "max": self.max, "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts)}}
+
+
+class TokenBucket:
+    """Allows rate units per second on average, in bursts of up to capacity. take() may overdraw; the debt is waited out."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        amount = min(amount, self.capacity)  # A request bigger than the bucket would otherwise wait forever
+        while True:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return
+            await asyncio.sleep((amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+class LLMDispatcher(BaseLLM):
+    """
+    A shared front for one LLM used by many concurrent games. Requests from any thread (invoke) or event loop (ainvoke)
+    go into one priority queue, served by max_concurrency workers on the dispatcher's own event loop and thread, so
+    the wrapped model's async client and its HTTP connection pool are shared by everyone. Workers respect a global
+    requests-per-minute and tokens-per-minute budget (tokens are estimated from text length). metrics() reports queue
+    depth, in-flight requests, errors and latency histograms per priority.
+    """
+    def __init__(self, llm, max_concurrency=16, requests_per_minute=None, tokens_per_minute=None, expected_output_tokens=300, priorities=None):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        llm.max_concurrency = max(llm.max_concurrency, max_concurrency)  # The workers are the limit; don't let the model's own semaphore be a lower one
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.expected_output_tokens = expected_output_tokens  # Reserved per request before the response's real size is known
+        self.priorities = dict(DEFAULT_PRIORITIES if priorities is None else priorities)
+        if not all(isinstance(priority, int) for priority in self.priorities.values()):
+            raise ValueError("Priorities must be ints (lower runs first)")
+        self._loop = None
+        self._thread = None
+        self._queue = None
+        self._workers = []
+        self._sequence = itertools.count()  # Keeps requests of equal priority first-in, first-out
+        self._reset_metrics()
+
+    @property
+    def model_name(self):
+        return getattr(self.llm, "model_name", None)
+
+    @property
+    def loaded(self):
+        return self._loop is not None
+
+    @property
+    def usage(self):
+        return getattr(self.llm, "usage", None)
+
+    def _reset_metrics(self):
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        # Keyed by priority; custom priorities get their own entries on first use
+        self.completed = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.queue_wait = defaultdict(LatencyHistogram)
+        self.latency = defaultdict(LatencyHistogram)  # Time spent in the model call
+        self.tokens = 0
+
+    def load(self):
+        """Loads the wrapped model and starts the dispatcher thread."""
+        if self._loop is not None:
+            return True
+        if not getattr(self.llm, "loaded", False) and not self.llm.load():
+            return False
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="LLMDispatcher", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"Dispatcher started with {self.max_concurrency} workers.")
+        return True
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.PriorityQueue()
+        self._request_bucket = TokenBucket(self.requests_per_minute / 60, max(1.0, self.requests_per_minute / 60)) if self.requests_per_minute else None
+        self._token_bucket = TokenBucket(self.tokens_per_minute / 60, self.tokens_per_minute / 60 * 5) if self.tokens_per_minute else None
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    def unload(self):
+        self.close()
+        return self.llm.unload()
+
+    def close(self):
+        """Cancels the workers and stops the dispatcher thread. Queued requests are cancelled."""
+        if self._loop is None:
+            return
+        async def shutdown():
+            # The workers, and any submissions still waiting for a result
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join()
+        self._loop = None
+        self._thread = None
+
+    def priority_of(self, response_format):
+        return self.priorities.get(getattr(response_format, "__name__", response_format), PRIORITY_NORMAL)
+
+    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None, priority=None, timeout=None):
+        """Blocking call from any thread other than the dispatcher's. priority overrides the one given by response_format."""
+        submit = self._submit(prompt, image_paths, attached_image_path, temperature, response_format, system_prompt, priority)
+        return asyncio.run_coroutine_threadsafe(submit, self._loop).result(timeout)
+
+    async def ainvoke(self, prompt, image_paths=None, attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None, priority=None):
+        """Awaitable from any event loop."""
+        submit = self._submit(prompt, image_paths, attached_image_path, temperature, response_format, system_prompt, priority)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(submit, self._loop))
+
+    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
+        # Streams aren't queued: they'd hold a worker for the whole stream
+        if system_prompt is not None:
+            return self.llm.stream(prompt, image_paths, attached_image_path, temperature=temperature, system_prompt=system_prompt)
+        return self.llm.stream(prompt, image_paths, attached_image_path, temperature=temperature)
+
+    async def _submit(self, prompt, image_paths, attached_image_path, temperature, response_format, system_prompt, priority):
+        if priority is None:
+            priority = self.priority_of(response_format)
+        if not isinstance(priority, int):  # The queue orders requests by comparing priorities
+            raise ValueError(f"Priority must be an int, got {priority!r}")
+        request = {"prompt": prompt, "image_paths": image_paths, "attached_image_path": attached_image_path, "temperature": temperature,
+                   "response_format": response_format, "system_prompt": system_prompt, "priority": priority, "queued": time.perf_counter(),
+                   "future": self._loop.create_future()}
+        self._queue.put_nowait((priority, next(self._sequence), request))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await request["future"]
+
+    async def _worker(self):
+        while True:
+            _, _, request = await self._queue.get()
+            future = request["future"]
+            if future.cancelled():
+                continue
+            # Whatever happens to the request, its future resolves, so the caller never waits forever
+            try:
+                response = await self._handle(request)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Dispatcher request failed: {e}")
+                self.errors[request["priority"]] += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(response)
+
+    async def _handle(self, request):
+        priority = request["priority"]
+        prompt_tokens = (len(request["prompt"]) + len(request["system_prompt"] or "")) // CHARS_PER_TOKEN
+        estimate = prompt_tokens + self.expected_output_tokens
+        if self._request_bucket is not None:
+            await self._request_bucket.acquire(1)
+        if self._token_bucket is not None:
+            await self._token_bucket.acquire(estimate)
+
+        start = time.perf_counter()
+        self.queue_wait[priority].observe(start - request["queued"])
+        kwargs = {"temperature": request["temperature"]}
+        if request["response_format"] != "text":
+            kwargs["response_format"] = request["response_format"]
+        if request["system_prompt"] is not None:
+            kwargs["system_prompt"] = request["system_prompt"]
+        self.in_flight += 1
+        try:
+            response = await self.llm.ainvoke(request["prompt"], request["image_paths"], attached_image_path=request["attached_image_path"], **kwargs)
+        finally:
+            self.in_flight -= 1
+            self.latency[priority].observe(time.perf_counter() - start)
+
+        # Settle the token budget with the response's real size
+        used = prompt_tokens + (len(response) // CHARS_PER_TOKEN if response else 0)
+        self.tokens += used
+        if self._token_bucket is not None:
+            self._token_bucket.take(used - estimate)
+        if response is None:  # Backends report their own failures as None
+            self.errors[priority] += 1
+        else:
+            self.completed[priority] += 1
+        return response
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def metrics(self):
+        # The workers update the counts on the dispatcher's thread, so from any other thread they are read there too
+        if self._loop is not None and self._loop.is_running() and threading.current_thread() is not self._thread:
+            async def snapshot():
+                return self._metrics()
+            return asyncio.run_coroutine_threadsafe(snapshot(), self._loop).result()
+        return self._metrics()
+
+    def _metrics(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "estimated_tokens": self.tokens,
+            "priorities": {PRIORITY_NAMES.get(priority, str(priority)): {"completed": self.completed[priority], "errors": self.errors[priority],
+                                                                          "queue_wait": self.queue_wait[priority].to_dict(), "latency": self.latency[priority].to_dict()}
+                           for priority in sorted(set(PRIORITY_NAMES) | set(self.queue_wait) | set(self.errors))},
+        }
@@ -0,0 +1,107 @@
+"""
+One game of the Thinker's decision loop. main.py plays its games with play_game, and so do the benchmarks, so what
+they measure is the loop that actually runs.
+"""
+import asyncio
+import logging
+import random
+from contextlib import nullcontext
+
+from graph import StepInfo
+
+logger = logging.getLogger("GameLoop")
+
+NO_REWARDS = {"hero": 0.0, "monster": 0.0}  # A game cut off by max_steps has no winner
+
+
+def play_game(engine, thinker, loop, embedder=None, graph=None, thinker_agents=("monster",), seed=None, rng=None, max_steps=None, timer=None, on_step=None, verbose=False):
+    """
+    Plays one game and returns the number of steps played. Each step:
+      1. describes the problem and compares the player's last expectation with what happened (together, on loop),
+      2. embeds the description and looks up similar past problems (needs embedder and graph),
+      3. plays the Thinker's recommendation for players in thinker_agents, a random legal action for the others or
+         when the Thinker's call fails or its action isn't legal,
+      4. records the step in graph, which is finalized with the game's rewards at the end.
+    Without a graph nothing is recorded. timer(stage) is an optional context manager timing the "llm", "embed",
+    "graph" and "engine" stages; on_step(stepinfo) is called after every step.
+    """
+    stage = timer or (lambda name: nullcontext())
+    rng = rng or random.Random(seed)
+    if graph is not None:
+        with stage("graph"):
+            graph.start_new_sequence()
+    with stage("engine"):
+        engine.reset(seed=seed)
+
+    agent_stepinfo = {
+        "hero": StepInfo(src_agent_id="hero"),
+        "monster": StepInfo(src_agent_id="monster")
+    }
+    steps = 0
+    while engine.get_results() is None and (max_steps is None or steps < max_steps):
+        src_agent = engine.gs.turn_priority
+        current = agent_stepinfo[src_agent]
+        # The current node becomes the old node. The current agent becomes the old agent.
+        if current.src_id is not None:
+            current.dst_agent_id = src_agent
+            current.dst_id = current.src_id
+        with stage("engine"):
+            gamestate_text, actions_text = engine.get_display_text()
+        current.src_id = gamestate_text
+
+        # The two calls don't depend on each other, so they run concurrently. A failed call comes back as its
+        # exception instead of aborting the step.
+        with stage("llm"):
+            calls = [thinker.adescribe_problem(gamestate_text, actions_text)]
+            if current.dst_id is not None:  # src_id is now the state after the player's last action, dst_id the one before it
+                calls.append(thinker.acompare_expectation_vs_reality(current.src_id, current.dst_id, current.expected_results))
+            results = loop.run_until_complete(asyncio.gather(*calls, return_exceptions=True))
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Thinker call failed: {result}")
+        if current.dst_id is not None:
+            current.action_verified = results[1] is True
+            if graph is not None:
+                with stage("graph"):
+                    graph.record_step(current)
+
+        if verbose:
+            print(gamestate_text)
+            print(actions_text)
+        current.problem_description = results[0] if isinstance(results[0], str) else "None"
+        if embedder is not None:
+            with stage("embed"):
+                current.description_embedding = embedder.encode([current.problem_description])[0]
+        if graph is not None:
+            with stage("graph"):
+                current.similar_steps = graph.find_similar_problems(current, 1)
+
+        action_id = None
+        if src_agent in thinker_agents:
+            with stage("llm"):
+                try:
+                    action_id, current.reasoning_for_action, current.expected_results = loop.run_until_complete(
+                        thinker.arecommend_action(gamestate_text, actions_text, current.similar_steps))
+                except Exception as e:  # A failed call, or a response that doesn't parse
+                    logger.error(f"Thinker recommendation failed: {e}")
+                    action_id = None
+        with stage("engine"):
+            legal_actions = engine.get_legal_actions()
+            if action_id not in legal_actions:
+                action_id = rng.choice(legal_actions)
+                current.reasoning_for_action, current.expected_results = "Randomly chosen.", "None"
+            current.action_str = engine.get_action_text(actions_text, action_id)
+            if verbose:
+                print(f"Taking action: {current.action_str}")
+            engine.iterate(action_id)
+        if graph is not None:
+            with stage("graph"):
+                graph.record_step(current)
+        steps += 1
+        if on_step is not None:
+            on_step(current)
+
+    if graph is not None:
+        with stage("graph"):
+            graph.finalize_sequence(engine.get_results() or NO_REWARDS)
+    return steps
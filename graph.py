@@ -1,9 +1,17 @@
 import sqlite3
 import uuid
+import time
+import hashlib
+import atexit
+import weakref
+import argparse
+from pathlib import Path
 import numpy as np
 from dataclasses import dataclass
 from typing import List, Any
 
+from indexClass import VectorIndex, VECTOR_DTYPES, quantize, dequantize
+
 @dataclass
 class StepInfo:
     src_agent_id: str = None
@@ -18,204 +26,683 @@ class StepInfo:
     action_verified: bool = False
     similar_steps: List[dict] = None
 
+# --- STATE INTERNING ---
+# A state's display text can run to hundreds of bytes, so it is stored once in the states table and everything else
+# refers to it by a fixed-width 64-bit id derived from the text.
+
+def state_id(state_text):
+    """64-bit signed id of a state's text (blake2b). Stable across runs and machines, so ids can be computed without a lookup. None stays None."""
+    if state_text is None:  # Steps and edges with no source or destination state
+        return None
+    return int.from_bytes(hashlib.blake2b(state_text.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+# --- SCHEMA ---
+# Each migration upgrades the schema by one version; the database's version lives in PRAGMA user_version.
+# Never edit a migration that has shipped, append a new one instead.
+
+def _migration_1_base_tables(conn):
+    cur = conn.cursor()
+
+    # 1. SEQUENCES (The Chain)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sequences (
+            sequence_id TEXT PRIMARY KEY,
+            outcome TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # 2. STEPS (The Chain Links)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS steps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sequence_id TEXT,
+            step_num INTEGER,
+            src_id TEXT,
+            dst_id TEXT,
+            action_str TEXT,
+            src_agent_id TEXT,
+            problem_description TEXT,
+            description_embedding BLOB,
+            reasoning_for_action TEXT,
+            expected_results TEXT,
+            action_verified BOOLEAN,
+            FOREIGN KEY(sequence_id) REFERENCES sequences(sequence_id)
+            FOREIGN KEY(src_id) REFERENCES nodes(id),
+            FOREIGN KEY(dst_id) REFERENCES nodes(id)
+        )
+    """)
+
+    # 3. NODES (States)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS nodes (
+            agent_id TEXT,
+            id TEXT PRIMARY KEY,
+            total_reward REAL DEFAULT 0.0,
+            count INTEGER DEFAULT 0,
+            avg_reward REAL DEFAULT 0.0
+        )
+    """)
+
+    # 4. EDGES (Actions)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS edges (
+            agent_id TEXT,
+            src_id TEXT,
+            dst_id TEXT,
+            action_str TEXT,
+            total_reward REAL DEFAULT 0.0,
+            count INTEGER DEFAULT 0,
+            avg_reward REAL DEFAULT 0.0,
+            PRIMARY KEY (src_id, dst_id, action_str),
+            FOREIGN KEY(src_id) REFERENCES nodes(id),
+            FOREIGN KEY(dst_id) REFERENCES nodes(id)
+        )
+    """)
+
+def _migration_2_indexes(conn):
+    # finalize_sequence: the per-sequence subqueries read only these columns, so the index covers them
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_steps_sequence ON steps (sequence_id, src_id, dst_id, action_str)")
+    # Vector index loading and catch-up: verified steps of one agent after a given id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_steps_agent_verified ON steps (src_agent_id, action_verified, id)")
+    # finalize_sequence edge update: the primary key already finds the triple, this also covers the agent_id filter
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_edges_triple_agent ON edges (src_id, dst_id, action_str, agent_id)")
+    conn.execute("ANALYZE")
+
+def _migration_3_intern_states(conn):
+    # States move into their own table; nodes, edges and steps keep only the 64-bit state id.
+    # Each table is rebuilt (SQLite can't change a column's type in place) and the ids computed by state_id() in SQL.
+    conn.create_function("state_id", 1, state_id, deterministic=True)
+    conn.execute("""
+        CREATE TABLE states (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO states (id, text)
+        SELECT state_id(id), id FROM nodes WHERE id IS NOT NULL
+        UNION SELECT state_id(src_id), src_id FROM steps WHERE src_id IS NOT NULL
+        UNION SELECT state_id(dst_id), dst_id FROM steps WHERE dst_id IS NOT NULL
+    """)
+
+    conn.execute("""
+        CREATE TABLE nodes_new (
+            agent_id TEXT,
+            id INTEGER PRIMARY KEY,
+            total_reward REAL DEFAULT 0.0,
+            count INTEGER DEFAULT 0,
+            avg_reward REAL DEFAULT 0.0,
+            FOREIGN KEY(id) REFERENCES states(id)
+        )
+    """)
+    conn.execute("INSERT INTO nodes_new SELECT agent_id, state_id(id), total_reward, count, avg_reward FROM nodes")
+
+    conn.execute("""
+        CREATE TABLE edges_new (
+            agent_id TEXT,
+            src_id INTEGER,
+            dst_id INTEGER,
+            action_str TEXT,
+            total_reward REAL DEFAULT 0.0,
+            count INTEGER DEFAULT 0,
+            avg_reward REAL DEFAULT 0.0,
+            PRIMARY KEY (src_id, dst_id, action_str),
+            FOREIGN KEY(src_id) REFERENCES nodes(id),
+            FOREIGN KEY(dst_id) REFERENCES nodes(id)
+        )
+    """)
+    conn.execute("INSERT INTO edges_new SELECT agent_id, state_id(src_id), state_id(dst_id), action_str, total_reward, count, avg_reward FROM edges")
+
+    conn.execute("""
+        CREATE TABLE steps_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sequence_id TEXT,
+            step_num INTEGER,
+            src_id INTEGER,
+            dst_id INTEGER,
+            action_str TEXT,
+            src_agent_id TEXT,
+            problem_description TEXT,
+            description_embedding BLOB,
+            reasoning_for_action TEXT,
+            expected_results TEXT,
+            action_verified BOOLEAN,
+            FOREIGN KEY(sequence_id) REFERENCES sequences(sequence_id)
+            FOREIGN KEY(src_id) REFERENCES nodes(id),
+            FOREIGN KEY(dst_id) REFERENCES nodes(id)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO steps_new
+        SELECT id, sequence_id, step_num, state_id(src_id), state_id(dst_id), action_str, src_agent_id, problem_description,
+               description_embedding, reasoning_for_action, expected_results, action_verified
+        FROM steps
+    """)
+    # Keep AUTOINCREMENT's high-water mark, so ids of deleted steps are never handed out again
+    last_step_id = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'steps'").fetchone()
+
+    for table in ("nodes", "edges", "steps"):
+        conn.execute(f"DROP TABLE {table}")  # Drops its indexes too; they are recreated below
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if last_step_id is not None:
+        if conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'steps'", (last_step_id[0],)).rowcount == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('steps', ?)", (last_step_id[0],))
+
+    conn.execute("CREATE INDEX idx_steps_sequence ON steps (sequence_id, src_id, dst_id, action_str)")
+    conn.execute("CREATE INDEX idx_steps_agent_verified ON steps (src_agent_id, action_verified, id)")
+    conn.execute("CREATE INDEX idx_edges_triple_agent ON edges (src_id, dst_id, action_str, agent_id)")
+    conn.execute("ANALYZE")
+
+def _migration_4_embedding_formats(conn):
+    # Embeddings may be stored as float16 or int8. NULL format = float32, which is what every earlier row holds.
+    conn.execute("ALTER TABLE steps ADD COLUMN embedding_format TEXT")
+    conn.execute("ALTER TABLE steps ADD COLUMN embedding_scale REAL")  # int8 only: value = code * scale
+
+MIGRATIONS = [
+    _migration_1_base_tables,
+    _migration_2_indexes,
+    _migration_3_intern_states,
+    _migration_4_embedding_formats,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# --- EMBEDDINGS ---
+
+def encode_embedding(embedding, embedding_format="float32"):
+    """Returns (blob, format, scale) for the steps table. float32 is stored with a NULL format, like rows written before formats existed."""
+    codes, scale = quantize(embedding, embedding_format)
+    return codes.tobytes(), (None if embedding_format == "float32" else embedding_format), (None if scale is None else float(scale))
+
+def decode_embedding(blob, embedding_format=None, scale=None):
+    """Inverse of encode_embedding(): a float32 vector."""
+    return dequantize(np.frombuffer(blob, dtype=embedding_format or "float32"), scale)
+
+# Graphs not closed yet. Weak, so an unused graph can still be garbage-collected; whatever is left is closed at exit.
+_open_graphs = weakref.WeakSet()
+
+@atexit.register
+def _close_open_graphs():
+    for graph in list(_open_graphs):
+        graph.close()
+
 class KnowledgeGraph:
-    def __init__(self, db_path="brain.db"):
+    def __init__(self, db_path="brain.db", index_nlist=None, index_nprobe=8, index_max_bytes=None, buffered=False, flush_size=256, flush_interval=5.0, durability="full", defer_finalize=False, finalize_batch_size=64, embedding_format="float32", index_dtype="float32"):
+        if embedding_format not in VECTOR_DTYPES or index_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Embedding formats and index dtypes must be one of {VECTOR_DTYPES}")
         self.db_path = db_path
         self.conn = sqlite3.connect(db_path)
         self.conn.row_factory = sqlite3.Row 
+        self._set_durability(durability)
+        self.conn.execute("PRAGMA temp_store=MEMORY")  # Finalization's scratch tables never need to touch disk
         self._init_schema()
         
         # Context
         self.current_sequence_id = None
         self.step_counter = 0
 
+        # Write buffering. Unbuffered commits every step; buffered holds rows in memory and writes them
+        # with executemany in one transaction once flush_size steps or flush_interval seconds pile up.
+        self.buffered = buffered
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending_sequences = []
+        self._pending_states = []
+        self._pending_nodes = []
+        self._pending_edges = []
+        self._pending_steps = []
+        self._last_flush = time.monotonic()
+        # Deferred finalization: completed sequences waiting to be finalized together
+        self.defer_finalize = defer_finalize
+        self.finalize_batch_size = finalize_batch_size
+        self._pending_finalizations = []
+        # Unbuffered steps get their id from SQLite as they are written. Buffered steps are indexed before they are
+        # written, so they take ids from a range reserved in the database (see _reserve_step_ids); other handles on
+        # the same database skip the range.
+        self._next_step_id = 0
+        self._reserved_step_ids_end = 0
+
+        # How new embeddings are written to steps ("float32", "float16" or "int8"). Each row records its own format,
+        # so databases holding a mix of formats still load.
+        self.embedding_format = embedding_format
+
+        # Vector index over verified step embeddings, one per src_agent_id. Persisted next to the database.
+        self.index_dtype = index_dtype  # How the index holds vectors in RAM; int8 is 4x smaller than float32
+        self.index_dir = Path(str(db_path) + ".index")
+        self.index_nlist = index_nlist  # None = sqrt(N) lists
+        self.index_nprobe = index_nprobe  # Recall-vs-latency knob: more probes = better recall, slower queries
+        self.index_max_bytes = index_max_bytes  # Per-agent memory cap; the oldest steps are evicted from RAM past it. None = no cap.
+        self.indexes = {}
+        self._load_indexes()
+
+        _open_graphs.add(self)  # Flush whatever is still buffered when the interpreter exits, even on an unhandled exception
+
+    def _set_durability(self, durability):
+        """
+        "full": SQLite defaults, an fsync on every commit.
+        "normal": WAL + synchronous=NORMAL. Commits are atomic and the database can't corrupt, but the last
+                  transactions may roll back after a power loss (not after an application crash).
+        "off": WAL + synchronous=OFF. Fastest; a power loss can lose recent transactions.
+        """
+        if durability == "full":
+            return
+        if durability not in ("normal", "off"):
+            raise ValueError(f"Unknown durability: {durability}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={durability.upper()}")
+
     def _init_schema(self):
-        cur = self.conn.cursor()
-        
-        # 1. SEQUENCES (The Chain)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS sequences (
-                sequence_id TEXT PRIMARY KEY,
-                outcome TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # 2. STEPS (The Chain Links)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS steps (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sequence_id TEXT,
-                step_num INTEGER,
-                src_id TEXT,
-                dst_id TEXT,
-                action_str TEXT,
-                src_agent_id TEXT,
-                problem_description TEXT,
-                description_embedding BLOB,
-                reasoning_for_action TEXT,
-                expected_results TEXT,
-                action_verified BOOLEAN,
-                FOREIGN KEY(sequence_id) REFERENCES sequences(sequence_id)
-                FOREIGN KEY(src_id) REFERENCES nodes(id),
-                FOREIGN KEY(dst_id) REFERENCES nodes(id)
-            )
-        """)
-
-        # 3. NODES (States)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS nodes (
-                agent_id TEXT,
-                id TEXT PRIMARY KEY,
-                total_reward REAL DEFAULT 0.0,
-                count INTEGER DEFAULT 0,
-                avg_reward REAL DEFAULT 0.0
-            )
-        """)
-
-        # 4. EDGES (Actions)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS edges (
-                agent_id TEXT,
-                src_id TEXT,
-                dst_id TEXT,
-                action_str TEXT,
-                total_reward REAL DEFAULT 0.0,
-                count INTEGER DEFAULT 0,
-                avg_reward REAL DEFAULT 0.0,
-                PRIMARY KEY (src_id, dst_id, action_str),
-                FOREIGN KEY(src_id) REFERENCES nodes(id),
-                FOREIGN KEY(dst_id) REFERENCES nodes(id)
-            )
-        """)
-        self.conn.commit()
+        """Brings the database up to SCHEMA_VERSION by running, in order, every migration it hasn't had yet."""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"{self.db_path} has schema version {version}, newer than this code supports ({SCHEMA_VERSION}).")
+        for target_version, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            # Each migration and its version bump commit together. The explicit BEGIN matters: sqlite3 only opens
+            # transactions before DML, so DDL would otherwise commit statement by statement and a failure halfway
+            # would leave a half-migrated database behind.
+            self.conn.execute("BEGIN")
+            try:
+                migration(self.conn)
+                self.conn.execute(f"PRAGMA user_version = {target_version}")
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
 
     # --- RECORDING ---
 
     def start_new_sequence(self):
         self.current_sequence_id = str(uuid.uuid4())
         self.step_counter = 0
-        self.conn.execute("INSERT INTO sequences (sequence_id) VALUES (?)", (self.current_sequence_id,))
-        self.conn.commit()
+        self._pending_sequences.append((self.current_sequence_id,))
+        self._maybe_flush()
 
     def record_step(self, step: StepInfo):
-        self._create_node(step.src_id, step.src_agent_id)
-        self._create_node(step.dst_id, step.dst_agent_id)
-        self._create_edge(step.src_id, step.dst_id, step.action_str, step.src_agent_id)  # Edges are made by the source agent.
+        # StepInfo carries the states' text; the database only stores their interned ids
+        src_id = self._intern_state(step.src_id)
+        dst_id = self._intern_state(step.dst_id)
+        self._create_node(src_id, step.src_agent_id)
+        self._create_node(dst_id, step.dst_agent_id)
+        self._create_edge(src_id, dst_id, step.action_str, step.src_agent_id)  # Edges are made by the source agent.
 
-        blob = step.description_embedding.tobytes() if step.description_embedding is not None else None
+        blob, embedding_format, embedding_scale = None, None, None
+        if step.description_embedding is not None:
+            blob, embedding_format, embedding_scale = encode_embedding(step.description_embedding, self.embedding_format)
 
-        self.conn.execute("""
-            INSERT INTO steps (sequence_id, step_num, src_id, dst_id, action_str, src_agent_id, problem_description, description_embedding, reasoning_for_action, expected_results, action_verified)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (self.current_sequence_id, self.step_counter, step.src_id, step.dst_id, step.action_str, step.src_agent_id, step.problem_description, blob, step.reasoning_for_action, step.expected_results, step.action_verified))
+        row = (self.current_sequence_id, self.step_counter, src_id, dst_id, step.action_str, step.src_agent_id, step.problem_description, blob, step.reasoning_for_action, step.expected_results, step.action_verified, embedding_format, embedding_scale)
+        if self.buffered:
+            if self._next_step_id >= self._reserved_step_ids_end:
+                self._reserve_step_ids(self.flush_size)
+            step_id = self._next_step_id
+            self._next_step_id += 1
+            self._pending_steps.append((step_id,) + row)
+        else:
+            with self.conn:
+                self._write_pending()
+                step_id = self.conn.execute("""
+                    INSERT INTO steps (sequence_id, step_num, src_id, dst_id, action_str, src_agent_id, problem_description, description_embedding, reasoning_for_action, expected_results, action_verified, embedding_format, embedding_scale)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, row).lastrowid
         
         self.step_counter += 1
+
+        # Only verified steps are searchable, so only those go into the index.
+        if blob is not None and step.action_verified:
+            self._index_add(step.src_agent_id, [step_id], [step.description_embedding], [self._payload(step.problem_description, step.reasoning_for_action)])
+
+        self._maybe_flush()
+        return step_id
+
+    def _reserve_step_ids(self, count):
+        """Claims the next count step ids by moving AUTOINCREMENT's high-water mark past them, in one write transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")  # Takes the write lock before reading, so no other handle claims the same ids
+        try:
+            start = self.conn.execute("""
+                SELECT MAX(COALESCE((SELECT MAX(id) FROM steps), 0), COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'steps'), 0)) + 1
+            """).fetchone()[0]
+            end = start + count
+            if self.conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'steps'", (end - 1,)).rowcount == 0:
+                self.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('steps', ?)", (end - 1,))
+        except BaseException:
+            self.conn.rollback()
+            raise
         self.conn.commit()
+        self._next_step_id, self._reserved_step_ids_end = start, end
 
-    def _create_node(self, node_id, agent_id):
-        self.conn.execute("""
+    def _maybe_flush(self):
+        if not self.buffered or len(self._pending_steps) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered row in a single transaction."""
+        self._last_flush = time.monotonic()
+        if not (self._pending_sequences or self._pending_states or self._pending_nodes or self._pending_edges or self._pending_steps):
+            return
+        with self.conn:  # One transaction: either the whole batch lands or none of it does
+            self._write_pending()
+
+    def _write_pending(self):
+        """Writes and clears the buffered rows, in the caller's transaction."""
+        self.conn.executemany("INSERT INTO sequences (sequence_id) VALUES (?)", self._pending_sequences)
+        self.conn.executemany("INSERT OR IGNORE INTO states (id, text) VALUES (?, ?)", self._pending_states)
+        self.conn.executemany("""
             INSERT OR IGNORE INTO nodes (id, agent_id)
             VALUES (?, ?)
-        """, (node_id, agent_id))
-
-    def _create_edge(self, src, dst, act, agent_id):
-        self.conn.execute("""
+        """, self._pending_nodes)
+        self.conn.executemany("""
             INSERT OR IGNORE INTO edges (src_id, dst_id, action_str, agent_id)
             VALUES (?, ?, ?, ?)
-        """, (src, dst, act, agent_id))
+        """, self._pending_edges)
+        self.conn.executemany("""
+            INSERT INTO steps (id, sequence_id, step_num, src_id, dst_id, action_str, src_agent_id, problem_description, description_embedding, reasoning_for_action, expected_results, action_verified, embedding_format, embedding_scale)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, self._pending_steps)
+        self._pending_sequences = []
+        self._pending_states = []
+        self._pending_nodes = []
+        self._pending_edges = []
+        self._pending_steps = []
+
+    def close(self):
+        """Flushes buffered writes, saves the indexes and closes the connection. Safe to call more than once."""
+        if self.conn is None:
+            return
+        self.flush()
+        self.flush_finalizations()
+        self.save_indexes()
+        self.conn.execute("PRAGMA optimize")  # Refreshes planner statistics if the tables have grown a lot
+        self.conn.close()
+        self.conn = None
+        _open_graphs.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_action_verified(self, step_id, verified):
+        """Changes a recorded step's verification, adding it to or dropping it from the in-memory index to match."""
+        self.flush()  # The step may still be in the buffer
+        self.conn.execute("UPDATE steps SET action_verified = ? WHERE id = ?", (verified, step_id))
+        self.conn.commit()
+        row = self.conn.execute("""
+            SELECT src_agent_id, problem_description, description_embedding, embedding_format, embedding_scale, reasoning_for_action
+            FROM steps
+            WHERE id = ?
+        """, (step_id,)).fetchone()
+        if row is None:
+            return
+        index = self.indexes.get(row["src_agent_id"])
+        if index is not None:
+            index.remove([step_id])
+        if verified and row["description_embedding"] is not None:
+            embedding = decode_embedding(row["description_embedding"], row["embedding_format"], row["embedding_scale"])
+            self._index_add(row["src_agent_id"], [step_id], [embedding], [self._payload(row["problem_description"], row["reasoning_for_action"])])
+
+    def _intern_state(self, state_text):
+        if state_text is None:
+            return None
+        node_id = state_id(state_text)
+        self._pending_states.append((node_id, state_text))
+        return node_id
+
+    def _create_node(self, node_id, agent_id):
+        self._pending_nodes.append((node_id, agent_id))
+
+    def _create_edge(self, src, dst, act, agent_id):
+        self._pending_edges.append((src, dst, act, agent_id))
     # --- LEARNING ---
 
-    def finalize_sequence(self, rewards_dict):
+    def finalize_sequence(self, rewards_dict, defer=None):
         """
         Updates stats based on results for Nodes and Edges touched in this sequence, filtered by the Agent ID.
+        With defer (default: the graph's defer_finalize setting) the sequence is queued and finalized together
+        with others by flush_finalizations(), which runs automatically every finalize_batch_size sequences and on close().
+        """
+        self.flush()  # The sequence's steps have to be in the database before the stats can be computed from them
+        self._pending_finalizations.append((self.current_sequence_id, rewards_dict))
+        if defer is None:
+            defer = self.defer_finalize
+        if not defer or len(self._pending_finalizations) >= self.finalize_batch_size:
+            self.flush_finalizations()
+
+    def flush_finalizations(self):
         """
-        self.conn.execute("""
-            UPDATE sequences
-            SET outcome = ?
-            WHERE sequence_id = ?
-        """, (str(rewards_dict), self.current_sequence_id))
-
-        # Iterate over the rewards (e.g., hero: 1.0, monster: -1.0)
-        for agent_id, reward in rewards_dict.items():
-            
-            # 1. Update NODES for this agent involved in this sequence
+        Finalizes every queued sequence in one set-based pass:
+        each sequence's touched nodes and edges are read from steps once, into temp tables, and a single UPDATE
+        per table then applies every agent's reward, however many sequences and agents there are.
+        """
+        if not self._pending_finalizations:
+            return
+        rewards = [(sequence_id, agent_id, reward) for sequence_id, rewards_dict in self._pending_finalizations for agent_id, reward in rewards_dict.items()]
+        with self.conn:
+            self.conn.executemany("""
+                UPDATE sequences
+                SET outcome = ?
+                WHERE sequence_id = ?
+            """, [(str(rewards_dict), sequence_id) for sequence_id, rewards_dict in self._pending_finalizations])
+
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS finalize_rewards (sequence_id TEXT, agent_id TEXT, reward REAL, PRIMARY KEY (sequence_id, agent_id))")
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS touched_nodes (sequence_id TEXT, id INTEGER)")
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS touched_edges (sequence_id TEXT, src_id INTEGER, dst_id INTEGER, action_str TEXT)")
+            self.conn.executemany("INSERT OR REPLACE INTO temp.finalize_rewards VALUES (?, ?, ?)", rewards)
+
+            # 1. Materialise each sequence's touched set once, deduplicated per sequence like the old UNION / IN
+            self.conn.execute("""
+                INSERT INTO temp.touched_nodes (sequence_id, id)
+                SELECT sequence_id, src_id FROM steps WHERE sequence_id IN (SELECT sequence_id FROM temp.finalize_rewards)
+                UNION
+                SELECT sequence_id, dst_id FROM steps WHERE sequence_id IN (SELECT sequence_id FROM temp.finalize_rewards)
+            """)
+            self.conn.execute("""
+                INSERT INTO temp.touched_edges (sequence_id, src_id, dst_id, action_str)
+                SELECT DISTINCT sequence_id, src_id, dst_id, action_str FROM steps WHERE sequence_id IN (SELECT sequence_id FROM temp.finalize_rewards)
+            """)
+
+            # 2. Apply every agent's reward in one pass per table. A single sequence touches each row at most once;
+            #    a batch may touch it several times, so the batch case sums the visits and rewards first. The UPDATEs
+            #    read the sums with one correlated row-value subquery on the delta tables' keys rather than
+            #    UPDATE ... FROM, which needs SQLite 3.33. CROSS JOIN keeps the (small) delta table on the outside, so
+            #    only the touched rows are looked up.
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS node_delta (id INTEGER, agent_id TEXT, visits INTEGER, reward REAL, PRIMARY KEY (id, agent_id))")
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS edge_delta (src_id INTEGER, dst_id INTEGER, action_str TEXT, agent_id TEXT, visits INTEGER, reward REAL, PRIMARY KEY (src_id, dst_id, action_str, agent_id))")
+            if len(self._pending_finalizations) == 1:
+                node_delta = "SELECT touched.id, rewards.agent_id, 1, rewards.reward FROM temp.touched_nodes AS touched JOIN temp.finalize_rewards AS rewards ON rewards.sequence_id = touched.sequence_id"
+                edge_delta = "SELECT touched.src_id, touched.dst_id, touched.action_str, rewards.agent_id, 1, rewards.reward FROM temp.touched_edges AS touched JOIN temp.finalize_rewards AS rewards ON rewards.sequence_id = touched.sequence_id"
+            else:
+                node_delta = "SELECT touched.id, rewards.agent_id, COUNT(*), SUM(rewards.reward) FROM temp.touched_nodes AS touched JOIN temp.finalize_rewards AS rewards ON rewards.sequence_id = touched.sequence_id GROUP BY touched.id, rewards.agent_id"
+                edge_delta = "SELECT touched.src_id, touched.dst_id, touched.action_str, rewards.agent_id, COUNT(*), SUM(rewards.reward) FROM temp.touched_edges AS touched JOIN temp.finalize_rewards AS rewards ON rewards.sequence_id = touched.sequence_id GROUP BY touched.src_id, touched.dst_id, touched.action_str, rewards.agent_id"
+            self.conn.execute(f"INSERT INTO temp.node_delta (id, agent_id, visits, reward) {node_delta}")
+            self.conn.execute(f"INSERT INTO temp.edge_delta (src_id, dst_id, action_str, agent_id, visits, reward) {edge_delta}")
             self.conn.execute("""
                 UPDATE nodes
-                SET count = count + 1,
-                    total_reward = total_reward + ?,
-                    avg_reward = (total_reward + ?) / (count + 1)
-                WHERE agent_id = ?
-                  AND id IN (
-                      SELECT src_id FROM steps WHERE sequence_id = ?
-                      UNION
-                      SELECT dst_id FROM steps WHERE sequence_id = ?
-                  )
-            """, (reward, reward, agent_id, self.current_sequence_id, self.current_sequence_id))
-
-            # 2. Update EDGES for this agent involved in this sequence
+                SET (count, total_reward, avg_reward) = (
+                    SELECT nodes.count + delta.visits, nodes.total_reward + delta.reward, (nodes.total_reward + delta.reward) / (nodes.count + delta.visits)
+                    FROM temp.node_delta AS delta WHERE delta.id = nodes.id AND delta.agent_id = nodes.agent_id)
+                WHERE rowid IN (SELECT nodes.rowid FROM temp.node_delta AS delta CROSS JOIN nodes ON nodes.id = delta.id AND nodes.agent_id = delta.agent_id)
+            """)
             self.conn.execute("""
                 UPDATE edges
-                SET count = count + 1,
-                    total_reward = total_reward + ?,
-                    avg_reward = (total_reward + ?) / (count + 1)
-                WHERE agent_id = ?
-                  AND (src_id, dst_id, action_str) IN (
-                      SELECT src_id, dst_id, action_str FROM steps WHERE sequence_id = ?
-                  )
-            """, (reward, reward, agent_id, self.current_sequence_id))
+                SET (count, total_reward, avg_reward) = (
+                    SELECT edges.count + delta.visits, edges.total_reward + delta.reward, (edges.total_reward + delta.reward) / (edges.count + delta.visits)
+                    FROM temp.edge_delta AS delta
+                    WHERE delta.src_id = edges.src_id AND delta.dst_id = edges.dst_id AND delta.action_str = edges.action_str AND delta.agent_id = edges.agent_id)
+                WHERE rowid IN (SELECT edges.rowid FROM temp.edge_delta AS delta
+                                CROSS JOIN edges ON edges.src_id = delta.src_id AND edges.dst_id = delta.dst_id AND edges.action_str = delta.action_str AND edges.agent_id = delta.agent_id)
+            """)
 
-        self.conn.commit()
+            self.conn.execute("DELETE FROM temp.finalize_rewards")
+            self.conn.execute("DELETE FROM temp.touched_nodes")
+            self.conn.execute("DELETE FROM temp.touched_edges")
+            self.conn.execute("DELETE FROM temp.node_delta")
+            self.conn.execute("DELETE FROM temp.edge_delta")
+        self._pending_finalizations = []
+        self.save_indexes()  # Once per game (or batch) is often enough; anything newer is caught up from SQLite on load.
 
-    # --- ANALYTICS ---
+    # --- INDEXING ---
 
-    def find_similar_problems(self, step: StepInfo, limit=5):
-        cur = self.conn.cursor()
-        # Fetch ID as well so we can track lineage if needed
-        cur.execute("""
-            SELECT problem_description, description_embedding, reasoning_for_action 
-            FROM steps 
-            WHERE description_embedding IS NOT NULL 
+    def _index_path(self, agent_id):
+        return self.index_dir / f"{agent_id}.npz"
+
+    @staticmethod
+    def _payload(problem_description, reasoning_for_action):
+        # This is what find_similar_problems returns, kept in RAM next to each vector so searches never touch SQLite.
+        return {"problem_description": problem_description, "reasoning_for_action": reasoning_for_action}
+
+    def _index_add(self, agent_id, ids, embeddings, payloads):
+        index = self.indexes.get(agent_id)
+        if index is None:
+            dim = len(embeddings[0])
+            index = self.indexes[agent_id] = VectorIndex(dim, nlist=self.index_nlist, nprobe=self.index_nprobe, dtype=self.index_dtype)
+        index.add(ids, np.vstack(embeddings), payloads)
+        if index.needs_training():
+            index.train()
+        self._enforce_memory_cap(index)
+
+    def _enforce_memory_cap(self, index):
+        if self.index_max_bytes is None or index.nbytes <= self.index_max_bytes:
+            return
+        # Evict down to 90% of the cap so this doesn't run again on the very next step.
+        bytes_per_entry = index.nbytes / max(len(index), 1)
+        excess = index.nbytes - 0.9 * self.index_max_bytes
+        index.evict_oldest(int(np.ceil(excess / bytes_per_entry)))
+
+    def _load_indexes(self):
+        """Loads the saved indexes, then catches each one up with steps written since it was saved."""
+        agent_ids = [row[0] for row in self.conn.execute("SELECT DISTINCT src_agent_id FROM steps")]
+        max_step_id = self.conn.execute("SELECT COALESCE(MAX(id), -1) FROM steps").fetchone()[0]
+        for agent_id in agent_ids:
+            path = self._index_path(agent_id)
+            if path.exists():
+                index = VectorIndex.load(path)
+                # The database was replaced or truncated (the index is stale), or the index dtype setting changed
+                if index.max_id > max_step_id or index.dtype != self.index_dtype:
+                    self.rebuild_index(agent_id)
+                    continue
+                index.nprobe = self.index_nprobe
+                self.indexes[agent_id] = index
+                self._index_load_payloads(agent_id)
+            self._index_catch_up(agent_id)
+
+    def _index_load_payloads(self, agent_id):
+        """Payloads aren't saved with the index, so fill them back in from SQLite in one pass."""
+        index = self.indexes[agent_id]
+        rows = self.conn.execute("""
+            SELECT id, problem_description, reasoning_for_action
+            FROM steps
+            WHERE description_embedding IS NOT NULL
             AND action_verified = 1
             AND src_agent_id = ?
-        """, (step.src_agent_id, ))
-        rows = cur.fetchall()
-
-        if not rows: return []
-
-        valid_data = [] # Store metadata here
-        valid_vectors = [] # Store vectors here for numpy
-
-        for desc, blob, reasoning in rows:
-            if blob:
-                vec = np.frombuffer(blob, dtype=np.float32)
-                # MANUAL NORMALIZATION (L2) to ensure Dot Product == Cosine Sim
-                norm = np.linalg.norm(vec)
-                if norm > 0:
-                    vec = vec / norm
-                
-                valid_vectors.append(vec)
-                valid_data.append({"problem_description": desc, "reasoning_for_action": reasoning})
-
-        if not valid_vectors:
+            AND id <= ?
+        """, (agent_id, index.max_id)).fetchall()
+        index.set_payloads([row["id"] for row in rows], [self._payload(row["problem_description"], row["reasoning_for_action"]) for row in rows])
+        self._enforce_memory_cap(index)
+
+    def _index_catch_up(self, agent_id):
+        index = self.indexes.get(agent_id)
+        last_id = index.max_id if index is not None else -1
+        ids, embeddings, payloads = [], [], []
+        for step_id, blob, embedding_format, embedding_scale, desc, reasoning in self.conn.execute("""
+            SELECT id, description_embedding, embedding_format, embedding_scale, problem_description, reasoning_for_action
+            FROM steps
+            WHERE description_embedding IS NOT NULL
+            AND action_verified = 1
+            AND src_agent_id = ?
+            AND id > ?
+            ORDER BY id
+        """, (agent_id, last_id)):
+            ids.append(step_id)
+            embeddings.append(decode_embedding(blob, embedding_format, embedding_scale))
+            payloads.append(self._payload(desc, reasoning))
+        if ids:
+            self._index_add(agent_id, ids, embeddings, payloads)
+
+    def rebuild_index(self, agent_id=None, nlist=None):
+        """Rebuilds the vector index from SQLite, for one agent or all of them, and saves it."""
+        if agent_id is None:
+            agent_ids = [row[0] for row in self.conn.execute("SELECT DISTINCT src_agent_id FROM steps")]
+        else:
+            agent_ids = [agent_id]
+        for agent in agent_ids:
+            self.indexes.pop(agent, None)
+            self._index_catch_up(agent)
+            index = self.indexes.get(agent)
+            if index is not None:
+                index.train(nlist or self.index_nlist)
+        self.save_indexes()
+
+    def save_indexes(self):
+        if not self.indexes:
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for agent_id, index in self.indexes.items():
+            index.save(self._index_path(agent_id))
+
+    # --- ANALYTICS ---
+
+    def get_state_text(self, node_id):
+        """The display text of an interned state id (as stored in nodes, edges and steps), or None if unknown."""
+        self.flush()
+        row = self.conn.execute("SELECT text FROM states WHERE id = ?", (node_id,)).fetchone()
+        return row["text"] if row is not None else None
+
+    def find_similar_problems(self, step: StepInfo, limit=5):
+        """
+        Top matches come straight from the in-memory index: one matrix-vector product plus an argpartition, no SQLite reads.
+        Returns copies of the index's payloads, so callers may change them freely.
+        """
+        index = self.indexes.get(step.src_agent_id)
+        if index is None or step.description_embedding is None:
             return []
+        _, _, payloads = index.search(step.description_embedding, limit)
+        return [dict(payload) for payload in payloads]
 
-        emb_matrix = np.vstack(valid_vectors)
-        
-        # Normalize the query vector too
-        query_norm = np.linalg.norm(step.description_embedding)
-        if query_norm > 0:
-            description_embedding_normalized = step.description_embedding / query_norm
+    def find_similar_problems_batch(self, steps: List[StepInfo], limit=5, agent_ids=None):
+        """
+        Batched find_similar_problems: queries are grouped by agent and each group is answered with a single GEMM.
+        agent_ids optionally overrides each query's filter (default: its src_agent_id); an entry may be one agent id
+        or a list of them, in which case the memories of all those agents are searched and merged by score.
+        Returns one result list per step, in input order.
+        """
+        if agent_ids is None:
+            agent_ids = [step.src_agent_id for step in steps]
+        filters = [[agents] if isinstance(agents, str) else list(agents) for agents in agent_ids]
 
-        scores = np.dot(emb_matrix, description_embedding_normalized)
+        # agent_id -> positions of the queries that search it
+        groups = {}
+        for position, (step, agents) in enumerate(zip(steps, filters)):
+            if step.description_embedding is None:
+                continue
+            for agent_id in agents:
+                if agent_id in self.indexes:
+                    groups.setdefault(agent_id, []).append(position)
 
-        # Get top K indices
-        k = min(limit, len(scores))
-        top_indices = np.argsort(scores)[-k:][::-1]
+        # position -> [(score, payload), ...] gathered across the agents it searches
+        hits = [[] for _ in steps]
+        for agent_id, positions in groups.items():
+            queries = np.vstack([steps[position].description_embedding for position in positions])
+            for position, (_, scores, payloads) in zip(positions, self.indexes[agent_id].search_batch(queries, limit)):
+                hits[position].extend(zip(scores.tolist(), payloads))
 
         results = []
-        for idx in top_indices:
-            # Use the index to grab the data from the list
-            results.append(valid_data[idx])
-            
-        return results
\ No newline at end of file
+        for position_hits, agents in zip(hits, filters):
+            if len(agents) > 1:  # Each agent's hits come best-first already; merged ones need sorting
+                position_hits = sorted(position_hits, key=lambda hit: hit[0], reverse=True)[:limit]
+            results.append([dict(payload) for _, payload in position_hits])  # Copies, as in find_similar_problems
+        return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance commands for a KnowledgeGraph database.")
+    parser.add_argument("db_path", help="Path to the graph database, e.g. graph.db")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rebuild the vector index from the steps table.")
+    parser.add_argument("--agent", default=None, help="Only rebuild the index for this src_agent_id.")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of IVF lists (default: sqrt of the number of vectors).")
+    args = parser.parse_args()
+
+    graph = KnowledgeGraph(db_path=args.db_path, index_nlist=args.nlist)
+    if args.rebuild_index:
+        graph.rebuild_index(args.agent, args.nlist)
+        for agent_id, index in graph.indexes.items():
+            print(f"{agent_id}: {len(index)} vectors, {len(index.lists)} lists")
@@ -0,0 +1,428 @@
+from pathlib import Path
+import logging
+# 3rd Party
+import numpy as np
+
+logger = logging.getLogger("IndexClass")
+
+IVF_MIN_TRAIN = 1024  # Below this many vectors a flat scan beats the coarse quantizer, so the index stays untrained.
+KMEANS_ITERS = 10
+KMEANS_MAX_SAMPLE = 100_000
+SEARCH_CHUNK = 65536  # Rows per block when assigning or scanning large matrices
+DECODE_CHUNK = 8192  # Rows dequantized at a time when scoring reduced-precision lists, so the float32 copy stays in cache
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def normalize(vectors):
+    """L2-normalises a vector or each row of a matrix so that dot product == cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        norm = np.linalg.norm(vectors)
+        return vectors / norm if norm > 0 else vectors
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """Returns the indices of the k highest scores, best first, without a full sort."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def quantize(vectors, dtype):
+    """
+    Encodes float32 rows as dtype. Returns (codes, scales): int8 is symmetric per row, code * scale ~= value,
+    with scale = max|value| / 127; float32 and float16 need no scale (None).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dtype = np.dtype(dtype)
+    if dtype != np.int8:
+        return vectors.astype(dtype), None
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    safe = np.where(scales > 0, scales, 1.0)
+    codes = np.rint(vectors / safe[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes, scales=None):
+    """Inverse of quantize(): float32 rows."""
+    vectors = codes.astype(np.float32)
+    if scales is not None:
+        vectors *= np.asarray(scales, dtype=np.float32)[..., None]
+    return vectors
+
+
+def payload_size(payload):
+    """Rough byte size of a payload, counting the text it holds."""
+    if isinstance(payload, dict):
+        return sum(len(value) for value in payload.values() if isinstance(value, str))
+    if isinstance(payload, str):
+        return len(payload)
+    return 0
+
+
+def kmeans(vectors, k, iters=KMEANS_ITERS, seed=0):
+    """Spherical k-means. Returns (k, dim) unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_MAX_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_MAX_SAMPLE, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[nonempty] = normalize(sums)
+        # Empty clusters get reseeded from random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class InvertedList:
+    """
+    A contiguous, growable matrix of vectors plus parallel arrays of ids and payloads (any per-row metadata).
+    Capacity doubles, so appends are amortised O(1).
+    Vectors are held as dtype (see VECTOR_DTYPES); int8 rows carry a per-row scale.
+    """
+    def __init__(self, dim, capacity=64, dtype="float32"):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.vectors = np.empty((capacity, dim), dtype=self.dtype)
+        self.scales = np.empty(capacity, dtype=np.float32) if self.dtype == np.int8 else None
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.payloads = np.empty(capacity, dtype=object)
+        self.size = 0
+
+    def _reserve(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.empty((capacity, self.dim), dtype=self.dtype)
+        ids = np.empty(capacity, dtype=np.int64)
+        payloads = np.empty(capacity, dtype=object)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids[:self.size] = self.ids[:self.size]
+        payloads[:self.size] = self.payloads[:self.size]
+        self.vectors, self.ids, self.payloads = vectors, ids, payloads
+        if self.scales is not None:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:self.size] = self.scales[:self.size]
+            self.scales = scales
+
+    def append(self, ids, vectors, payloads=None, scales=None):
+        """
+        Appends float32 rows (quantized here) and returns the row number of the first one.
+        Rows already in this list's dtype can be passed as codes with their scales instead, e.g. when loading.
+        """
+        start = self.size
+        self._reserve(start + len(ids))
+        if scales is None and (vectors.dtype != self.dtype or self.scales is not None):
+            vectors, scales = quantize(vectors, self.dtype)
+        self.vectors[start:start + len(ids)] = vectors
+        if self.scales is not None:
+            self.scales[start:start + len(ids)] = scales
+        self.ids[start:start + len(ids)] = ids
+        if payloads is not None:
+            self.payloads[start:start + len(ids)] = payloads
+        self.size += len(ids)
+        return start
+
+    def remove(self, row):
+        """Swap-removes a row. Returns the id that moved into its place, or None if it was the last row."""
+        last = self.size - 1
+        moved_id = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            if self.scales is not None:
+                self.scales[row] = self.scales[last]
+            self.ids[row] = self.ids[last]
+            self.payloads[row] = self.payloads[last]
+            moved_id = int(self.ids[row])
+        self.payloads[last] = None
+        self.size -= 1
+        return moved_id
+
+    def matrix(self, start=0, stop=None):
+        """Rows start:stop as float32; a view, not a copy, when the list is float32."""
+        stop = self.size if stop is None else stop
+        if self.dtype == np.float32:
+            return self.vectors[start:stop]
+        return dequantize(self.vectors[start:stop], None if self.scales is None else self.scales[start:stop])
+
+    def scores(self, query):
+        if self.dtype == np.float32:
+            return self.vectors[:self.size] @ query
+        # Reduced precision: dequantize a cache-sized block at a time and hand it to BLAS
+        scores = np.empty(self.size, dtype=np.float32)
+        for start in range(0, self.size, DECODE_CHUNK):
+            stop = min(start + DECODE_CHUNK, self.size)
+            block = self.vectors[start:stop].astype(np.float32)
+            scores[start:stop] = block @ query
+            if self.scales is not None:
+                scores[start:stop] *= self.scales[start:stop]
+        return scores
+
+
+class VectorIndex:
+    """
+    Inverted-file (IVF) index over L2-normalised float32 vectors keyed by integer ids.
+    Vectors are bucketed by their nearest centroid, and a query only scans the nprobe closest buckets.
+    nprobe is the recall-vs-latency knob: nprobe >= nlist is an exact search.
+    Until the index is trained (see train()), everything lives in one list and search is an exact flat scan.
+    dtype ("float32", "float16" or "int8") is how the vectors are held in memory; centroids and queries stay float32.
+    """
+    def __init__(self, dim, nlist=None, nprobe=8, dtype="float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.dim = dim
+        self.nlist = nlist  # None = pick sqrt(N) when trained
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.centroids = None
+        self.lists = [InvertedList(dim, dtype=dtype)]
+        self.slots = {}  # id -> (list_no, row)
+        self.max_id = -1  # Highest id ever added, used to catch up with rows written after the last save
+        self.trained_size = 0  # Number of vectors at the last train(), used to decide when to retrain
+        self.payload_bytes = 0  # Kept incrementally so the memory cap can be checked on every add
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by live entries: vector (and int8 scale), id and payload pointer per row, plus the payload text."""
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize + (4 if self.dtype == "int8" else 0) + 8 + 8
+        return len(self) * row_bytes + self.payload_bytes
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def needs_training(self):
+        """True once there is enough data for IVF, and again each time the index doubles in size since the last training."""
+        return len(self) >= IVF_MIN_TRAIN and len(self) >= 2 * self.trained_size
+
+    def _assign(self, vectors):
+        if not self.trained:
+            return np.zeros(len(vectors), dtype=np.int64)
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), SEARCH_CHUNK):
+            block = vectors[start:start + SEARCH_CHUNK]
+            assign[start:start + SEARCH_CHUNK] = np.argmax(block @ self.centroids.T, axis=1)
+        return assign
+
+    def add(self, ids, vectors, payloads=None):
+        """Adds vectors (normalised here) under the given ids, with optional per-vector payloads."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        if not len(ids):
+            return
+        if payloads is not None:
+            payload_array = np.empty(len(ids), dtype=object)
+            payload_array[:] = list(payloads)
+            payloads = payload_array
+            self.payload_bytes += sum(payload_size(payload) for payload in payloads)
+        assign = self._assign(vectors)
+        for list_no in np.unique(assign):
+            mask = assign == list_no
+            block_ids = ids[mask]
+            start = self.lists[list_no].append(block_ids, vectors[mask], None if payloads is None else payloads[mask])
+            for offset, vec_id in enumerate(block_ids.tolist()):
+                self.slots[vec_id] = (int(list_no), start + offset)
+        self.max_id = max(self.max_id, int(ids.max()))
+
+    def remove(self, ids):
+        """Removes ids from the index. Unknown ids are ignored."""
+        for vec_id in np.asarray(ids, dtype=np.int64).reshape(-1).tolist():
+            slot = self.slots.pop(vec_id, None)
+            if slot is None:
+                continue
+            list_no, row = slot
+            self.payload_bytes -= payload_size(self.lists[list_no].payloads[row])
+            moved_id = self.lists[list_no].remove(row)
+            if moved_id is not None:
+                self.slots[moved_id] = (list_no, row)
+
+    def set_payloads(self, ids, payloads):
+        """Attaches payloads to vectors already in the index (e.g. after load()). Unknown ids are ignored."""
+        for vec_id, payload in zip(ids, payloads):
+            slot = self.slots.get(vec_id)
+            if slot is None:
+                continue
+            list_no, row = slot
+            inv = self.lists[list_no]
+            self.payload_bytes += payload_size(payload) - payload_size(inv.payloads[row])
+            inv.payloads[row] = payload
+
+    def evict_oldest(self, count):
+        """Removes the count lowest ids (the oldest entries when ids are assigned in insertion order)."""
+        if count <= 0:
+            return
+        ids = np.fromiter(self.slots.keys(), dtype=np.int64, count=len(self.slots))
+        count = min(count, len(ids))
+        self.remove(np.partition(ids, count - 1)[:count])
+
+    def vectors(self):
+        """Returns (ids, vectors) for everything in the index, vectors as float32."""
+        ids = np.concatenate([inv.ids[:inv.size] for inv in self.lists])
+        vectors = np.concatenate([inv.matrix() for inv in self.lists])
+        return ids, vectors
+
+    def train(self, nlist=None):
+        """(Re)clusters the index with k-means and redistributes every vector. Falls back to flat if there is too little data."""
+        ids, vectors = self.vectors()
+        payloads = np.concatenate([inv.payloads[:inv.size] for inv in self.lists])
+        nlist = nlist or self.nlist or max(1, int(np.sqrt(len(ids))))
+        self.centroids = None
+        self.lists = [InvertedList(self.dim, dtype=self.dtype)]
+        self.slots = {}
+        self.payload_bytes = 0
+        if len(ids) >= max(IVF_MIN_TRAIN, nlist) and nlist > 1:
+            self.centroids = kmeans(vectors, nlist)
+            self.lists = [InvertedList(self.dim, dtype=self.dtype) for _ in range(nlist)]
+            logger.info(f"Trained IVF index with {nlist} lists over {len(ids)} vectors.")
+        max_id = self.max_id
+        self.add(ids, vectors, payloads)
+        self.max_id = max_id
+        self.trained_size = len(ids)
+
+    def _probe(self, query):
+        """Returns the list numbers to scan for this query."""
+        if not self.trained or self.nprobe >= len(self.lists):
+            return range(len(self.lists))
+        return top_k(self.centroids @ query, self.nprobe)
+
+    def search(self, query, k=5):
+        """Returns (ids, scores, payloads) of the k most similar vectors, best first."""
+        if not self.slots:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), []
+        query = normalize(query)
+        probed = [self.lists[list_no] for list_no in self._probe(query)]
+        if len(probed) == 1:  # Common flat case: score the list in place, no concatenation copies
+            inv = probed[0]
+            scores = inv.scores(query)
+            best = top_k(scores, k)
+            return inv.ids[best], scores[best], inv.payloads[best].tolist()
+        scores = np.concatenate([inv.scores(query) for inv in probed])
+        ids = np.concatenate([inv.ids[:inv.size] for inv in probed])
+        payloads = np.concatenate([inv.payloads[:inv.size] for inv in probed])
+        best = top_k(scores, k)
+        return ids[best], scores[best], payloads[best].tolist()
+
+    def search_batch(self, queries, k=5):
+        """
+        Answers many queries at once. Returns a list of (ids, scores, payloads), one per query, in input order.
+        Flat: one matrix-matrix product over every vector and a row-wise argpartition.
+        IVF: one matrix-matrix product per probed list, over just the queries that probe it, then a row-wise merge.
+        """
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if not self.slots:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), []) for _ in range(len(queries))]
+        if not self.trained or self.nprobe >= len(self.lists):
+            return self._search_batch_flat(queries, k)
+        return self._search_batch_ivf(queries, k)
+
+    @staticmethod
+    def _top_k_rows(scores, k):
+        """Row-wise top_k: returns (columns, scores), each (Q, k), best first."""
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    def _search_batch_flat(self, queries, k):
+        populated = [inv for inv in self.lists if inv.size]
+        vectors = np.concatenate([inv.matrix() for inv in populated])
+        ids = np.concatenate([inv.ids[:inv.size] for inv in populated])
+        payloads = np.concatenate([inv.payloads[:inv.size] for inv in populated])
+        best, best_scores = self._top_k_rows(queries @ vectors.T, k)
+        return [(ids[row], row_scores, payloads[row].tolist()) for row, row_scores in zip(best, best_scores)]
+
+    def _search_batch_ivf(self, queries, k):
+        probes = np.argpartition(queries @ self.centroids.T, -self.nprobe, axis=1)[:, -self.nprobe:]
+
+        # Each query gets nprobe slots of k candidates; a slot is filled from the list it probes.
+        num_slots = self.nprobe * k
+        cand_scores = np.full((len(queries), num_slots), -np.inf, dtype=np.float32)
+        cand_lists = np.zeros((len(queries), num_slots), dtype=np.int64)
+        cand_rows = np.zeros((len(queries), num_slots), dtype=np.int64)
+        for list_no in np.unique(probes):
+            inv = self.lists[list_no]
+            if not inv.size:
+                continue
+            query_rows, probe_slots = np.nonzero(probes == list_no)
+            rows, row_scores = self._top_k_rows(queries[query_rows] @ inv.matrix().T, k)
+            columns = probe_slots[:, None] * k + np.arange(rows.shape[1])
+            cand_scores[query_rows[:, None], columns] = row_scores
+            cand_lists[query_rows[:, None], columns] = list_no
+            cand_rows[query_rows[:, None], columns] = rows
+
+        best, best_scores = self._top_k_rows(cand_scores, k)
+        results = []
+        for query_row, (row_best, row_scores) in enumerate(zip(best, best_scores)):
+            keep = np.isfinite(row_scores)  # Empty slots only surface when the probed lists hold fewer than k vectors
+            row_best, row_scores = row_best[keep], row_scores[keep]
+            hits = [(self.lists[list_no], row) for list_no, row in zip(cand_lists[query_row, row_best].tolist(), cand_rows[query_row, row_best].tolist())]
+            ids = np.array([inv.ids[row] for inv, row in hits], dtype=np.int64)
+            results.append((ids, row_scores, [inv.payloads[row] for inv, row in hits]))
+        return results
+
+    # --- PERSISTENCE ---
+
+    def save(self, path):
+        """
+        Saves vectors (in the index's dtype, with int8 scales), ids and centroids.
+        Payloads are not saved; the owner reloads them from its own store.
+        """
+        ids = np.concatenate([inv.ids[:inv.size] for inv in self.lists])
+        vectors = np.concatenate([inv.vectors[:inv.size] for inv in self.lists])
+        scales = np.concatenate([inv.scales[:inv.size] for inv in self.lists]) if self.dtype == "int8" else np.empty(0, dtype=np.float32)
+        list_nos = np.concatenate([np.full(inv.size, i, dtype=np.int64) for i, inv in enumerate(self.lists)])
+        tmp_path = Path(str(path) + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            ids=ids,
+            vectors=vectors,
+            scales=scales,
+            list_nos=list_nos,
+            centroids=self.centroids if self.trained else np.empty((0, self.dim), dtype=np.float32),
+            meta=np.array([self.dim, self.nlist or 0, self.nprobe, self.max_id, self.trained_size], dtype=np.int64),
+        )
+        tmp_path.replace(path)  # Atomic, so a crash mid-save never leaves a torn index behind
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dim, nlist, nprobe, max_id, trained_size = data["meta"].tolist()
+            ids, vectors, list_nos = data["ids"], data["vectors"], data["list_nos"]
+            scales = data["scales"] if "scales" in data.files and len(data["scales"]) else None  # Indexes saved before dtypes existed have no scales
+            index = cls(dim, nlist=nlist or None, nprobe=nprobe, dtype=vectors.dtype.name)
+            if len(data["centroids"]):
+                index.centroids = data["centroids"]
+                index.lists = [InvertedList(dim, dtype=index.dtype) for _ in range(len(index.centroids))]
+        for list_no in np.unique(list_nos):
+            mask = list_nos == list_no
+            block_ids = ids[mask]
+            start = index.lists[list_no].append(block_ids, vectors[mask], scales=None if scales is None else scales[mask])
+            for offset, vec_id in enumerate(block_ids.tolist()):
+                index.slots[vec_id] = (int(list_no), start + offset)
+        index.max_id = max_id
+        index.trained_size = trained_size
+        return index
@@ -1,11 +1,63 @@
 from pathlib import Path
+import math
 import os
 import logging
 
 logger = logging.getLogger("LLMClass")
 
+class TokenUsage:
+    """
+    Running totals of the token counts reported by a provider, split into input tokens served from the provider's
+    prompt cache (cached) and input tokens it had to process. Take a copy() before a game and since() after it for
+    per-game numbers; report() turns the cached share into money and prompt-processing time saved.
+    """
+    # Rough defaults, set them for the model in use: list price per million input tokens, what a cached input token
+    # costs relative to that, and how fast the provider processes uncached prompt tokens.
+    input_price_per_million = 2.50
+    cached_price_factor = 0.5
+    prefill_tokens_per_second = 5000
+
+    def __init__(self, calls=0, prompt_tokens=0, cached_tokens=0, completion_tokens=0):
+        self.calls = calls
+        self.prompt_tokens = prompt_tokens  # All input tokens, cached ones included
+        self.cached_tokens = cached_tokens
+        self.completion_tokens = completion_tokens
+
+    def add(self, usage):
+        """Adds an OpenAI-style usage object (prompt_tokens, completion_tokens, prompt_tokens_details.cached_tokens)."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.record(usage.prompt_tokens or 0, usage.completion_tokens or 0, (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0)
+
+    def record(self, prompt_tokens, completion_tokens, cached_tokens=0):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+
+    def copy(self):
+        return TokenUsage(self.calls, self.prompt_tokens, self.cached_tokens, self.completion_tokens)
+
+    def since(self, earlier):
+        return TokenUsage(self.calls - earlier.calls, self.prompt_tokens - earlier.prompt_tokens,
+                          self.cached_tokens - earlier.cached_tokens, self.completion_tokens - earlier.completion_tokens)
+
+    def report(self, input_price_per_million=None, cached_price_factor=None, prefill_tokens_per_second=None):
+        price = (self.input_price_per_million if input_price_per_million is None else input_price_per_million) / 1_000_000
+        factor = self.cached_price_factor if cached_price_factor is None else cached_price_factor
+        rate = self.prefill_tokens_per_second if prefill_tokens_per_second is None else prefill_tokens_per_second
+        uncached = self.prompt_tokens - self.cached_tokens
+        return {"calls": self.calls, "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens, "uncached_tokens": uncached,
+                "completion_tokens": self.completion_tokens, "cached_share": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "input_cost": (uncached + self.cached_tokens * factor) * price, "cost_saved": self.cached_tokens * (1 - factor) * price,
+                "prefill_seconds_saved": self.cached_tokens / rate}
+
+
 class BaseLLM:
     """Abstract base class for Large Language Models."""
+    max_concurrency = 8  # Most ainvoke calls in flight at once, per model object
+
     def load(self):
         """Loads the model using the given model name."""
         raise NotImplementedError("Subclasses should implement this method.")
@@ -14,13 +66,28 @@ class BaseLLM:
         """Unloads the model and frees up associated resources."""
         raise NotImplementedError("Subclasses should implement this method.")
 
-    def invoke(self, prompt: str, image_paths: list[str] = None, temperature: float = 1.0) -> str:
-        """Processes a prompt with optional images and returns the full response."""
+    def invoke(self, prompt: str, image_paths: list[str] = None, temperature: float = 1.0, system_prompt: str = None) -> str:
+        """Processes a prompt with optional images and returns the full response. system_prompt, if given, goes first as a system message."""
         raise NotImplementedError("Subclasses should implement this method.")
     
-    def stream(self, prompt: str, image_paths: list[str] = None, temperature: float = 1.0):
+    def stream(self, prompt: str, image_paths: list[str] = None, temperature: float = 1.0, system_prompt: str = None):
         """Processes a prompt with optional images and yields the response stream."""
         raise NotImplementedError("Subclasses should implement this method.")
+
+    async def ainvoke(self, prompt: str, image_paths: list[str] = None, **kwargs) -> str:
+        """Async invoke. By default the blocking invoke runs in a worker thread; backends with an async client override this."""
+        import asyncio
+        async with self._semaphore():
+            return await asyncio.to_thread(self.invoke, prompt, image_paths or [], **kwargs)
+
+    def _semaphore(self):
+        """Bounds concurrent ainvoke calls to max_concurrency. One semaphore per event loop, since they can't be shared."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_semaphore_loop", None) is not loop:
+            self._semaphore_loop = loop
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphore
     
     @staticmethod
     def get_image_bytes(path: str):
@@ -115,10 +182,15 @@ class LMStudioLLM(BaseLLM):
         self.loaded = False
         logger.info("LM Studio model unloaded.")
 
-    def prepare_chat(self, prompt: str, image_paths: list[str], attached_image_path: str = None):
-        """Helper to create a Chat object if images are provided."""
+    def prepare_chat(self, prompt: str, image_paths: list[str], attached_image_path: str = None, system_prompt: str = None):
+        """Helper to create a Chat object if images or a system prompt are provided."""
         if not image_paths and not attached_image_path:
-            return prompt, []
+            if system_prompt is None:
+                return prompt, []
+            import lmstudio as lms
+            chat = lms.Chat(system_prompt)
+            chat.add_user_message(prompt)
+            return chat, []
 
         if attached_image_path:
             image_paths.append(attached_image_path)
@@ -156,7 +228,7 @@ class LMStudioLLM(BaseLLM):
 
         final_prompt = self._build_image_prompt(prompt, valid_file_names, attached_image_path)
         
-        chat = lms.Chat()
+        chat = lms.Chat(system_prompt) if system_prompt is not None else lms.Chat()
         chat.add_user_message(final_prompt, images=image_handles)
         return chat, temp_files_to_delete
 
@@ -167,9 +239,10 @@ class LMStudioLLM(BaseLLM):
                     os.remove(f_path)
             except: pass
 
-    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0):
+    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
+        temp_files = []
         try:
-            chat_input, temp_files = self.prepare_chat(prompt, image_paths, attached_image_path)
+            chat_input, temp_files = self.prepare_chat(prompt, image_paths, attached_image_path, system_prompt)
             response = self.model.respond(chat_input, config={"temperature": temperature})
             return response.content
         except Exception as e:
@@ -181,9 +254,10 @@ class LMStudioLLM(BaseLLM):
                 time.sleep(0.1)
                 self._cleanup_temp_files(temp_files)
     
-    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0):
+    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
+        temp_files = []
         try:
-            chat_input, temp_files = self.prepare_chat(prompt, image_paths, attached_image_path)
+            chat_input, temp_files = self.prepare_chat(prompt, image_paths, attached_image_path, system_prompt)
             for fragment in self.model.respond_stream(chat_input, config={"temperature": temperature}):
                 yield fragment.content
         except Exception as e:
@@ -196,9 +270,12 @@ class LMStudioLLM(BaseLLM):
                 self._cleanup_temp_files(temp_files)
 
 class OpenAILLM(BaseLLM):
-    def __init__(self, model_name, api_key=None):
+    def __init__(self, model_name, api_key=None, base_url=None, max_connections=None):
         self.model_name = model_name
         self.api_key = api_key
+        self.base_url = base_url  # Any OpenAI-compatible server, e.g. a local stub for load tests
+        self.max_connections = max_connections  # Size of the async client's HTTP connection pool (None = library default)
+        self.usage = TokenUsage()
         self.loaded = False
 
     def load(self):
@@ -206,10 +283,18 @@ class OpenAILLM(BaseLLM):
         try:
             logger.info(f"Loading OpenAI model: {self.model_name}")
             import openai
+            client_kwargs = {}
             if self.api_key:
-                self.client = openai.OpenAI(api_key=self.api_key)
-            else:
-                self.client = openai.OpenAI() # Uses env var
+                client_kwargs["api_key"] = self.api_key  # Otherwise uses env var
+            if self.base_url:
+                client_kwargs["base_url"] = self.base_url
+            self.client = openai.OpenAI(**client_kwargs)
+            async_kwargs = dict(client_kwargs)
+            if self.max_connections:
+                import httpx
+                limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+                async_kwargs["http_client"] = openai.DefaultAsyncHttpxClient(limits=limits)
+            self.async_client = openai.AsyncOpenAI(**async_kwargs)
             # Check for vision; not as straightforward as LM Studio
             model_name_lower = self.model_name.lower()
             openai_vision_keywords = ["vision", "gpt-4o", "gpt-5", "gpt-4.1", "o3", "turbo"]
@@ -229,9 +314,11 @@ class OpenAILLM(BaseLLM):
         self.loaded = False
         logger.info("OpenAI model unloaded.")
 
-    def prepare_chat(self, prompt: str, image_paths: list[str], attached_image_path: str = None):
+    def prepare_chat(self, prompt: str, image_paths: list[str], attached_image_path: str = None, system_prompt: str = None):
+        # A fixed system prompt first keeps the start of every request identical, so the provider's prompt cache can hit
+        system = [{"role": "system", "content": system_prompt}] if system_prompt is not None else []
         if not image_paths and not attached_image_path:
-            return [{"role": "user", "content": prompt}]
+            return system + [{"role": "user", "content": prompt}]
 
         if attached_image_path:
             image_paths.append(attached_image_path)
@@ -260,25 +347,42 @@ class OpenAILLM(BaseLLM):
         content_list.append({"type": "text", "text": final_prompt})
         content_list.extend(input_images)
         
-        return [{"role": "user", "content": content_list}]
+        return system + [{"role": "user", "content": content_list}]
 
-    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, response_format="text"):
+    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None):
         try:
-            messages = self.prepare_chat(prompt, image_paths, attached_image_path)
+            messages = self.prepare_chat(prompt, image_paths, attached_image_path, system_prompt)
             response = self.client.chat.completions.parse(
                 model=self.model_name,
                 messages=messages,
                 temperature=temperature,
                 response_format=response_format
             )
+            self.usage.add(response.usage)
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"OpenAI Invoke Error: {e}")
             return None
 
-    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0):
+    async def ainvoke(self, prompt, image_paths=None, attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None):
+        try:
+            messages = self.prepare_chat(prompt, image_paths or [], attached_image_path, system_prompt)
+            async with self._semaphore():
+                response = await self.async_client.chat.completions.parse(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    response_format=response_format
+                )
+            self.usage.add(response.usage)
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI Async Invoke Error: {e}")
+            return None
+
+    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
         try:
-            messages = self.prepare_chat(prompt, image_paths, attached_image_path)
+            messages = self.prepare_chat(prompt, image_paths, attached_image_path, system_prompt)
             stream = self.client.chat.completions.create(
                 model=self.model_name,
                 messages=messages,
@@ -290,4 +394,341 @@ class OpenAILLM(BaseLLM):
                     yield chunk.choices[0].delta.content
         except Exception as e:
             logger.error(f"OpenAI Stream Error: {e}")
-            return None
\ No newline at end of file
+            return None
+
+# --- MOCK BACKEND ---
+# Offline stand-in for a model. Structured responses are filled in from the response_format's JSON schema; integers
+# are legal action ids read from the prompt, so a game driven by the mock always moves forward.
+
+def legal_action_ids(prompt):
+    """The ids of the "[id] ..." lines of prompt that aren't marked (Invalid), the same rule as GameEngine.get_legal_actions."""
+    ids = []
+    for line in prompt.split("\n"):
+        if line.startswith("[") and "(Invalid)" not in line:
+            end_index = line.find("]")
+            if line[1:end_index].isdigit():
+                ids.append(int(line[1:end_index]))
+    return ids
+
+def fill_schema(schema, prompt, rng, text_length=120):
+    """A value that validates against a JSON schema (the subset pydantic emits for flat models)."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: fill_schema(prop, prompt, rng, text_length) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fill_schema(schema.get("items", {}), prompt, rng, text_length)]
+    if kind == "integer":
+        ids = legal_action_ids(prompt)
+        return rng.choice(ids) if ids else 0
+    if kind == "number":
+        return rng.random()
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return ("mock " * (text_length // 5 + 1))[:text_length]
+
+class MockLLM(BaseLLM):
+    """
+    A model that answers locally, for load tests of the decision loop without a network. Every call waits a latency
+    drawn from latency_distribution ("fixed", "uniform", "normal", "lognormal" or "exponential", with mean or median
+    latency and spread latency_spread), fails (returns None, like the real backends) with probability failure_rate,
+    and otherwise returns text of response_chars characters per string field; response_chars may be a (low, high) range.
+    ainvoke sleeps on the event loop instead of in a thread, up to max_concurrency calls at once like the real backends.
+    Token usage is estimated at 4 chars a token.
+    """
+    LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+    def __init__(self, model_name="mock", latency=0.0, latency_distribution="fixed", latency_spread=0.0, failure_rate=0.0, response_chars=120, seed=None):
+        import random
+        if latency_distribution not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of {self.LATENCY_DISTRIBUTIONS}")
+        self.model_name = model_name
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.failure_rate = failure_rate
+        self.response_chars = response_chars
+        self.rng = random.Random(seed)
+        self.usage = TokenUsage()
+        self.calls = 0
+        self.failures = 0
+        self._schemas = {}  # Building a pydantic schema is slow, so it's done once per model
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        return True
+
+    def unload(self):
+        self.loaded = False
+
+    def sample_latency(self):
+        if self.latency_distribution == "uniform":
+            return max(0.0, self.rng.uniform(self.latency - self.latency_spread, self.latency + self.latency_spread))
+        if self.latency_distribution == "normal":
+            return max(0.0, self.rng.gauss(self.latency, self.latency_spread))
+        if self.latency_distribution == "lognormal":  # latency is the median, latency_spread the sigma of its log; a long right tail like real APIs
+            return self.rng.lognormvariate(math.log(self.latency), self.latency_spread) if self.latency > 0 else 0.0
+        if self.latency_distribution == "exponential":
+            return self.rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        return self.latency
+
+    def respond(self, prompt, response_format="text", system_prompt=None):
+        """The response to a call, or None for a simulated failure. Doesn't wait."""
+        import json
+        self.calls += 1
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            logger.error("Mock Invoke Error: simulated failure")
+            return None
+        chars = self.rng.randint(*self.response_chars) if isinstance(self.response_chars, (tuple, list)) else self.response_chars
+        if response_format == "text":
+            response = fill_schema({"type": "string"}, prompt, self.rng, chars)
+        else:
+            schema = self._schemas.get(response_format)
+            if schema is None:
+                schema = self._schemas[response_format] = response_format.model_json_schema()
+            response = json.dumps(fill_schema(schema, prompt, self.rng, chars))
+        prompt_chars = len(prompt) + len(system_prompt or "")
+        self.usage.record(prompt_chars // 4, len(response) // 4)
+        return response
+
+    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None):
+        import time
+        time.sleep(self.sample_latency())
+        return self.respond(prompt, response_format, system_prompt)
+
+    async def ainvoke(self, prompt, image_paths=None, attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None):
+        import asyncio
+        async with self._semaphore():
+            await asyncio.sleep(self.sample_latency())
+            return self.respond(prompt, response_format, system_prompt)
+
+    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
+        response = self.invoke(prompt, image_paths, attached_image_path, temperature, system_prompt=system_prompt)
+        if response is None:
+            return
+        for word in response.split(" "):
+            yield word + " "
+
+class CachedLLM(BaseLLM):
+    """
+    Wraps another BaseLLM with a persistent response cache in SQLite, so a prompt that was already answered costs a
+    local lookup instead of a round trip. Entries are keyed by model name, system prompt, prompt, temperature and
+    response_format schema; prompts with images are never cached. The cache is bounded by max_entries and max_bytes (least recently
+    used entries go first) and entries older than ttl seconds are ignored and dropped. Failed calls (None) are not
+    stored. Set enabled=False, or pass use_cache=False to invoke, to go straight to the wrapped model.
+    """
+    def __init__(self, llm, db_path="llm_cache.db", max_entries=100_000, max_bytes=512 * 1024 * 1024, ttl=None, enabled=True):
+        import threading
+        self.llm = llm
+        self.db_path = str(db_path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self._touched = {}  # key -> last use time, written back in batches rather than on every hit
+        self._prefixes = {}
+        self._lock = threading.Lock()  # The connection is shared by whatever threads call invoke
+        self.conn = None
+        self._open()
+
+    def _open(self):
+        """Opens (or reopens, after close) the cache database."""
+        import sqlite3
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Losing the last few entries in a crash only costs a few re-asks
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        self.conn.commit()
+        self._entries, self._bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    @property
+    def model_name(self):
+        return getattr(self.llm, "model_name", None)
+
+    @property
+    def loaded(self):
+        return getattr(self.llm, "loaded", False)
+
+    @property
+    def usage(self):
+        return getattr(self.llm, "usage", None)  # Hits cost no tokens, so the wrapped model's count is the whole bill
+
+    def load(self):
+        if self.conn is None:  # Closed by unload()
+            with self._lock:
+                self._open()
+        return self.llm.load()
+
+    def unload(self):
+        self.close()
+        return self.llm.unload()
+
+    def _key_prefix(self, temperature, response_format):
+        # Everything in the key except the prompt. Pydantic models are keyed by their JSON schema, so changing a field
+        # invalidates their entries; building a schema takes a few hundred microseconds, so prefixes are memoized.
+        import json
+        memo_key = (temperature, response_format)
+        prefix = self._prefixes.get(memo_key)
+        if prefix is None:
+            if hasattr(response_format, "model_json_schema"):
+                schema = response_format.model_json_schema()
+            else:
+                schema = str(response_format) if response_format is not None else None
+            prefix = self._prefixes[memo_key] = json.dumps([self.model_name, temperature, schema], sort_keys=True).encode("utf-8") + b"\0"
+        return prefix
+
+    def cache_key(self, prompt, temperature=1.0, response_format="text", system_prompt=None):
+        import hashlib
+        key = self._key_prefix(temperature, response_format)
+        if system_prompt is not None:
+            key += system_prompt.encode("utf-8") + b"\0"
+        return hashlib.sha256(key + prompt.encode("utf-8")).hexdigest()
+
+    def invoke(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None, use_cache=True):
+        import time
+        kwargs = self._wrapped_kwargs(temperature, response_format, system_prompt)
+        if not (self.enabled and use_cache) or image_paths or attached_image_path:
+            self.bypassed += 1
+            return self.llm.invoke(prompt, image_paths, attached_image_path, **kwargs)
+
+        key = self.cache_key(prompt, temperature, response_format, system_prompt)
+        now = time.time()
+        cached = self._lookup(key, now)
+        if cached is not None:
+            return cached
+        response = self.llm.invoke(prompt, image_paths, attached_image_path, **kwargs)
+        if response is not None:
+            self._store(key, response, now)
+        return response
+
+    async def ainvoke(self, prompt, image_paths=None, attached_image_path=None, temperature=1.0, response_format="text", system_prompt=None, use_cache=True):
+        # Same as invoke, but a miss awaits the wrapped model's ainvoke. Lookups are local and fast, so they stay blocking.
+        import time
+        kwargs = self._wrapped_kwargs(temperature, response_format, system_prompt)
+        if not (self.enabled and use_cache) or image_paths or attached_image_path:
+            self.bypassed += 1
+            return await self.llm.ainvoke(prompt, image_paths, attached_image_path=attached_image_path, **kwargs)
+        key = self.cache_key(prompt, temperature, response_format, system_prompt)
+        now = time.time()
+        cached = self._lookup(key, now)
+        if cached is not None:
+            return cached
+        response = await self.llm.ainvoke(prompt, attached_image_path=attached_image_path, **kwargs)
+        if response is not None:
+            self._store(key, response, now)
+        return response
+
+    def _lookup(self, key, now):
+        """The cached response for key, or None on a miss (counting it and dropping the entry if it expired)."""
+        with self._lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and (self.ttl is None or now - row[1] <= self.ttl):
+                self.hits += 1
+                self._touched[key] = now
+                if len(self._touched) >= 256:
+                    self._write_touches()
+                return row[0]
+            self.misses += 1
+            if row is not None:  # Expired
+                self._delete([key])
+        return None
+
+    @staticmethod
+    def _wrapped_kwargs(temperature, response_format, system_prompt):
+        # Backends without structured output (LM Studio) don't take response_format, so optional arguments are only passed when set
+        kwargs = {"temperature": temperature}
+        if response_format != "text":
+            kwargs["response_format"] = response_format
+        if system_prompt is not None:
+            kwargs["system_prompt"] = system_prompt
+        return kwargs
+
+    def stream(self, prompt, image_paths=[], attached_image_path=None, temperature=1.0, system_prompt=None):
+        # Streams are passed through uncached
+        return self.llm.stream(prompt, image_paths, attached_image_path, **self._wrapped_kwargs(temperature, "text", system_prompt))
+
+    def _store(self, key, response, now):
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            with self.conn:
+                old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self.conn.execute("INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (key, self.model_name, response, size, now, now))
+            if old is not None:
+                self._entries -= 1
+                self._bytes -= old[0]
+            self._entries += 1
+            self._bytes += size
+            if self._entries > self.max_entries or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _write_touches(self):
+        if self._touched:
+            with self.conn:
+                self.conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()])
+            self._touched = {}
+
+    def _delete(self, keys):
+        with self.conn:
+            for key in keys:
+                # SELECT then DELETE rather than DELETE ... RETURNING, which needs SQLite 3.35
+                row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._entries -= 1
+                    self._bytes -= row[0]
+
+    def _evict(self):
+        # Drop least recently used entries down to 90% of both limits, so this doesn't run again on the next insert
+        self._write_touches()
+        if self.ttl is not None:
+            import time
+            expired = [row[0] for row in self.conn.execute("SELECT key FROM responses WHERE created < ?", (time.time() - self.ttl,))]
+            self._delete(expired)
+            self.evictions += len(expired)
+        victims = []
+        entries, size = self._entries, self._bytes
+        for key, entry_size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if entries <= 0.9 * self.max_entries and size <= 0.9 * self.max_bytes:
+                break
+            victims.append(key)
+            entries -= 1
+            size -= entry_size
+        self._delete(victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM responses")
+            self._touched = {}
+            self._entries, self._bytes = 0, 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "entries": self._entries, "bytes": self._bytes}
+
+    def close(self):
+        """Writes back pending last-use times and closes the database. Safe to call more than once."""
+        if self.conn is None:
+            return
+        with self._lock:
+            self._write_touches()
+            self.conn.close()
+            self.conn = None
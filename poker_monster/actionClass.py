@@ -17,6 +17,26 @@ PHASE_OPP_CHOOSING_FROM_ULTIMATUM = "Choosing from Ultimatum. Chosen card goes i
 PHASE_CHOOSING_FROM_DECK_TOP2 = "Choosing from Peek."
 PHASE_HAND_FULL_DISCARDING_CARD = "Hand full, discarding card."
 
+# GameState stores a phase as its index in this list (the phase_id), which is also its column in the engine's ACTION_MAP.
+game_phases = [
+    PHASE_AWAITING_INPUT,
+    PHASE_PLAYING_SELECTED_CARD,
+    PHASE_VIEWING_CARD_INFO,
+    PHASE_SELECTING_GRAVEYARD_CARD,
+    PHASE_REORDERING_DECK_TOP3,
+    PHASE_SACRIFICING_LONG_CARD,
+    PHASE_DISCARDING_CARD_FROM_OPP_HAND,
+    PHASE_CHOOSING_GO_ALL_IN_TARGET,
+    PHASE_CHOOSING_FOLD_TARGET,
+    PHASE_CHOOSING_POKER_FACE_TARGET,
+    PHASE_CHOOSING_CHEAP_SHOT_TARGET,
+    PHASE_CHOOSING_ULTIMATUM_CARD,
+    PHASE_OPP_CHOOSING_FROM_ULTIMATUM,
+    PHASE_CHOOSING_FROM_DECK_TOP2,
+    PHASE_HAND_FULL_DISCARDING_CARD
+]
+PHASE_IDS = {phase: phase_id for phase_id, phase in enumerate(game_phases)}
+
 # Errors
 ERROR_ENEMY_HAS_THE_SUN = "Enemy has The Sun, you can't play more than one card per turn."
 ERROR_ENEMY_HAS_THE_MOON = "Enemy has The Moon, you can't play power cards."
@@ -44,8 +64,11 @@ class Action(object):
         # Execute the action, changing the gamestate.
         raise NotImplementedError("Subclass must implement is_legal()")
 
-    def enact(self) -> Tuple[bool, Optional[str]]:
+    def enact(self, journal=None) -> Tuple[bool, Optional[str]]:
         # Enact = if it is legal, update some rewards, and then execute the action
+        # If a journal (list) is given, an undo record is pushed onto it first; GameState.restore() pops back to it.
+        if journal is not None:
+            journal.append(self.gs.snapshot())
         legal, reason = self.is_legal()
         self.gs.me.action_number += 1
         if legal:
@@ -67,6 +90,11 @@ class Action(object):
             ...
         return legal, reason
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        # The cards a card-selecting action picks from (its legal action ids are among their uids). None for every other action.
+        return None
+
     # Reset the cache after resolving a given action.
     def reset(self):
         self.gs.cache = []
@@ -183,9 +211,13 @@ class EndTurn(Action):
 class SelectFromHand(Action):
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.hand # Search this list for a card with a matching uid.
+        self.card_list = self.candidate_cards(gs) # Search this list for a card with a matching uid.
         self.resolving_card = None # Will store selected card here
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.hand
+
     def future_moves_available(self, card) -> Tuple:
         # This is just to simplify the game by showing fewer available moves that don't lead anywhere
         # This enables not letting computers cancel their moves
@@ -238,10 +270,14 @@ class SelectFromHand(Action):
 class SelectFromBattlefield(Action):
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.battlefield + self.gs.opp.battlefield
+        self.card_list = self.candidate_cards(gs)
         self.target = None  # In this case, a target long card
         self.resolving_card = self.gs.cache[0]
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.battlefield + gs.opp.battlefield
+
     def is_legal(self):
         # Search card list for a card with a matching uid
         for long_card in self.card_list:
@@ -263,11 +299,15 @@ class SelectFromBattlefield(Action):
 class SelectFromOwnBattlefield(Action):
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.battlefield
+        self.card_list = self.candidate_cards(gs)
         self.sacrifice = None  # long card to be sacrificed as payment for Noble Sacrifice
 
         self.resolving_card = self.gs.cache[0]  # Noble Sacrifice is on the bottom of the stack
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.battlefield
+
     def is_legal(self):
         # Search battlefield for a sacrifice
         for long_card in self.card_list:
@@ -293,11 +333,15 @@ class SelectFromOwnBattlefield(Action):
 class SelectFromOppHand(Action):
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.opp.hand
+        self.card_list = self.candidate_cards(gs)
         self.discard = None  # enemy card to discard
 
         self.resolving_card = self.gs.cache[0]  # Noble Sacrifice is on the bottom of the stack/cache
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.opp.hand
+
     def is_legal(self):
         # Search opp hand for discard
         for card in self.card_list:
@@ -316,11 +360,15 @@ class SelectFromOppHand(Action):
 class SelectFromDeckTop2(Action):
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.deck[:2]
+        self.card_list = self.candidate_cards(gs)
         self.selected_card = None  # card to put into hand
 
         self.resolving_card = self.gs.cache[0]  # Noble Sacrifice is on the bottom of the stack/cache
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.deck[:2]
+
     def is_legal(self):
         # choose card from top2
         for card in self.card_list:
@@ -344,13 +392,17 @@ class SelectFromGraveyard(Action):
     # Need to iterate this action class up to three times in order to get information for Last Stand to resolve
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.graveyard
+        self.card_list = self.candidate_cards(gs)
         self.selected_card = None  # card to shuffle into deck
 
         self.resolving_card = self.gs.cache[0]  # In this case, Last Stand
         
         self.previously_selected_cards = self.gs.cache[1:]
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.graveyard
+
     def is_legal(self):
         # choose card from graveyard that *hasn't already been chosen*
         for card in self.card_list:
@@ -379,7 +431,7 @@ class SelectFromDeck(Action):
     # choose two cards from deck with *different names*
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.deck
+        self.card_list = self.candidate_cards(gs)
         self.selected_card = None  # Will update if found
 
         self.resolving_card = self.gs.cache[0]  # Ultimatum
@@ -393,6 +445,10 @@ class SelectFromDeck(Action):
         first_name = self.card_list[0].name
         self.deck_has_different_names = any(card.name != first_name for card in self.card_list[1:])
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.deck
+
     def is_legal(self):
         # This is essentially a stricter test in addition to unique id
         for card in self.card_list:
@@ -421,12 +477,15 @@ class SelectFromUltimatum(Action):
     # Just need to pass back priority after this.
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        ultimatum = self.gs.cache[1:]  # This is the two cards chosen during the previous two game phases
-        self.card_list = ultimatum  # Opponent searches the ultimatum
+        self.card_list = self.candidate_cards(gs)  # Opponent searches the ultimatum
         self.selected_card = None  # Update if found
 
         self.resolving_card = self.gs.cache[0]
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.cache[1:]  # This is the two cards chosen during the previous two game phases
+
     def is_legal(self):
         # Similar to other searches
         for card in self.card_list:
@@ -448,13 +507,17 @@ class SelectFromDeckTop3(Action):
     # Mimics Last Stand
     def __init__(self, gs, action_id):
         super().__init__(gs, action_id)
-        self.card_list = self.gs.me.deck[:3]  # Top 3 cards of deck, mimics Peek
+        self.card_list = self.candidate_cards(gs)  # Top 3 cards of deck, mimics Peek
         self.selected_card = None  # card to rearrange
 
         self.resolving_card = self.gs.cache[0]  # In this case, Reconsider
         
         self.previously_selected_cards = self.gs.cache[1:]
 
+    @classmethod
+    def candidate_cards(cls, gs):
+        return gs.me.deck[:3]
+
     def is_legal(self):
         for card in self.card_list:
             if card.uid == self.action_id:  # Test via uid
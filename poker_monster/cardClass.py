@@ -1,15 +1,33 @@
+from collections import namedtuple
+from operator import attrgetter
+
+# What never changes about a card. health is its starting health; owner isn't here since it can change.
+CardData = namedtuple("CardData", ["name", "card_id", "uid", "card_type", "power_cost", "health", "card_text"])
+
+# Static card data shared by every game and every copy of a card: uid -> CardData. Filled by build_decks.
+CARD_TABLE = {}
+
 class Card:
-    def __init__(self, name, card_id, uid, owner, card_type, power_cost, health, card_text):
-        # The smallest unit of gameplay.
-        self.name = name
-        self.card_id = card_id
+    # A card never changes during a game, so one object is shared by the game and all its clones. What can change
+    # (health, and owner via A Playful Pixie) lives in the GameState, indexed by uid: gs.card_health and gs.card_owner.
+    # Everything else is a read-only view of the card's CARD_TABLE entry, except uid and name: legality checks read
+    # those constantly, so they are copied into slots too. Subclasses declare empty __slots__ so cards stay this small.
+    __slots__ = ("static", "uid", "name")
+
+    def __init__(self, name, card_id, uid, card_type, power_cost, health, card_text):
+        # The smallest unit of gameplay. health is the card's starting health.
+        static = CARD_TABLE.get(uid)
+        if static is None:  # A card built outside build_decks, e.g. by from_dict in a process that never built the decks
+            static = CARD_TABLE[uid] = CardData(name, card_id, uid, card_type, power_cost, health, card_text)
+        self.static = static
         self.uid = uid  # unique identifier (duplicates have different uids)
-        self.owner = owner  # "hero" or "monster"; can change by stealing with A Playful Pixie; this info will need to be shown to an AI
-        self.card_type = card_type  # "short" or "long"
-        self.power_cost = power_cost
-        self.health = health
-        self.starting_health = health  # Used to reset health after a card dies so it can be played again.
-        self.card_text = card_text  # Will be displayed
+        self.name = name
+
+    card_id = property(attrgetter("static.card_id"))
+    card_type = property(attrgetter("static.card_type"))  # "short" or "long"
+    power_cost = property(attrgetter("static.power_cost"))
+    starting_health = property(attrgetter("static.health"))  # Used to reset health after a card dies so it can be played again.
+    card_text = property(attrgetter("static.card_text"))  # Will be displayed
 
     def __eq__(self, other):
         if not isinstance(other, Card):
@@ -21,18 +39,18 @@ class Card:
         # Every effect has its own subclass.
         raise NotImplementedError("Subclass must implement effect()")
 
-    def to_dict(self):
-        # Encode Card into a dictionary that HTML can use
+    def to_dict(self, gs):
+        # Encode Card into a dictionary that HTML can use. Its health and owner come from the game state gs.
         image_filename = f"images/{self.name.replace(' ', '_')}.png"
 
         data = {
             "name": self.name,
             "card_id": self.card_id,
             "uid": self.uid,
-            "owner": self.owner,
+            "owner": gs.card_owner[self.uid],
             "card_type": self.card_type,
             "power_cost": self.power_cost,
-            "health": self.health,
+            "health": gs.card_health[self.uid],
             "starting_health": self.starting_health,
             "card_text": self.card_text,
             "image_filename": image_filename  # To display images on the website
@@ -41,21 +59,22 @@ class Card:
 
     @classmethod
     def from_dict(cls, data):
-        # Take the dictionary and use its values to call create_card (turns HTML into a Card)
+        # Take the dictionary and use its values to call create_card (turns HTML into a Card).
+        # Its health and owner belong to the game state; GameState.from_dict reads them.
+        from poker_monster.engine import create_card  # Imported here since the engine imports this module
         card =  create_card(
             name=data["name"],
             card_id=data["card_id"],
             uid=data["uid"],
-            owner=data["owner"],
             card_type=data["card_type"],
             power_cost=data["power_cost"],
-            health=data["health"],
+            health=data["starting_health"],
             card_text=data["card_text"]
         )
-        card.starting_health = data["starting_health"]
         return card
 
 class Awakening(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Awakening")
         flipped_power_cards = gs.me.power_cards
@@ -67,6 +86,7 @@ class Awakening(Card):
                 gs.me.battlefield.append(power_card)
 
 class HealthyEating(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Healthy Eating")
         gs.me.draw()
@@ -75,22 +95,25 @@ class HealthyEating(Card):
 # No subclasses for The Sun and The Moon
 
 class APLayfulPixie(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("A Playful Pixie effect triggered")
         if gs.opp.deck:
             card = gs.opp.deck.pop(0)
             if card.name == "Mind Control":  # Prevent stealing this card?
                 ...
-            card.owner = gs.me.name
+            gs.card_owner[card.uid] = gs.me.name
             gs.me.hand.append(card)
 
 class APearlescentDragon(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("A Pearlescent Dragon effect triggered")
         gs.opp.health -= 5
         gs.me.health += 5
 
 class LastStand(Card):
+    __slots__ = ()
     # Needs to work with all graveyard conditions
     def effect(self, gs):
         #print("Playing Last Stand")
@@ -98,11 +121,12 @@ class LastStand(Card):
         for card in selected_cards:  # These cards will be taken out of the graveyard and shuffled into the deck
             gs.me.graveyard.remove(card)
             gs.me.deck.append(card)
-        gs.me.shuffle()
+        gs.me.shuffle(gs.rng())
         gs.me.last_stand_buff = True
         #print("Last Stand buff granted")
 
 class Reconsider(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Reconsider")
         cards_in_new_order = gs.cache [1:]  # If there are fewer than 3 cards left in the deck, this will return that many cards
@@ -112,6 +136,7 @@ class Reconsider(Card):
             gs.me.deck.insert(0, card)  # First card chosen goes first, last card chosen goes last
 
 class NobleSacrifice(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Noble Sacrifice")
         sacrifice = gs.cache[1]
@@ -123,6 +148,7 @@ class NobleSacrifice(Card):
 
 # For the buff to work properly, short_card_played_this_turn must be updated properly
 class MonstersPawn(Card):
+    __slots__ = ()
     def effect(self, gs):
         if not gs.short_card_played_this_turn:
             if gs.me.monsters_pawn_buff != True:
@@ -133,6 +159,7 @@ class MonstersPawn(Card):
             gs.me.monsters_pawn_buff = False
 
 class PowerTrip(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Power Trip")
         gs.me.power += 2
@@ -140,21 +167,24 @@ class PowerTrip(Card):
 # No subclasses for Go All In and Fold
 
 class PokerFace(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Poker Face")
         # When Poker Face targets a player, that is handled in the action class.
         target = gs.cache[1]
-        target.health -= 4
+        gs.card_health[target.uid] -= 4
 
 class CheapShot(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Cheap Shot")
         # When Cheap Shot targets a player, that is handled in the action class.
         target = gs.cache[1]
-        target.health -= 2
+        gs.card_health[target.uid] -= 2
         gs.me.draw()
 
 class TheOlSwitcheroo(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing The 'Ol Switcheroo")
         temp_health = gs.hero.health
@@ -162,6 +192,7 @@ class TheOlSwitcheroo(Card):
         gs.monster.health = temp_health
 
 class Ultimatum(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Ultimatum")
         # Note: current turn_priority should be the person playing the card (not the opp)
@@ -173,9 +204,10 @@ class Ultimatum(Card):
         ultimatum.remove(opp_selected_card)
         gs.me.hand.append(opp_selected_card)
         gs.me.deck.append(ultimatum[0])  # Unselected card goes into deck
-        gs.me.shuffle()
+        gs.me.shuffle(gs.rng())
 
 class Peek(Card):
+    __slots__ = ()
     def effect(self, gs):
         #print("Playing Peek")
         deck_top2 = gs.me.deck[:2]  # copy top 2 cards of deck
@@ -1,5 +1,5 @@
 from numpy import mean
-from random import randint
+import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import time
@@ -16,7 +16,7 @@ import multiprocessing
 import sys
 
 # Core Gameplay Classes
-from poker_monster.cardClass import Card, Awakening, HealthyEating, APLayfulPixie, APearlescentDragon, LastStand, Reconsider, NobleSacrifice, MonstersPawn, PowerTrip, PokerFace, CheapShot, TheOlSwitcheroo, Ultimatum, Peek
+from poker_monster.cardClass import CARD_TABLE, CardData, Card, Awakening, HealthyEating, APLayfulPixie, APearlescentDragon, LastStand, Reconsider, NobleSacrifice, MonstersPawn, PowerTrip, PokerFace, CheapShot, TheOlSwitcheroo, Ultimatum, Peek
 from poker_monster.playerClass import Player
 from poker_monster.gamestateClass import GameState
 from poker_monster.actionClass import Action, InvalidAction, TargetHero, TargetMonster, GetCardInfo, Cancel, EndTurn, SelectFromHand, SelectFromBattlefield, SelectFromOwnBattlefield, SelectFromOppHand, SelectFromDeckTop2, SelectFromGraveyard, SelectFromDeck, SelectFromUltimatum, SelectFromDeckTop3, PlayFaceUp, PlayFaceDown
@@ -63,24 +63,8 @@ for i in range(len(card_data)):
 
 num_actions = num_cards + 2  # +2 for end turn and cancel, computers can't cancel so for them it's num_cards + 1
 
-# Game phases. The strings can be edited to say anything and the game will run the same.
-PHASE_AWAITING_INPUT = "Awaiting input."
-PHASE_PLAYING_SELECTED_CARD = "Choosing how to play selected card."
-PHASE_VIEWING_CARD_INFO = "Viewing card info."
-PHASE_SELECTING_GRAVEYARD_CARD = "Choosing card from graveyard."
-PHASE_REORDERING_DECK_TOP3 = "Reordering top 3 cards of deck. First card chosen goes on top, second card below that, and third is last."
-PHASE_SACRIFICING_LONG_CARD = "Choosing a Noble Sacrifice."
-PHASE_DISCARDING_CARD_FROM_OPP_HAND = "Looking at opponent's hand and discarding a card from it."
-PHASE_CHOOSING_GO_ALL_IN_TARGET = "Choosing Go All In target."
-PHASE_CHOOSING_FOLD_TARGET = "Choosing Fold target."
-PHASE_CHOOSING_POKER_FACE_TARGET = "Choosing Poker Face target."
-PHASE_CHOOSING_CHEAP_SHOT_TARGET = "Choosing Cheap Shot target."
-PHASE_CHOOSING_ULTIMATUM_CARD = "Choosing an Ultimatum card from deck."
-PHASE_OPP_CHOOSING_FROM_ULTIMATUM = "Choosing from Ultimatum. Chosen card goes into opp hand, other is shuffled into their deck."
-PHASE_CHOOSING_FROM_DECK_TOP2 = "Choosing from Peek."
-PHASE_HAND_FULL_DISCARDING_CARD = "Hand full, discarding card."
-
-game_phases = [
+# Game phases. The strings (edited in actionClass) can say anything and the game will run the same; GameState stores the phase_id.
+from poker_monster.actionClass import (
     PHASE_AWAITING_INPUT,
     PHASE_PLAYING_SELECTED_CARD,
     PHASE_VIEWING_CARD_INFO,
@@ -95,8 +79,10 @@ game_phases = [
     PHASE_CHOOSING_ULTIMATUM_CARD,
     PHASE_OPP_CHOOSING_FROM_ULTIMATUM,
     PHASE_CHOOSING_FROM_DECK_TOP2,
-    PHASE_HAND_FULL_DISCARDING_CARD
-]
+    PHASE_HAND_FULL_DISCARDING_CARD,
+    game_phases,
+    PHASE_IDS,
+)
 
 ERROR_ENEMY_HAS_THE_SUN = "Enemy has The Sun, you can't play more than one card per turn."
 ERROR_ENEMY_HAS_THE_MOON = "Enemy has The Moon, you can't play power cards."
@@ -109,7 +95,7 @@ ERROR_MUST_HAVE_DIFFERENT_NAME = "Card must have a different name."
 ERROR_NO_FURTHER_MOVES = "No further moves available with this card."
 ERROR_COMPUTERS_CANT_DO = "Computers can't do this action."  # Canceling and seeing card info are QOL features for people, not computers
     
-def create_card(name, card_id, uid, owner, card_type, power_cost, health, card_text):
+def create_card(name, card_id, uid, card_type, power_cost, health, card_text):
     card_name_to_effect = {
         "Awakening": Awakening,
         "Healthy Eating": HealthyEating,
@@ -128,7 +114,7 @@ def create_card(name, card_id, uid, owner, card_type, power_cost, health, card_t
     }  # Not all cards need their own subclass
 
     CardClass = card_name_to_effect.get(name, Card)
-    return CardClass(name, card_id, uid, owner, card_type, power_cost, health, card_text)
+    return CardClass(name, card_id, uid, card_type, power_cost, health, card_text)
 
 def build_decks():
     hero_deck = []
@@ -137,12 +123,13 @@ def build_decks():
     card_id = 0
     for quantity, name, owner, power_cost, card_type, health, card_text in card_data:
         for i in range(quantity):
+            CARD_TABLE[uid] = CardData(name, card_id, uid, card_type, power_cost, health, card_text)
             if owner == "hero":
-                card = create_card(name, card_id, uid, owner, card_type, power_cost, health, card_text)
+                card = create_card(name, card_id, uid, card_type, power_cost, health, card_text)
                 uid += 1  # Increment uid for each unique card
                 hero_deck.append(card)
             elif owner == "monster":
-                card = create_card(name, card_id, uid, owner, card_type, power_cost, health, card_text)
+                card = create_card(name, card_id, uid, card_type, power_cost, health, card_text)
                 uid += 1
                 monster_deck.append(card)
         card_id += 1  # Increment card_id for each new card name
@@ -152,9 +139,12 @@ num_game_phases = len(game_phases)
 # Create Matrix of size [i][j], where i = num_actions and j = num_game_phases
 ACTION_MAP = [[None for j in range(num_game_phases)] for i in range(num_actions)]
 
+PHASE_SELECT_CLASS = [None] * num_game_phases  # The card-selecting action class of each phase, if it has one
+
 def action_map_helper(game_phase, SelectFromClass=None, choosing_up_down=False, can_target_players=False, can_end_turn=False, can_get_card_info=False, can_cancel=False):
     """Based on a set of parameters, fills in the ACTION_MAP for a specific game phase."""
-    j = game_phases.index(game_phase)  # phase_id
+    j = PHASE_IDS[game_phase]  # phase_id
+    PHASE_SELECT_CLASS[j] = SelectFromClass
     if choosing_up_down:
         ACTION_MAP[0][j] = PlayFaceUp
         ACTION_MAP[1][j] = PlayFaceDown
@@ -189,9 +179,28 @@ action_map_helper(PHASE_CHOOSING_FROM_DECK_TOP2, SelectFromDeckTop2)  # Can't ca
 action_map_helper(PHASE_HAND_FULL_DISCARDING_CARD, SelectFromHand, can_cancel=True)
 # Fill in the rest of the game phases with appropriate actions
 
+# The fixed (non-card-selection) slots of each phase, as (action_id, action_class). Together with the uids of
+# PHASE_SELECT_CLASS's candidate_cards, these are the only action ids that can be legal in the phase.
+PHASE_FIXED_ACTIONS = [
+    [(i, ACTION_MAP[i][j]) for i in range(num_actions) if ACTION_MAP[i][j] is not None and ACTION_MAP[i][j] is not PHASE_SELECT_CLASS[j]]
+    for j in range(num_game_phases)
+]
+
+def candidate_actions(gs):
+    """(action_id, action_class) pairs that can be legal in gs's phase, by action_id. Every other id is an invalid selection."""
+    phase_id = gs.phase_id
+    candidates = PHASE_FIXED_ACTIONS[phase_id]
+    select_class = PHASE_SELECT_CLASS[phase_id]
+    if select_class is None:
+        return candidates
+    # A card's uid is its action id, unless a fixed action took that slot (e.g. TargetHero in the battlefield phases).
+    # A set, since a card can be listed twice (an Ultimatum of one card picked twice).
+    uids = {card.uid for card in select_class.candidate_cards(gs)}
+    selections = [(uid, select_class) for uid in uids if ACTION_MAP[uid][phase_id] is select_class]
+    return sorted(candidates + selections, key=lambda candidate: candidate[0])
+
 def create_action(gs, action_id):
-    phase_id = game_phases.index(gs.game_phase)
-    action_class = ACTION_MAP[action_id][phase_id]
+    action_class = ACTION_MAP[action_id][gs.phase_id]
 
     if action_class is None:
         return InvalidAction(gs, action_id)  
@@ -241,9 +250,9 @@ def display_gamestate(gs):
     if gs.me.power_cards:
         lines.append(f"My Power Cards: {[card.name for card in sorted(gs.me.power_cards, key=sort_key)]}")
     if gs.me.battlefield:
-        lines.append(f"My Battlefield: {[(card.name, card.health) for card in sorted(gs.me.battlefield, key=sort_key)]}")
+        lines.append(f"My Battlefield: {[(card.name, gs.card_health[card.uid]) for card in sorted(gs.me.battlefield, key=sort_key)]}")
     if gs.opp.battlefield:
-        lines.append(f"Opp Battlefield: {[(card.name, card.health) for card in sorted(gs.opp.battlefield, key=sort_key)]}")
+        lines.append(f"Opp Battlefield: {[(card.name, gs.card_health[card.uid]) for card in sorted(gs.opp.battlefield, key=sort_key)]}")
     if gs.me.graveyard:
         lines.append(f"My Graveyard: {[card.name for card in sorted(gs.me.graveyard, key=sort_key)]}")
     if gs.opp.graveyard:
@@ -259,13 +268,27 @@ def display_gamestate(gs):
 
     return "\n".join(lines)
 
+def legal_action_mask(gs):
+    """Boolean array of length num_actions, True where the action is legal. Builds no text; display_actions is the text view of the same checks."""
+    mask = np.zeros(num_actions, dtype=bool)
+    for action_id, action_class in candidate_actions(gs):
+        mask[action_id] = action_class(gs, action_id).is_legal()[0]
+    return mask
+
+def legal_action_masks(states):
+    """Batched legal_action_mask: a [len(states), num_actions] boolean array."""
+    masks = np.zeros((len(states), num_actions), dtype=bool)
+    for row, gs in enumerate(states):
+        masks[row] = legal_action_mask(gs)
+    return masks
+
 def display_actions(gs):
     lines = []
     lines.append("Available Actions:")
     
-    for action_id in range(num_actions):  # Assuming 20 possible actions
+    for action_id, action_class in candidate_actions(gs):  # The other ids are invalid selections, which aren't listed
         # print("Creating action: ", action_id)
-        action = create_action(gs, action_id)
+        action = action_class(gs, action_id)
         legal, error = action.is_legal()
         
         if legal:
@@ -295,27 +318,119 @@ def display_actions(gs):
         
     return "\n".join(lines)
 
+# --- OBSERVATION ENCODING ---
+# A fixed-shape float32 vector of the game state for learned policies and value nets, built straight from the
+# objects with no text in between. Everything is relative to an observer ("me" = the player the vector is for).
+# Layout (see OBS_LAYOUT for the slices):
+#   zones:    [num_cards, NUM_OBS_ZONES] one-hot zone of every card uid. With hide_hidden=True, cards the observer
+#             can't see (opponent's hand, deck and power cards, and the order-only-known own deck) go in OBS_ZONE_HIDDEN.
+#   in_cache: [num_cards] card is on the cache (the resolving card and its selections)
+#   health:   [num_cards] current health of long cards, 0 for short cards
+#   mine:     [num_cards] card is owned by the observer (ownership can change, see A Playful Pixie)
+#   phase:    [num_game_phases] one-hot game phase
+#   players:  [2, len(OBS_PLAYER_FEATURES)] observer row first, then the opponent
+#   flags:    OBS_GLOBAL_FEATURES
+OBS_ZONES = ("deck", "hand", "battlefield", "graveyard", "power_cards")
+NUM_OBS_ZONES = 2 * len(OBS_ZONES) + 1  # Own zones, opponent's zones, hidden
+OBS_ZONE_HIDDEN = NUM_OBS_ZONES - 1
+OBS_PLAYER_FEATURES = ("health", "power", "power_plays_left", "power_plays_made_this_turn", "deck_size", "hand_size", "power_cards", "last_stand_buff", "monsters_pawn_buff", "going_first")
+OBS_GLOBAL_FEATURES = ("turn_number", "card_played_this_turn", "short_card_played_this_turn", "observer_is_hero", "observer_has_priority", "cache_size")
+
+def _observation_layout():
+    sizes = [
+        ("zones", num_cards * NUM_OBS_ZONES),
+        ("in_cache", num_cards),
+        ("health", num_cards),
+        ("mine", num_cards),
+        ("phase", num_game_phases),
+        ("players", 2 * len(OBS_PLAYER_FEATURES)),
+        ("flags", len(OBS_GLOBAL_FEATURES)),
+    ]
+    layout, start = {}, 0
+    for name, size in sizes:
+        layout[name] = slice(start, start + size)
+        start += size
+    return layout, start
+
+OBS_LAYOUT, OBS_SIZE = _observation_layout()
+
+def encode_observation(gs, observer=None, hide_hidden=False, out=None):
+    """
+    Encodes one GameState into a float32 vector of length OBS_SIZE (written into out if given).
+    observer is "hero" or "monster"; None means the player whose turn it is.
+    """
+    if out is None:
+        out = np.zeros(OBS_SIZE, dtype=np.float32)
+    else:
+        out[:] = 0.0
+    observer = observer or gs.turn_priority
+    me, opp = (gs.hero, gs.monster) if observer == "hero" else (gs.monster, gs.hero)
+
+    zones = out[OBS_LAYOUT["zones"]].reshape(num_cards, NUM_OBS_ZONES)
+    for zone_offset, player in ((0, me), (len(OBS_ZONES), opp)):
+        for zone_id, zone in enumerate(OBS_ZONES, start=zone_offset):
+            cards = getattr(player, zone)
+            if not cards:
+                continue
+            hidden = hide_hidden and (player is opp and zone != "battlefield" and zone != "graveyard" or player is me and zone == "deck")
+            zones[[card.uid for card in cards], OBS_ZONE_HIDDEN if hidden else zone_id] = 1.0
+
+    if gs.cache:
+        out[OBS_LAYOUT["in_cache"]][[card.uid for card in gs.cache]] = 1.0
+    health = out[OBS_LAYOUT["health"]]
+    mine = out[OBS_LAYOUT["mine"]]
+    for player in (me, opp):
+        for card in player.battlefield:  # Health only changes on the battlefield; it is reset when a long card dies
+            health[card.uid] = gs.card_health[card.uid]
+    for player in (me, opp):
+        for zone in OBS_ZONES:
+            for card in getattr(player, zone):
+                if gs.card_owner[card.uid] == observer:
+                    mine[card.uid] = 1.0
+
+    out[OBS_LAYOUT["phase"]][gs.phase_id] = 1.0
+
+    players = out[OBS_LAYOUT["players"]].reshape(2, len(OBS_PLAYER_FEATURES))
+    for row, player in enumerate((me, opp)):
+        players[row] = (player.health, player.power, player.power_plays_left, player.power_plays_made_this_turn, len(player.deck), len(player.hand),
+                        len(player.power_cards), player.last_stand_buff, player.monsters_pawn_buff, player.going_first)
+    out[OBS_LAYOUT["flags"]] = (gs.turn_number, gs.card_played_this_turn, gs.short_card_played_this_turn, observer == "hero", observer == gs.turn_priority, len(gs.cache))
+    return out
+
+def encode_observations(states, observers=None, hide_hidden=False):
+    """Batched encode_observation: a [len(states), OBS_SIZE] float32 array. observers is None or one observer per state."""
+    batch = np.zeros((len(states), OBS_SIZE), dtype=np.float32)
+    for row, gs in enumerate(states):
+        encode_observation(gs, None if observers is None else observers[row], hide_hidden, out=batch[row])
+    return batch
+
 class GameEngine:
     def __init__(self):
         self.gs = None
         self.hero = None
         self.monster = None
         self.num_actions = num_actions
+        self.journal = []  # Undo records of undoable iterate() calls, newest last
 
-    def reset(self, hero_type="computer", monster_type="computer"):
+    def reset(self, hero_type="computer", monster_type="computer", seed=None):
         # Starts the game from scratch.
+        # The seed fixes the coin flip and every shuffle of the game (see GameState.rng); None picks a random one.
         # Reset the important stuff.
         self.gs = None
         self.hero = None
         self.monster = None
+        self.journal = []
 
         # Build decks and players
         hero_deck, monster_deck = build_decks()
         self.hero = Player("hero", hero_deck, hero_type)
         self.monster = Player("monster", monster_deck, monster_type)
 
+        # Initialize the game state, resetting important variables like the game phase and cache
+        self.gs = GameState(self.hero, self.monster, None, PHASE_AWAITING_INPUT, cache=[], seed=seed)
+
         # coin flip to see who goes first
-        coin_flip = randint(0, 1)
+        coin_flip = self.gs.rng().randint(0, 1)
         going_first = None
         if coin_flip == 0:  # Heads is for Monster, obviously
             going_first = "monster"
@@ -324,18 +439,26 @@ class GameEngine:
             going_first = "hero"
             self.hero.going_first = True
 
-        # Initialize the game state, resetting important variables like the game phase and cache
-        self.gs = GameState(self.hero, self.monster, going_first, PHASE_AWAITING_INPUT, cache=[])
-        self.hero.shuffle()
-        self.monster.shuffle()
+        self.gs.turn_priority = going_first
+        self.hero.shuffle(self.gs.rng())
+        self.monster.shuffle(self.gs.rng())
         self.hero.draw(4)
         self.monster.draw(4)
 
-    def iterate(self, action_id):
+    def iterate(self, action_id, undoable=False):
         # Uses the action_id to create an action and enacts it, which changes the game state. 
         # Returns True if success
+        # With undoable=True the move can be taken back with undo() (make/unmake, for tree search without cloning).
         action = create_action(self.gs, action_id)
-        return action.enact()
+        return action.enact(self.journal if undoable else None)
+
+    def undo(self):
+        # Takes back the last undoable iterate(), restoring the exact prior game state. Returns False if there is nothing to undo.
+        # The game's random state is taken back too, so replaying the move shuffles the same way.
+        if not self.journal:
+            return False
+        self.gs.restore(self.journal.pop())
+        return True
 
     def get_display_text(self):
         # Shows the information needed to play the game.
@@ -357,7 +480,14 @@ class GameEngine:
                 return clean_line
         return None # Or raise an error if not found
 
-    def get_legal_actions(self, actions_text):
+    def legal_action_mask(self):
+        # Boolean array of length num_actions; see legal_action_mask()
+        return legal_action_mask(self.gs)
+
+    def get_legal_actions(self, actions_text=None):
+        # Returns the legal action ids. Without actions_text they come straight from the mask, no text involved.
+        if actions_text is None:
+            return np.flatnonzero(legal_action_mask(self.gs)).tolist()
         # Splits the text into individual lines to process them one by one
         lines = actions_text.strip().split("\n")
         valid_ids = []
@@ -387,5 +517,10 @@ class GameEngine:
         else:
             return None
 
+    def get_observation(self, observer=None, hide_hidden=False, as_tensor=False):
+        # Fixed-shape encoding of the current state (see encode_observation). as_tensor returns a torch tensor sharing the memory.
+        obs = encode_observation(self.gs, observer, hide_hidden)
+        return torch.from_numpy(obs) if as_tensor else obs
+
     def get_current_player(self):
         return self.gs.me
\ No newline at end of file
@@ -1,13 +1,19 @@
-# Game phase
-PHASE_AWAITING_INPUT = "Awaiting input."
+import random
+
+from poker_monster.actionClass import PHASE_AWAITING_INPUT, game_phases, PHASE_IDS
+from poker_monster.cardClass import Card
+from poker_monster.playerClass import Player
 
 class GameState:
-    def __init__(self, hero, monster, turn_priority=None, game_phase=PHASE_AWAITING_INPUT, cache=None):
+    __slots__ = ("hero", "monster", "turn_priority", "phase_id", "cache", "turn_number", "winner", "card_played_this_turn", "short_card_played_this_turn", "seed", "draws",
+                 "card_health", "card_owner")
+
+    def __init__(self, hero, monster, turn_priority=None, game_phase=PHASE_AWAITING_INPUT, cache=None, seed=None, card_health=None, card_owner=None):
         # Initializes the game state. Contains both players.
         self.hero = hero
         self.monster = monster
         self.turn_priority = turn_priority  # Basically whose turn it is to take an action
-        self.game_phase = game_phase
+        self.phase_id = PHASE_IDS[game_phase]  # The game phase, stored as its index in game_phases
         self.cache = [] if cache is None else cache  # The cache, similar to Magic: The Gathering's stack
         self.turn_number = 0
         self.winner = None
@@ -15,6 +21,31 @@ class GameState:
         self.card_played_this_turn = False  # Flag to track if any card has been played this turn
         self.short_card_played_this_turn = False
 
+        # The game's own randomness (shuffles, coin flip), independent of the global generator. The state is just two
+        # ints, so clone/snapshot/restore copy it for free and undo takes random draws back too.
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.draws = 0  # Random events so far
+
+        # What can change about a card, indexed by uid. Cards themselves never change, so clones share them and copy only
+        # these two lists. By default every card starts at full health, owned by the player whose cards it is among.
+        if card_health is None or card_owner is None:
+            cards = [(player.name, card) for player in (hero, monster) for zone in Player.ZONES for card in getattr(player, zone)]
+            size = max((card.uid for _, card in cards), default=-1) + 1
+            card_health, card_owner = [None] * size, [None] * size
+            for owner, card in cards:
+                card_health[card.uid] = card.starting_health
+                card_owner[card.uid] = owner
+        self.card_health = card_health  # Long cards only; None for short cards
+        self.card_owner = card_owner  # "hero" or "monster"; can change by stealing with A Playful Pixie
+
+    @property
+    def game_phase(self):
+        return game_phases[self.phase_id]
+
+    @game_phase.setter
+    def game_phase(self, game_phase):
+        self.phase_id = PHASE_IDS[game_phase]
+
     @property
     def me(self):
         """Returns the current player based on turn priority"""
@@ -30,6 +61,11 @@ class GameState:
         # Uncertainty: This is a useful value for AIs to know - It corresponds to how much hidden information there is.
         return len(self.opp.hand) + len(self.opp.deck) + len(self.opp.power_cards) + len(self.me.deck)
     
+    def rng(self):
+        """A random.Random for the next random event, derived from (seed, draws). Same seed and moves, same game."""
+        self.draws += 1
+        return random.Random((self.seed << 32) + self.draws)
+
     def pass_priority(self):
         """Swaps turn priority between hero and monster."""
         self.turn_priority = "monster" if self.turn_priority == "hero" else "hero"
@@ -77,15 +113,15 @@ class GameState:
     def check_long_card_deaths(self) -> None:
         """Check if any long cards on the battlefield have died."""
         for card in self.hero.battlefield[:]:
-            if card.health <= 0:
+            if self.card_health[card.uid] <= 0:
                 self.hero.battlefield.remove(card)
                 self.hero.graveyard.append(card)
-                card.health = card.starting_health  # Restore to full health after it is in the graveyard
+                self.card_health[card.uid] = card.starting_health  # Restore to full health after it is in the graveyard
         for card in self.monster.battlefield[:]:
-            if card.health <= 0:
+            if self.card_health[card.uid] <= 0:
                 self.monster.battlefield.remove(card)
                 self.monster.graveyard.append(card)
-                card.health = card.starting_health
+                self.card_health[card.uid] = card.starting_health
 
     # Update this after every action
     def update_pawn_buff(self):
@@ -99,8 +135,43 @@ class GameState:
         if not any(long_card.name == "Monster's Pawn" for long_card in self.opp.battlefield):
             self.opp.monsters_pawn_buff = 0
 
+    def clone(self):
+        # An independent copy of the game. Much cheaper than from_dict(to_dict()): no dicts and no new cards. The clone
+        # shares the (unchanging) card objects and gets its own zone lists, cache and per-card health and owners.
+        gs = object.__new__(self.__class__)
+        for attribute in GameState.__slots__:
+            setattr(gs, attribute, getattr(self, attribute))
+        gs.hero = self.hero.clone()
+        gs.monster = self.monster.clone()
+        gs.cache = self.cache[:]
+        gs.card_health = self.card_health[:]
+        gs.card_owner = self.card_owner[:]
+        return gs
+
+    def snapshot(self):
+        # Undo record for make/unmake search: restore(snapshot) puts the game back exactly, in place, with no new cards
+        # or players. Card health and owner are the only per-card state that can change, so only those lists are saved.
+        return ([getattr(self, attribute) for attribute in GameState.__slots__], self.cache[:], self.hero.snapshot(), self.monster.snapshot(),
+                self.card_health[:], self.card_owner[:])
+
+    def restore(self, snapshot):
+        state, cache, hero, monster, card_health, card_owner = snapshot
+        for attribute, value in zip(GameState.__slots__, state):
+            setattr(self, attribute, value)
+        self.cache[:] = cache
+        self.hero.restore(hero)
+        self.monster.restore(monster)
+        self.card_health[:] = card_health
+        self.card_owner[:] = card_owner
+
+    def zobrist_hash(self):
+        # Canonical 64-bit identity of the state, much cheaper than its display text (see transposition.zobrist_hash)
+        from poker_monster.transposition import zobrist_hash  # Imported here since transposition imports the engine
+        return zobrist_hash(self)
+
     def get_legal_actions(self):
         # Returns a list of legal actions, each with fresh gamestates
+        from poker_monster.engine import num_actions, create_action  # Imported here since the engine imports this module
         legal_actions = []
         seen_types = set()
 
@@ -113,7 +184,7 @@ class GameState:
             if legal and action_type not in seen_types:
                 seen_types.add(action_type)
                 # Need to make sure each action has a fresh gs, this is how.
-                new_state = self.__class__.from_dict(self.to_dict())
+                new_state = self.clone()
                 legal_action = create_action(new_state, i)
                 legal_actions.append(legal_action)
         return legal_actions
@@ -122,8 +193,8 @@ class GameState:
         # Turns the gs into a dictionary that HTML can read
         return {
             # Call the methods you already wrote for Player
-            "hero": self.hero.to_dict(),
-            "monster": self.monster.to_dict(),
+            "hero": self.hero.to_dict(self),
+            "monster": self.monster.to_dict(self),
             
             # Save the simple attributes
             "turn_priority": self.turn_priority,
@@ -134,9 +205,11 @@ class GameState:
             # Flags:
             "card_played_this_turn": self.card_played_this_turn,
             "short_card_played_this_turn": self.short_card_played_this_turn,
+            "seed": self.seed,
+            "draws": self.draws,
 
             # The cache is a list of cards, so we serialize it like other card lists
-            "cache": [card.to_dict() for card in self.cache]
+            "cache": [card.to_dict(self) for card in self.cache]
         }
 
     @classmethod
@@ -146,13 +219,23 @@ class GameState:
         monster = Player.from_dict(data["monster"])
         cache = [Card.from_dict(card_data) for card_data in data["cache"]]
 
+        # Each card's health and owner, from the card dictionaries
+        card_data = [card_data for player in (data["hero"], data["monster"]) for zone in Player.ZONES for card_data in player[zone]] + data["cache"]
+        size = max((card["uid"] for card in card_data), default=-1) + 1
+        card_health, card_owner = [None] * size, [None] * size
+        for card in card_data:
+            card_health[card["uid"]] = card["health"]
+            card_owner[card["uid"]] = card["owner"]
+
         # Create a new GameState instance with the rebuilt players
         gs = cls(
             hero=hero,
             monster=monster,
             turn_priority=data["turn_priority"],
             game_phase=data["game_phase"],
-            cache=cache
+            cache=cache,
+            card_health=card_health,
+            card_owner=card_owner
         )
         
         # Set any remaining attributes
@@ -161,5 +244,7 @@ class GameState:
         gs.winner = data["winner"]
         gs.card_played_this_turn = data["card_played_this_turn"]
         gs.short_card_played_this_turn = data["short_card_played_this_turn"]
+        gs.seed = data.get("seed", gs.seed)  # Older saves have no seed; they keep the fresh one from __init__
+        gs.draws = data.get("draws", 0)
         
         return gs
\ No newline at end of file
@@ -0,0 +1,178 @@
+import itertools
+import math
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from poker_monster.engine import num_actions, candidate_actions
+from poker_monster.actionClass import EndTurn, PlayFaceUp
+
+# Information-set Monte Carlo Tree Search (single-observer ISMCTS, Cowling et al. 2012).
+# Every iteration samples a determinization: a full game state consistent with what the observer can see, with the
+# hidden cards (opponent's hand, deck and face-down power cards, and the order of the observer's own deck) dealt
+# at random. One tree is shared by all determinizations; its edges are action ids, and since which actions are legal
+# depends on the deal, children are chosen by UCB over availability counts instead of parent visits.
+
+class Node:
+    __slots__ = ("parent", "action_id", "player", "children", "visits", "total", "available")
+
+    def __init__(self, parent=None, action_id=None, player=None):
+        self.parent = parent
+        self.action_id = action_id
+        self.player = player  # Who took action_id to get here; total is from their point of view
+        self.children = {}
+        self.visits = 0
+        self.total = 0.0
+        self.available = 0  # Iterations in which action_id was legal at the parent
+
+    def ucb(self, exploration):
+        return self.total / self.visits + exploration * math.sqrt(math.log(self.available) / self.visits)
+
+
+def legal_moves(gs):
+    """The legal (action_id, action_class) pairs of a state; legal_action_mask without the array."""
+    return [(action_id, action_class) for action_id, action_class in candidate_actions(gs) if action_class(gs, action_id).is_legal()[0]]
+
+def determinize(gs, observer, rng):
+    """
+    A copy of gs with everything the observer can't see re-dealt at random. Zone sizes stay the same, and cards on
+    the cache stay where they are, since a resolving card is still in its zone (e.g. the hand) until it finishes.
+    """
+    gs = gs.clone()
+    me, opp = (gs.hero, gs.monster) if observer == "hero" else (gs.monster, gs.hero)
+    pinned = {id(card) for card in gs.cache}
+    hidden_zones = (opp.hand, opp.deck, opp.power_cards)
+    free = [(zone, position) for zone in hidden_zones for position, card in enumerate(zone) if id(card) not in pinned]
+    cards = [zone[position] for zone, position in free]
+    rng.shuffle(cards)
+    for (zone, position), card in zip(free, cards):
+        zone[position] = card
+    free = [position for position, card in enumerate(me.deck) if id(card) not in pinned]
+    cards = [me.deck[position] for position in free]
+    rng.shuffle(cards)
+    for position, card in zip(free, cards):
+        me.deck[position] = card
+    gs.seed = rng.getrandbits(64)  # Future shuffles are hidden too: the real game's seed would give them away
+    return gs
+
+def random_rollout_action(gs, moves, rng):
+    return rng.choice(moves)[0]
+
+def heuristic_rollout_action(gs, moves, rng):
+    # Play face up when possible and only end the turn when there's nothing else to do; otherwise random
+    face_up = [action_id for action_id, action_class in moves if action_class is PlayFaceUp]
+    if face_up:
+        return face_up[0]
+    others = [action_id for action_id, action_class in moves if action_class is not EndTurn]
+    return rng.choice(others) if others else moves[0][0]
+
+ROLLOUT_POLICIES = {"random": random_rollout_action, "heuristic": heuristic_rollout_action}
+
+
+class MCTSAgent:
+    """
+    ISMCTS player. search() returns a visit-count policy over num_actions for the player to move; choose_action()
+    returns its most visited action. The budget is iterations and/or time_limit seconds, whichever runs out first;
+    with iterations=None the search runs until time_limit. With workers > 1 the search is root-parallel: each worker
+    process builds its own tree from a share of the iterations (for the whole time_limit) and the root visit counts
+    are summed. The pool is kept between calls; close() shuts it down.
+    """
+    def __init__(self, iterations=1000, time_limit=None, exploration=0.7, rollout="random", max_rollout_steps=400, workers=1, seed=None):
+        if rollout not in ROLLOUT_POLICIES:
+            raise ValueError(f"Unknown rollout policy: {rollout}")
+        if iterations is None and time_limit is None:
+            raise ValueError("MCTSAgent needs iterations, time_limit or both")
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.rollout = rollout
+        self.max_rollout_steps = max_rollout_steps  # Rollouts cut off here count as a tie
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self._pool = None
+
+    def search(self, gs, observer=None):
+        """Visit-count policy (float32, sums to 1) over num_actions for observer, by default the player to move."""
+        observer = observer or gs.turn_priority
+        if self.workers <= 1:
+            visits = _search(gs, observer, self.iterations, self.time_limit, self.exploration, self.rollout, self.max_rollout_steps, self.rng.getrandbits(64))
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.workers)
+            share = None if self.iterations is None else -(-self.iterations // self.workers)
+            tasks = [(gs, observer, share, self.time_limit, self.exploration, self.rollout, self.max_rollout_steps, self.rng.getrandbits(64)) for _ in range(self.workers)]
+            visits = np.sum(self._pool.starmap(_search, tasks), axis=0)
+        return (visits / max(visits.sum(), 1)).astype(np.float32)
+
+    def choose_action(self, gs):
+        return int(np.argmax(self.search(gs)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def _search(gs, observer, iterations, time_limit, exploration, rollout, max_rollout_steps, seed):
+    """One ISMCTS tree. Returns the root visit counts as a [num_actions] array. Module-level so it can run in a pool."""
+    rng = random.Random(seed)
+    rollout_action = ROLLOUT_POLICIES[rollout]
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    root = Node()
+
+    for iteration in (itertools.count() if iterations is None else range(iterations)):  # None: until the deadline
+        if deadline is not None and iteration and time.perf_counter() > deadline:
+            break
+        state = determinize(gs, observer, rng)
+        node = root
+
+        # Selection and expansion
+        while state.winner is None:
+            moves = legal_moves(state)
+            untried = [action_id for action_id, _ in moves if action_id not in node.children]
+            for action_id, _ in moves:
+                child = node.children.get(action_id)
+                if child is not None:
+                    child.available += 1
+            player = state.turn_priority
+            if untried:
+                action_id = rng.choice(untried)
+                child = Node(node, action_id, player)
+                child.available = 1
+                node.children[action_id] = child
+                node = child
+                _play(state, action_id, moves)
+                break
+            node = max((node.children[action_id] for action_id, _ in moves), key=lambda child: child.ucb(exploration))
+            _play(state, node.action_id, moves)
+
+        # Simulation
+        steps = 0
+        while state.winner is None and steps < max_rollout_steps:
+            moves = legal_moves(state)
+            _play(state, rollout_action(state, moves, rng), moves)
+            steps += 1
+
+        # Backpropagation
+        rewards = {"hero": 0.0, "monster": 0.0}
+        if state.winner in rewards:
+            rewards = {"hero": 1.0, "monster": -1.0} if state.winner == "hero" else {"hero": -1.0, "monster": 1.0}
+        while node is not root:
+            node.visits += 1
+            node.total += rewards[node.player]
+            node = node.parent
+        root.visits += 1
+
+    visits = np.zeros(num_actions, dtype=np.float64)
+    for action_id, child in root.children.items():
+        visits[action_id] = child.visits
+    return visits
+
+def _play(state, action_id, moves):
+    for move_id, action_class in moves:
+        if move_id == action_id:
+            action_class(state, action_id).enact()
+            return
@@ -1,4 +1,10 @@
+from poker_monster.cardClass import Card
+
 class Player:
+    __slots__ = ("name", "deck", "hand", "battlefield", "graveyard", "health", "power_cards", "power", "power_plays_left", "power_plays_made_this_turn",
+                 "last_stand_buff", "monsters_pawn_buff", "going_first", "player_type", "action_number")
+    ZONES = ("deck", "hand", "battlefield", "graveyard", "power_cards")
+
     def __init__(self, name, deck, player_type="computer_random"):
         # Initializes a player with a name and a deck of cards.
         self.name = name  # "hero " or "monster"
@@ -48,9 +54,9 @@ class Player:
                 card = self.deck.pop(0)
                 self.graveyard.append(card)
 
-    def shuffle(self):
-        from random import shuffle
-        shuffle(self.deck)
+    def shuffle(self, rng):
+        # rng is the game's generator for this event (GameState.rng()), never the global one
+        rng.shuffle(self.deck)
 
     def discard(self, card):
         self.hand.remove(card)
@@ -99,7 +105,30 @@ class Player:
             card.effect(gs)
         self.graveyard.append(card)
 
-    def to_dict(self):
+    def clone(self):
+        # Fast copy for search: scalars are copied as-is and the zone lists are copied, but not the cards in them.
+        # Cards never change (their health and owner live in the GameState), so clones share them.
+        player = object.__new__(Player)
+        for attribute in Player.__slots__:
+            setattr(player, attribute, getattr(self, attribute))
+        for zone in Player.ZONES:
+            setattr(player, zone, getattr(self, zone)[:])
+        return player
+
+    def snapshot(self):
+        # Everything needed to put this player back exactly as it is now (see restore). Cards are shared, not copied.
+        # The zone lists are kept along with their contents, since actions both mutate them and replace them.
+        return [getattr(self, attribute) for attribute in Player.__slots__], [getattr(self, zone)[:] for zone in Player.ZONES]
+
+    def restore(self, snapshot):
+        state, contents = snapshot
+        for attribute, value in zip(Player.__slots__, state):
+            setattr(self, attribute, value)
+        for zone, cards in zip(Player.ZONES, contents):
+            getattr(self, zone)[:] = cards
+
+    def to_dict(self, gs):
+        # gs holds the cards' health and owners
         return {
             "name": self.name,
             "health": self.health,
@@ -113,11 +142,11 @@ class Player:
             "action_number": self.action_number,
             
             # Create a list of nested card dictionaries for each card zone
-            "hand": [card.to_dict() for card in self.hand],
-            "deck": [card.to_dict() for card in self.deck],
-            "battlefield": [long_card.to_dict() for long_card in self.battlefield],
-            "graveyard": [card.to_dict() for card in self.graveyard],
-            "power_cards": [power_card.to_dict() for power_card in self.power_cards],
+            "hand": [card.to_dict(gs) for card in self.hand],
+            "deck": [card.to_dict(gs) for card in self.deck],
+            "battlefield": [long_card.to_dict(gs) for long_card in self.battlefield],
+            "graveyard": [card.to_dict(gs) for card in self.graveyard],
+            "power_cards": [power_card.to_dict(gs) for power_card in self.power_cards],
         }
 
     @classmethod
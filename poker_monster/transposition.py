@@ -0,0 +1,125 @@
+import random
+from operator import attrgetter
+
+from poker_monster.engine import num_cards, num_game_phases
+
+# Zobrist hashing: every (card, place) and (feature, value) pair gets a fixed random 64-bit key, and a state's hash is
+# the XOR of the keys of everything that is true of it. The keys come from a fixed seed, so hashes are stable across
+# runs and processes and can be stored. Decks and the cache are ordered (position is part of the key); the other
+# zones are sets, so two states that differ only in the order cards were put into a hand or graveyard hash the same.
+
+_rng = random.Random(0x5EED)
+def _key():
+    return _rng.getrandbits(64)
+
+PLAYERS = ("hero", "monster")
+# Scalar keys are looked up with the raw value as a list index, so negative values wrap around (-1 is index
+# VALUE_RANGE - 1). Any value in [-VALUE_RANGE, VALUE_RANGE) gets its own key; health, power etc. stay far inside that.
+VALUE_RANGE = 128
+PLAYER_FEATURES = ("health", "power", "power_plays_left", "power_plays_made_this_turn", "last_stand_buff", "monsters_pawn_buff", "going_first")
+
+DECK_KEYS = [[[_key() for _ in range(num_cards)] for _ in range(num_cards)] for _ in PLAYERS]  # [player][position][uid]
+ZONE_KEYS = [[[_key() for _ in range(num_cards)] for _ in range(4)] for _ in PLAYERS]  # [player][hand/battlefield/graveyard/power_cards][uid]
+CACHE_KEYS = [[_key() for _ in range(num_cards)] for _ in range(num_cards)]  # [position][uid]
+HEALTH_KEYS = [[_key() for _ in range(VALUE_RANGE)] for _ in range(num_cards)]  # [uid][health]
+PLAYER_KEYS = [[[_key() for _ in range(VALUE_RANGE)] for _ in PLAYER_FEATURES] for _ in PLAYERS]  # [player][feature][value]
+PHASE_KEYS = [_key() for _ in range(num_game_phases)]
+MONSTER_TO_PLAY_KEY = _key()
+CARD_PLAYED_KEY = _key()
+SHORT_CARD_PLAYED_KEY = _key()
+FIRST_TURN_KEY = _key()  # Turn 0 is special (the first player gains no power); later turn numbers don't change the game
+WINNER_KEYS = {winner: _key() for winner in ("hero", "monster", "tie")}
+del _rng
+
+_player_features = attrgetter(*PLAYER_FEATURES)
+
+def zobrist_hash(gs):
+    """The 64-bit (unsigned) Zobrist hash of a GameState. One pass over the cards, no text."""
+    # Card owners aren't hashed: no rule reads them, and a stolen card's new owner is the player holding it
+    h = PHASE_KEYS[gs.phase_id]
+    if gs.turn_priority == "monster":
+        h ^= MONSTER_TO_PLAY_KEY
+    if gs.card_played_this_turn:
+        h ^= CARD_PLAYED_KEY
+    if gs.short_card_played_this_turn:
+        h ^= SHORT_CARD_PLAYED_KEY
+    if gs.turn_number == 0:
+        h ^= FIRST_TURN_KEY
+    if gs.winner:
+        h ^= WINNER_KEYS[gs.winner]
+    for position_keys, card in zip(CACHE_KEYS, gs.cache):
+        if card is not None:  # Noble Sacrifice can cache None
+            h ^= position_keys[card.uid]
+
+    for player, player_keys, deck_keys, zone_keys in zip((gs.hero, gs.monster), PLAYER_KEYS, DECK_KEYS, ZONE_KEYS):
+        for value_keys, value in zip(player_keys, _player_features(player)):
+            h ^= value_keys[value]
+        for position_keys, card in zip(deck_keys, player.deck):
+            h ^= position_keys[card.uid]
+        for keys, zone in zip(zone_keys, (player.hand, player.battlefield, player.graveyard, player.power_cards)):
+            for card in zone:
+                h ^= keys[card.uid]
+        for card in player.battlefield:  # Health only changes on the battlefield; it is reset when a long card dies
+            h ^= HEALTH_KEYS[card.uid][gs.card_health[card.uid]]
+    return h
+
+
+class TranspositionTable:
+    """
+    A fixed-size hash table from Zobrist hash to any value (search statistics, a graph node id, ...).
+    Each hash maps to one slot (hash % capacity), so memory never grows. On a collision the new entry replaces the old
+    one if the old one is from an earlier generation (see new_generation) or was stored with no greater depth, so
+    deep, expensive results survive cheap ones within a search and stale ones are recycled in the next.
+    """
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._depths = [0] * capacity
+        self._generations = [0] * capacity
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0  # A different state's entry was replaced
+        self.rejected = 0  # A store lost to a deeper entry of the same generation
+
+    def __len__(self):
+        return self.capacity - self._keys.count(None)
+
+    def __contains__(self, key):
+        return self._keys[key % self.capacity] == key
+
+    def get(self, key, default=None):
+        slot = key % self.capacity
+        if self._keys[slot] == key:
+            self.hits += 1
+            return self._values[slot]
+        self.misses += 1
+        return default
+
+    def store(self, key, value, depth=0):
+        """Stores value under key unless the slot holds a deeper entry of the current generation. Returns whether it was stored."""
+        slot = key % self.capacity
+        old_key = self._keys[slot]
+        if old_key is not None and old_key != key:
+            if self._generations[slot] == self.generation and self._depths[slot] > depth:
+                self.rejected += 1
+                return False
+            self.overwrites += 1
+        self._keys[slot] = key
+        self._values[slot] = value
+        self._depths[slot] = depth
+        self._generations[slot] = self.generation
+        return True
+
+    def new_generation(self):
+        # Call between searches: older entries stay readable but any new entry may replace them
+        self.generation += 1
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "overwrites": self.overwrites, "rejected": self.rejected}
@@ -0,0 +1,106 @@
+import random
+
+import numpy as np
+import torch
+
+from poker_monster.engine import GameEngine, OBS_SIZE, num_actions, encode_observation, legal_action_mask
+
+PLAYERS = ("hero", "monster")  # Column order of the reward arrays; also the values of to_play (0 = hero, 1 = monster)
+
+class VecGameEngine:
+    """
+    B independent games stepped in lock-step, for learned policies. Each game is a normal GameEngine; this class
+    only batches the interface. Observations, masks and rewards are written into preallocated arrays every step, and
+    with as_tensor=True they come back as torch tensors sharing that memory, so feeding a network costs no copy.
+    The arrays are overwritten by the next step; copy anything you keep.
+
+    Finished games are reset automatically: step() reports the finished game's rewards and done=True, and the
+    observation in that row is already the first state of the next game.
+    Observations are from the point of view of the player to move (see encode_observation).
+    """
+    def __init__(self, num_envs, hide_hidden=False, as_tensor=False, max_steps=None):
+        self.num_envs = num_envs
+        self.hide_hidden = hide_hidden
+        self.as_tensor = as_tensor
+        self.max_steps = max_steps  # Games longer than this are cut off as a tie (None = no limit)
+        self.num_actions = num_actions
+        self.engines = [GameEngine() for _ in range(num_envs)]
+
+        self._obs = np.zeros((num_envs, OBS_SIZE), dtype=np.float32)
+        self._masks = np.zeros((num_envs, num_actions), dtype=bool)
+        self._rewards = np.zeros((num_envs, len(PLAYERS)), dtype=np.float32)
+        self._dones = np.zeros(num_envs, dtype=bool)
+        self._to_play = np.zeros(num_envs, dtype=np.int64)
+        self.lengths = np.zeros(num_envs, dtype=np.int64)  # Actions taken in each current game
+        self.games_finished = 0
+        self._seeds = random.Random()  # Seeds every game, including the auto-resets; reset(seed) makes the whole run reproducible
+
+    def _out(self, array):
+        return torch.from_numpy(array) if self.as_tensor else array
+
+    def _reset_env(self, i):
+        self.engines[i].reset(seed=self._seeds.getrandbits(64))
+        self.lengths[i] = 0
+        self._refresh(i)
+
+    def _refresh(self, i):
+        gs = self.engines[i].gs
+        encode_observation(gs, None, self.hide_hidden, out=self._obs[i])
+        self._masks[i] = legal_action_mask(gs)
+        self._to_play[i] = gs.turn_priority == "monster"
+
+    def reset(self, seed=None):
+        """Starts all B games from scratch. Returns (observations, legal_masks)."""
+        self._seeds = random.Random(seed)
+        for i in range(self.num_envs):
+            self._reset_env(i)
+        self._rewards[:] = 0.0
+        self._dones[:] = False
+        return self.observations(), self.legal_masks()
+
+    def step(self, actions):
+        """
+        Plays actions[i] in game i. actions is any length-B sequence of action ids (list, numpy array or tensor) and
+        must be legal under legal_masks(); otherwise ValueError is raised before any game is stepped.
+        Returns (observations, rewards [B, 2], dones [B], legal_masks).
+        Rewards are nonzero only on the step that ends a game, with columns in PLAYERS order.
+        """
+        if isinstance(actions, torch.Tensor):
+            actions = actions.detach().cpu().numpy()
+        actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+        # Checked before anything is played, so a bad batch leaves every game (and its length) as it was
+        in_range = (actions >= 0) & (actions < self.num_actions)
+        legal = in_range.copy()
+        legal[in_range] = self._masks[np.flatnonzero(in_range), actions[in_range]]
+        if not legal.all():
+            illegal = np.flatnonzero(~legal).tolist()
+            raise ValueError(f"Illegal actions in games {illegal}: {actions[illegal].tolist()}")
+        actions = actions.tolist()
+        self._rewards[:] = 0.0
+        self._dones[:] = False
+        for i, engine in enumerate(self.engines):
+            engine.iterate(actions[i])
+            self.lengths[i] += 1
+            results = engine.get_results()
+            if results is None and self.max_steps is not None and self.lengths[i] >= self.max_steps:
+                results = {"hero": 0.0, "monster": 0.0}
+            if results is None:
+                self._refresh(i)
+                continue
+            self._rewards[i] = (results["hero"], results["monster"])
+            self._dones[i] = True
+            self.games_finished += 1
+            self._reset_env(i)
+        return self.observations(), self._out(self._rewards), self._out(self._dones), self.legal_masks()
+
+    def observations(self):
+        """[B, OBS_SIZE] float32 observations of the current states."""
+        return self._out(self._obs)
+
+    def legal_masks(self):
+        """[B, num_actions] boolean legal-action masks of the current states."""
+        return self._out(self._masks)
+
+    def to_play(self):
+        """[B] index into PLAYERS of the player to move in each game."""
+        return self._out(self._to_play)
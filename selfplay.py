@@ -0,0 +1,260 @@
+"""
+Headless self-play: plays many games of Poker Monster across a process pool and streams the results back.
+
+    python selfplay.py --games 1000 --workers 8
+    python selfplay.py --games 200 --hero scripted --monster random --db selfplay.db
+    python selfplay.py --games 400 --scaling
+
+Policies are given as specs: "random", "scripted", "mcts[:<iterations>]" or "llm:<model name>" (e.g. "llm:gpt-4o-mini").
+Every game is seeded with seed + game_index, so a run's results don't depend on the number of workers or on
+which worker played which game. Only the parent process writes to the graph database.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+
+from poker_monster.engine import GameEngine, ACTION_MAP
+from poker_monster.actionClass import TargetHero, TargetMonster, PlayFaceUp, PlayFaceDown, EndTurn, SelectFromHand, PHASE_HAND_FULL_DISCARDING_CARD
+
+logger = logging.getLogger("SelfPlay")
+
+MAX_STEPS = 5000  # Safety cap on actions per game; a game cut off here has no winner
+
+
+@dataclass
+class StepRecord:
+    agent: str  # Whose action it was
+    action_id: int
+    action_str: str = None  # The action's line from display_actions (record_text only)
+    src_text: str = None  # display_gamestate before and after the action (record_text only)
+    dst_text: str = None
+    dst_agent: str = None
+
+
+@dataclass
+class GameResult:
+    game_index: int
+    seed: int
+    winner: str  # "hero", "monster", "tie", or None if the game hit MAX_STEPS
+    rewards: dict
+    length: int  # Number of actions taken
+    seconds: float
+    steps: List[StepRecord] = field(default_factory=list)
+
+
+# --- POLICIES ---
+
+class RandomPolicy:
+    """Uniformly random legal action."""
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose(self, engine):
+        return self.rng.choice(engine.get_legal_actions())
+
+
+class ScriptedPolicy:
+    """
+    A fixed rule of thumb, as a baseline that beats random: play cards face up when possible, otherwise build power,
+    aim damage at the opponent (and Fold at yourself), and end the turn only when nothing else is left.
+    """
+    PREFERENCE = {PlayFaceUp: 0, SelectFromHand: 1, PlayFaceDown: 2, EndTurn: 9}
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose(self, engine):
+        gs = engine.gs
+        # One legality pass; a legal id's class is the one the action map gives it in this phase
+        options = [(action_id, ACTION_MAP[action_id][gs.phase_id]) for action_id in np.flatnonzero(engine.legal_action_mask()).tolist()]
+        targets = {action_class: action_id for action_id, action_class in options if action_class in (TargetHero, TargetMonster)}
+        if targets:
+            helps_target = gs.cache[0].name == "Fold"
+            own, other = (TargetHero, TargetMonster) if gs.turn_priority == "hero" else (TargetMonster, TargetHero)
+            return targets.get(own if helps_target else other, next(iter(targets.values())))
+        # Play the most expensive card first, but when the hand is full throw away the cheapest
+        best = min(self.PREFERENCE.get(action_class, 5) for _, action_class in options)
+        choices = [action_id for action_id, action_class in options if self.PREFERENCE.get(action_class, 5) == best]
+        if best == self.PREFERENCE[SelectFromHand]:
+            pick = min if gs.game_phase == PHASE_HAND_FULL_DISCARDING_CARD else max
+            return pick(choices, key=lambda action_id: next(card.power_cost for card in gs.me.hand if card.uid == action_id))
+        return self.rng.choice(choices)
+
+
+class LLMPolicy:
+    """Asks the Thinker for a recommendation, falling back to a random legal action if the model picks an illegal one."""
+    MAX_TRIES = 3
+
+    def __init__(self, rng, model_name):
+        from llmClass import OpenAILLM
+        from Thinker import Thinker
+        self.rng = rng
+        llm = OpenAILLM(model_name)
+        llm.load()
+        self.thinker = Thinker(llm, None)
+
+    def choose(self, engine):
+        legal = engine.get_legal_actions()
+        gamestate_text, actions_text = engine.get_display_text()
+        for _ in range(self.MAX_TRIES):
+            try:
+                action_id, _, _ = self.thinker.recommend_action(gamestate_text, actions_text)
+            except Exception as e:  # invoke() returns None on API errors, which json can't parse
+                logger.warning(f"LLM policy error: {e}")
+                continue
+            if action_id in legal:
+                return action_id
+        return self.rng.choice(legal)
+
+
+class MCTSPolicy:
+    """ISMCTS search (see poker_monster.mcts) with a fixed iteration budget per move."""
+    def __init__(self, rng, iterations):
+        from poker_monster.mcts import MCTSAgent
+        self.agent = MCTSAgent(iterations=iterations, seed=rng.getrandbits(64))
+
+    def choose(self, engine):
+        return self.agent.choose_action(engine.gs)
+
+
+_LLM_POLICIES = {}  # One LLM client per worker process and model, created on first use
+
+def make_policy(spec, rng):
+    """Builds a policy from its spec: "random", "scripted", "mcts[:<iterations>]" or "llm:<model name>"."""
+    if spec == "random":
+        return RandomPolicy(rng)
+    if spec == "scripted":
+        return ScriptedPolicy(rng)
+    if spec == "mcts" or spec.startswith("mcts:"):
+        _, _, iterations = spec.partition(":")
+        return MCTSPolicy(rng, int(iterations or 200))
+    if spec.startswith("llm:"):
+        policy = _LLM_POLICIES.get(spec)
+        if policy is None:
+            policy = _LLM_POLICIES[spec] = LLMPolicy(rng, spec[len("llm:"):])
+        policy.rng = rng
+        return policy
+    raise ValueError(f"Unknown policy: {spec}")
+
+
+# --- PLAYING ---
+
+def play_game(game_index, seed, hero_spec="random", monster_spec="random", record_steps=False, record_text=False):
+    """Plays one game to the end. Deterministic for a given seed and pair of (non-LLM) policies."""
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    policies = {"hero": make_policy(hero_spec, rng), "monster": make_policy(monster_spec, rng)}
+    engine = GameEngine()
+    engine.reset(seed=seed)
+
+    steps = []
+    length = 0
+    while engine.get_results() is None and length < MAX_STEPS:
+        agent = engine.gs.turn_priority
+        if record_text:
+            src_text, actions_text = engine.get_display_text()
+        action_id = policies[agent].choose(engine)
+        engine.iterate(action_id)
+        length += 1
+        if record_text:
+            dst_text, _ = engine.get_display_text()
+            steps.append(StepRecord(agent, action_id, engine.get_action_text(actions_text, action_id), src_text, dst_text, engine.gs.turn_priority))
+        elif record_steps:
+            steps.append(StepRecord(agent, action_id))
+
+    return GameResult(game_index, seed, engine.gs.winner, engine.get_results(), length, time.perf_counter() - start, steps)
+
+
+def _play_task(task):
+    return play_game(*task)
+
+
+def run_selfplay(num_games, workers=None, hero="random", monster="random", seed=0, record_steps=False, record_text=False, chunksize=None):
+    """
+    Plays num_games games on a pool of workers (default: one per core) and yields a GameResult for each as it finishes,
+    in completion order. workers=1 plays in this process, which is easier to debug.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(game_index, seed + game_index, hero, monster, record_steps, record_text) for game_index in range(num_games)]
+    if workers == 1:
+        for task in tasks:
+            yield _play_task(task)
+        return
+    # Several games per task keep the pickling overhead down; small enough chunks keep results streaming
+    chunksize = chunksize or max(1, min(32, num_games // (workers * 8)))
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(_play_task, tasks, chunksize=chunksize)
+
+
+def record_to_graph(graph, result):
+    """Writes one game (played with record_text) to a KnowledgeGraph as a sequence of steps."""
+    from graph import StepInfo
+    graph.start_new_sequence()
+    for step in result.steps:
+        graph.record_step(StepInfo(src_agent_id=step.agent, dst_agent_id=step.dst_agent, src_id=step.src_text, dst_id=step.dst_text, action_str=step.action_str))
+    graph.finalize_sequence(result.rewards or {"hero": 0.0, "monster": 0.0})
+
+
+def scaling_report(num_games, hero, monster, seed, max_workers=None):
+    """Prints games/sec for 1, 2, 4, ... workers up to the number of cores."""
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)})
+    print(f"{'workers':>8} {'games/sec':>10} {'speedup':>8}")
+    base = None
+    for workers in counts:
+        start = time.perf_counter()
+        for _ in run_selfplay(num_games, workers, hero, monster, seed):
+            pass
+        rate = num_games / (time.perf_counter() - start)
+        base = base or rate
+        print(f"{workers:>8} {rate:>10.1f} {rate / base:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core).")
+    parser.add_argument("--hero", default="random", help='Hero policy: "random", "scripted", "mcts[:<iterations>]" or "llm:<model>".')
+    parser.add_argument("--monster", default="random", help="Monster policy, same choices as --hero.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=None, help="Record every game into this graph database.")
+    parser.add_argument("--scaling", action="store_true", help="Report games/sec across worker counts instead of a normal run.")
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling_report(args.games, args.hero, args.monster, args.seed, args.workers)
+        return
+
+    graph = None
+    if args.db:
+        from graph import KnowledgeGraph
+        graph = KnowledgeGraph(db_path=args.db, buffered=True, durability="normal", defer_finalize=True)
+
+    wins = {}
+    total_length = 0
+    start = time.perf_counter()
+    for done, result in enumerate(run_selfplay(args.games, args.workers, args.hero, args.monster, args.seed, record_text=graph is not None), start=1):
+        wins[result.winner] = wins.get(result.winner, 0) + 1
+        total_length += result.length
+        if graph is not None:
+            record_to_graph(graph, result)
+        if done % max(1, args.games // 10) == 0:
+            logger.info(f"{done}/{args.games} games, {done / (time.perf_counter() - start):.1f} games/sec")
+    if graph is not None:
+        graph.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:.1f} games/sec), mean length {total_length / max(args.games, 1):.1f} actions")
+    print("Results: " + ", ".join(f"{winner}: {count}" for winner, count in sorted(wins.items(), key=lambda item: str(item[0]))))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from benchmarks.llm_stub_server import start_stub_server
+from dispatcherClass import LLMDispatcher, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from llmClass import OpenAILLM
+from Thinker import ProblemDescription
+
+
+class RaisingLLM(OpenAILLM):
+    """Raises for the prompt "raise" instead of answering."""
+    async def ainvoke(self, prompt, *args, **kwargs):
+        if prompt == "raise":
+            raise RuntimeError("boom")
+        return await super().ainvoke(prompt, *args, **kwargs)
+
+
+@pytest.fixture
+def server():
+    server = start_stub_server(latency=0.2)
+    yield server
+    server.shutdown()
+
+
+def make_dispatcher(llm_class, base_url, max_concurrency=1):
+    dispatcher = LLMDispatcher(llm_class("stub", api_key="stub", base_url=base_url), max_concurrency=max_concurrency)
+    assert dispatcher.load()
+    return dispatcher
+
+
+def test_higher_priority_runs_first(server):
+    dispatcher = make_dispatcher(OpenAILLM, server.base_url)
+    finished = []
+
+    async def request(name, priority):
+        await dispatcher.ainvoke(name, response_format=ProblemDescription, priority=priority)
+        finished.append(name)
+
+    async def run():
+        blocker = asyncio.ensure_future(request("blocker", PRIORITY_HIGH))
+        await asyncio.sleep(0.1)  # The only worker is busy with the blocker while the rest queue up
+        await asyncio.gather(blocker, request("low", PRIORITY_LOW), request("normal", PRIORITY_NORMAL), request("high", PRIORITY_HIGH))
+
+    asyncio.run(run())
+    assert finished == ["blocker", "high", "normal", "low"]
+    metrics = dispatcher.metrics()
+    assert {name: counts["completed"] for name, counts in metrics["priorities"].items()} == {"high": 2, "normal": 1, "low": 1}
+    assert metrics["max_queue_depth"] == 3
+    assert metrics["queue_depth"] == 0 and metrics["in_flight"] == 0
+    dispatcher.close()
+
+
+def test_errors_resolve_the_future(server):
+    dispatcher = make_dispatcher(RaisingLLM, server.base_url, max_concurrency=2)
+    with pytest.raises(RuntimeError, match="boom"):
+        dispatcher.invoke("raise", response_format=ProblemDescription, timeout=5)
+    assert isinstance(dispatcher.invoke("fine", response_format=ProblemDescription, timeout=5), str)  # The worker survived
+    normal = dispatcher.metrics()["priorities"]["normal"]  # ProblemDescription's default priority
+    assert (normal["completed"], normal["errors"]) == (1, 1)
+    dispatcher.close()
+
+
+def test_close_resolves_queued_requests(server):
+    dispatcher = make_dispatcher(OpenAILLM, server.base_url)
+    outcomes = []
+
+    def request():
+        try:
+            outcomes.append(dispatcher.invoke("queued", response_format=ProblemDescription, timeout=10))
+        except concurrent.futures.CancelledError:
+            outcomes.append("cancelled")
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    dispatcher.close()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert outcomes == ["cancelled"] * 4
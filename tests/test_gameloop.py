@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+
+from gameloop import play_game
+from graph import KnowledgeGraph
+from llmClass import MockLLM
+from Thinker import Thinker
+from poker_monster.engine import GameEngine
+
+
+class RandomEmbedder:
+    def __init__(self, dim=384):
+        self.rng = np.random.default_rng(0)
+        self.dim = dim
+
+    def encode(self, inputs):
+        vectors = self.rng.standard_normal((len(inputs), self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_play_game_records_and_finalizes_every_step(tmp_path):
+    # Failed calls fall back to random moves, so the game still finishes
+    llm = MockLLM(failure_rate=0.2, seed=0)
+    llm.load()
+    kg = KnowledgeGraph(db_path=tmp_path / "loop.db")
+    engine = GameEngine()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        steps = play_game(engine, Thinker(llm, kg), loop, embedder=RandomEmbedder(), graph=kg, thinker_agents=("hero", "monster"), seed=0, max_steps=400)
+    finally:
+        loop.close()
+    assert steps > 0
+    assert llm.failures > 0
+    recorded = kg.conn.execute("SELECT COUNT(*) FROM steps").fetchone()[0]
+    assert steps <= recorded < 2 * steps  # One row per action, plus one per verified expectation
+    assert kg.conn.execute("SELECT outcome FROM sequences").fetchone()[0] is not None
+    kg.close()
@@ -0,0 +1,21 @@
+import gc
+import weakref
+
+import graph
+from graph import KnowledgeGraph
+
+
+def test_unclosed_graph_can_be_collected(tmp_path):
+    kg = KnowledgeGraph(db_path=tmp_path / "gc.db")
+    ref = weakref.ref(kg)
+    assert kg in graph._open_graphs
+    del kg
+    gc.collect()
+    assert ref() is None
+
+
+def test_close_forgets_the_graph(tmp_path):
+    kg = KnowledgeGraph(db_path=tmp_path / "close.db")
+    kg.close()
+    assert kg not in graph._open_graphs
+    kg.close()  # Safe to call twice
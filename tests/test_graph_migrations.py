@@ -0,0 +1,65 @@
+import sqlite3
+
+import graph
+from graph import KnowledgeGraph, state_id
+
+
+def make_v2_db(path):
+    """A database at schema version 2 (text state ids), with rows whose state ids are NULL like the shipped graph.db."""
+    conn = sqlite3.connect(path)
+    graph._migration_1_base_tables(conn)
+    graph._migration_2_indexes(conn)
+    conn.execute("PRAGMA user_version = 2")
+    conn.execute("INSERT INTO sequences (sequence_id) VALUES ('seq')")
+    conn.executemany("INSERT INTO nodes (agent_id, id) VALUES (?, ?)", [("hero", "state A"), ("monster", "state B"), ("hero", None)])
+    conn.executemany("INSERT INTO edges (agent_id, src_id, dst_id, action_str) VALUES (?, ?, ?, ?)",
+                     [("hero", "state A", "state B", "[1] EndTurn"), ("monster", "state B", None, "[2] EndTurn")])
+    conn.executemany("INSERT INTO steps (sequence_id, step_num, src_id, dst_id, action_str, src_agent_id) VALUES (?, ?, ?, ?, ?, ?)",
+                     [("seq", 0, "state A", "state B", "[1] EndTurn", "hero"), ("seq", 1, "state B", None, "[2] EndTurn", "monster")])
+    conn.commit()
+    conn.close()
+
+
+def test_migrating_v2_with_null_state_ids(tmp_path):
+    path = tmp_path / "v2.db"
+    make_v2_db(path)
+    kg = KnowledgeGraph(db_path=path)
+    assert kg.conn.execute("PRAGMA user_version").fetchone()[0] == graph.SCHEMA_VERSION
+    steps = kg.conn.execute("SELECT src_id, dst_id FROM steps ORDER BY step_num").fetchall()
+    assert [tuple(row) for row in steps] == [(state_id("state A"), state_id("state B")), (state_id("state B"), None)]
+    edges = kg.conn.execute("SELECT src_id, dst_id FROM edges ORDER BY action_str").fetchall()
+    assert [tuple(row) for row in edges] == [(state_id("state A"), state_id("state B")), (state_id("state B"), None)]
+    assert kg.get_state_text(state_id("state A")) == "state A"
+    assert kg.conn.execute("SELECT COUNT(*) FROM states").fetchone()[0] == 2
+    kg.close()
+
+
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    path = tmp_path / "v2.db"
+    make_v2_db(path)
+
+    def failing_migration_3(conn):
+        graph._migration_3_intern_states(conn)  # Creates the states table and rebuilds the others, then fails
+        raise RuntimeError("migration failed")
+    migrations = list(graph.MIGRATIONS)
+    migrations[2] = failing_migration_3
+    monkeypatch.setattr(graph, "MIGRATIONS", migrations)
+    try:
+        KnowledgeGraph(db_path=path)
+    except RuntimeError as e:
+        assert str(e) == "migration failed"
+    else:
+        raise AssertionError("the migration should have failed")
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'states'").fetchone() is None
+    assert conn.execute("SELECT src_id FROM steps WHERE step_num = 0").fetchone()[0] == "state A"
+    conn.close()
+
+    # The database is untouched, so the real migration can run on a retry
+    monkeypatch.undo()
+    kg = KnowledgeGraph(db_path=path)
+    assert kg.conn.execute("PRAGMA user_version").fetchone()[0] == graph.SCHEMA_VERSION
+    kg.close()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from graph import KnowledgeGraph, StepInfo
+
+
+def unit(i, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_batch_search_merges_agents_by_score(tmp_path):
+    kg = KnowledgeGraph(db_path=tmp_path / "search.db")
+    kg.start_new_sequence()
+    kg.record_step(StepInfo("hero", "monster", "state 0", "state 1", "[0] EndTurn", "hero-far", unit(0), "r", "e", True))
+    kg.record_step(StepInfo("monster", "hero", "state 1", "state 2", "[0] EndTurn", "monster-close", unit(1), "r", "e", True))
+    kg.finalize_sequence({"hero": 1.0, "monster": 0.0})
+
+    # Fewer hits than limit in total: they still come back best-first
+    query = StepInfo("hero", description_embedding=unit(1))
+    results = kg.find_similar_problems_batch([query], limit=5, agent_ids=[["hero", "monster"]])
+    assert [hit["problem_description"] for hit in results[0]] == ["monster-close", "hero-far"]
+    results = kg.find_similar_problems_batch([query], limit=1, agent_ids=[["hero", "monster"]])
+    assert [hit["problem_description"] for hit in results[0]] == ["monster-close"]
+    kg.close()
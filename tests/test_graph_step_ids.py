@@ -0,0 +1,21 @@
+from graph import KnowledgeGraph, StepInfo
+
+
+def record(kg, n):
+    kg.start_new_sequence()
+    return [kg.record_step(StepInfo("hero", "monster", f"state {i}", f"state {i + 1}", f"[{i}] EndTurn")) for i in range(n)]
+
+
+def test_two_handles_get_distinct_step_ids(tmp_path):
+    for buffered in (False, True):
+        path = tmp_path / f"shared-{buffered}.db"
+        first = KnowledgeGraph(db_path=path, buffered=buffered, flush_size=4)
+        second = KnowledgeGraph(db_path=path, buffered=buffered, flush_size=4)
+        ids = record(first, 3) + record(second, 6) + record(first, 5)
+        first.close()
+        second.close()
+        assert len(set(ids)) == len(ids)
+
+        kg = KnowledgeGraph(db_path=path)
+        assert sorted(row[0] for row in kg.conn.execute("SELECT id FROM steps")) == sorted(ids)
+        kg.close()
@@ -0,0 +1,29 @@
+import random
+
+from selfplay import ScriptedPolicy
+from poker_monster.engine import GameEngine
+from poker_monster.actionClass import PHASE_HAND_FULL_DISCARDING_CARD
+
+
+def test_scripted_policy_is_legal_and_discards_the_cheapest_card():
+    policy = ScriptedPolicy(random.Random(0))
+    rng = random.Random(0)
+    engine = GameEngine()
+    discards = 0
+    for seed in range(50):
+        engine.reset(seed=seed)
+        while engine.get_results() is None:
+            gs = engine.gs
+            legal = engine.get_legal_actions()
+            action_id = policy.choose(engine)
+            assert action_id in legal
+            if gs.game_phase == PHASE_HAND_FULL_DISCARDING_CARD:
+                costs = {card.uid: card.power_cost for card in gs.me.hand if card.uid in legal}
+                if costs:
+                    assert costs[action_id] == min(costs.values())
+                    discards += 1
+            # Random moves in between reach a full hand far more often than the policy's own play
+            engine.iterate(rng.choice(legal))
+        if discards >= 5:
+            break
+    assert discards > 0
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from poker_monster.vec_engine import VecGameEngine
+
+
+def test_illegal_action_raises_without_stepping():
+    envs = VecGameEngine(3)
+    _, masks = envs.reset(seed=0)
+    legal = [int(np.flatnonzero(mask)[0]) for mask in masks]
+    before = envs.observations().copy()
+    for bad in (int(np.flatnonzero(~masks[1])[0]), -1, envs.num_actions):
+        with pytest.raises(ValueError):
+            envs.step([legal[0], bad, legal[2]])
+        assert envs.lengths.tolist() == [0, 0, 0]
+        assert np.array_equal(envs.observations(), before)
+    envs.step(legal)
+    assert envs.lengths.tolist() == [1, 1, 1]